@@ -0,0 +1,239 @@
+"""
+Vectorized batch evaluation of many combat positions at once (NumPy).
+
+`evaluate` runs the same decision pipeline as `strategy.combat` — threat
+prediction, upgrade ROI check, defensive armor, target_score ranking and
+troop allocation — over arrays shaped (games,) and (games, enemies), for
+simulation and replay workloads where a Python loop per turn is too slow.
+Decisions match the scalar path exactly (see test_bot.test_batch_matches_scalar).
+
+Inputs are padded to the widest lobby; `present` marks real enemy slots.
+Per-game memory (activity, aggression, alliances, the observed threat
+from memory.threat) is passed in as arrays, so evaluation has no side
+effects. `pack` builds the arrays from
+scalar-style rows; `actions` turns one row of the result back into the
+action list `strategy.combat` would return.
+
+Parameters come from a `config.StrategyConfig` (default: the shipped
+one), so a variant can be evaluated before it is rolled out.
+Opponent profiles (profiles.py) are not modelled: the scalar path matches
+when KW_PROFILE_PATH is unset. Requires numpy (requirements-dev.txt); the
+server never imports this.
+
+Run: python batch.py --positions 100000
+"""
+
+import argparse
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+import economy
+from config import DEFAULT, StrategyConfig
+from economy import FATIGUE_TURN, MAX_LEVEL
+
+# Level-indexed economy tables (index 0 unused)
+_RES = np.array(economy.RES_PER_TURN, dtype=np.int64)
+_UPG = np.array(economy.UPG_COST, dtype=np.int64)
+_FATIGUE = np.array(economy.FATIGUE, dtype=np.int64)
+
+
+def _res(level: np.ndarray) -> np.ndarray:
+    """economy.res_per_turn over an array: the table, and the formula beyond it."""
+    inside = (level > 0) & (level <= MAX_LEVEL + 1)
+    formula = np.round(20 * 1.5 ** (level - 1.0)).astype(np.int64)
+    return np.where(inside, _RES[np.clip(level, 0, MAX_LEVEL + 1)], formula)
+
+
+class Positions(NamedTuple):
+    turn: np.ndarray       # (G,) int
+    hp: np.ndarray         # (G,) int
+    armor: np.ndarray      # (G,) int
+    res: np.ndarray        # (G,) int
+    level: np.ndarray      # (G,) int
+    e_id: np.ndarray       # (G, E) int   enemy playerId
+    e_hp: np.ndarray       # (G, E) int
+    e_armor: np.ndarray    # (G, E) int
+    e_level: np.ndarray    # (G, E) int
+    present: np.ndarray    # (G, E) bool  real (not padding) slot
+    active: np.ndarray     # (G, E) bool  memory.is_active
+    agg: np.ndarray        # (G, E) int   memory.aggression
+    hostile: np.ndarray    # (G, E) bool  declared attackTargetId == us
+    coordinated: np.ndarray  # (G, E) bool an ally asked us to hit them
+    our_ally: np.ndarray   # (G, E) bool  we proposed peace to them
+    observed: Optional[np.ndarray] = None  # (G,) float memory.threat (None = no observations)
+
+
+class Decisions(NamedTuple):
+    predicted_dmg: np.ndarray  # (G,) float
+    upgrade: np.ndarray        # (G,) bool
+    armor: np.ndarray          # (G,) int (0 = no armor action)
+    score: np.ndarray          # (G, E) target_score at ranking time (-inf for dead/padding)
+    order: np.ndarray          # (G, E) enemy slots by descending score (stable)
+    troops: np.ndarray         # (G, E) troops sent per enemy slot (0 = no attack)
+    attack_rank: np.ndarray    # (G, E) order the attacks were issued (-1 = none)
+
+
+def evaluate(p: Positions, cfg: StrategyConfig = DEFAULT) -> Decisions:
+    G, E = p.e_hp.shape
+    alive = p.present & (p.e_hp > 0)
+    n_alive = alive.sum(axis=1)
+    playing = (n_alive > 0) & (p.hp > 0) & (p.res > 0)
+
+    # 1. Threat prediction (top 2)
+    t = (_res(p.e_level) * cfg.stash) * cfg.stash_share * (1.0 + p.e_level * cfg.level_bonus)
+    t = np.where(p.active, t, t * cfg.afk_threat)
+    t = np.where(p.hostile, t * cfg.hostile_threat, t)
+    t = np.where(alive, t, 0.0)
+    top2 = -np.partition(-t, min(1, E - 1), axis=1)[:, :2] if E else np.zeros((G, 2))
+    predicted = top2[:, 0] + (top2[:, 1] if E > 1 else 0.0)
+    if cfg.observed_threat and p.observed is not None:
+        predicted = np.maximum(predicted, p.observed * cfg.observed_threat)
+    predicted = predicted * cfg.threat_margin
+
+    # 2. Upgrade: early rush or ROI before fatigue
+    lvl = p.level
+    can_level = lvl < MAX_LEVEL
+    cost = _UPG[np.minimum(lvl, MAX_LEVEL)]
+    gain = _RES[np.clip(lvl + 1, 1, MAX_LEVEL + 1)] - _RES[np.clip(lvl, 0, MAX_LEVEL + 1)]
+    remaining = np.maximum(1, cfg.roi_horizon - p.turn)
+    rush = (p.turn <= cfg.rush_turn) & (p.res >= cost)
+    roi = ((p.turn < cfg.roi_last_turn) & (cost / np.maximum(gain, 1) < remaining * cfg.roi_factor)
+           & ((p.hp + p.armor - predicted) > cfg.roi_hp_margin))
+    upgrade = playing & can_level & (rush | roi) & (p.res >= cost)
+    avail = p.res - np.where(upgrade, cost, 0)
+
+    # 3. Defensive armor
+    fatigue = np.where(p.turn <= economy.TABLE_TURNS, _FATIGUE[np.clip(p.turn, 0, economy.TABLE_TURNS)],
+                       5 * (p.turn - FATIGUE_TURN))
+    hp_after = (p.hp + p.armor) - (predicted + fatigue)
+    want = playing & (hp_after < cfg.armor_floor) & (avail > 0)
+    bid = np.minimum(avail, np.maximum(0, np.trunc(cfg.armor_target - hp_after).astype(np.int64)))
+    armor = np.where(want & (bid > 0), bid, 0)
+    avail = avail - armor
+
+    # 4. Target scoring (kill bonus depends on troops left at ranking time)
+    eff = p.e_hp + p.e_armor
+    base = (cfg.w_coordinated * p.coordinated + cfg.w_ally * p.our_ally + cfg.w_afk * ~p.active
+            + p.e_level * cfg.w_level + p.agg * cfg.w_aggression)
+    score = np.where(alive, base + cfg.w_kill * (eff <= avail[:, None]), -np.inf)
+    order = np.argsort(-score, axis=1, kind="stable")
+
+    # Allocation: same sequential rules as the scalar loop, vectorized over games
+    troops = np.zeros((G, E), dtype=np.int64)
+    rank = np.full((G, E), -1, dtype=np.int64)
+    attacked = np.zeros(G, dtype=np.int64)
+    done = ~playing
+    rows = np.arange(G)
+    for k in range(E):
+        slot = order[:, k]
+        done |= (avail <= 0) | (attacked >= 2) | ~alive[rows, slot]
+        t_eff = eff[rows, slot]
+        priority = base[rows, slot] + cfg.w_kill * (t_eff <= avail)
+        go = ~done & ~((priority < cfg.skip_below) & (n_alive > 1))
+        x = np.where(t_eff <= avail, t_eff,
+                     np.where(priority > cfg.commit_priority,
+                              np.floor(avail * cfg.commit_share).astype(np.int64), avail))
+        x = np.maximum(1, np.minimum(x, avail))
+        x = np.where(go, x, 0)
+        troops[rows, slot] = x
+        rank[rows, slot] = np.where(go, attacked, -1)
+        avail = avail - x
+        attacked = attacked + go
+
+    return Decisions(predicted, upgrade, armor, score, order, troops, rank)
+
+
+# ─── Packing helpers ─────────────────────────────────────────────────
+
+def pack(rows: Iterable[Dict]) -> Positions:
+    """Build Positions from scalar-style rows.
+
+    Each row: {"turn", "player", "enemies", "diplomacy", "intel", "our_allies"}
+    where intel is {pid: (is_active, aggression)} as from memory.enemy_intel,
+    plus an optional "observed" (memory.threat, default 0).
+    """
+    rows = list(rows)
+    G = len(rows)
+    E = max((len(r["enemies"]) for r in rows), default=0)
+    z = lambda dtype=np.int64: np.zeros((G, E), dtype=dtype)
+    e_id, e_hp, e_armor, e_level, agg = z(), z(), z(), z(), z()
+    present, active, hostile, coord, ally = z(bool), z(bool), z(bool), z(bool), z(bool)
+    scal = np.zeros((5, G), dtype=np.int64)
+    observed = np.array([float(r.get("observed", 0.0)) for r in rows])
+    for g, r in enumerate(rows):
+        me = r["player"]
+        my_id = me["playerId"]
+        scal[:, g] = (r["turn"], me["hp"], me["armor"], me["resources"], me["level"])
+        declared = {d["playerId"] for d in r["diplomacy"]
+                    if (d.get("action", {}) or {}).get("attackTargetId") == my_id}
+        asked = {int(d["action"]["attackTargetId"]) for d in r["diplomacy"]
+                 if (d.get("action", {}) or {}).get("allyId") == my_id
+                 and d["action"].get("attackTargetId")}
+        for i, e in enumerate(r["enemies"]):
+            pid = e["playerId"]
+            e_id[g, i], e_hp[g, i], e_armor[g, i], e_level[g, i] = pid, e["hp"], e["armor"], e["level"]
+            present[g, i] = True
+            is_active, aggression = r["intel"].get(pid, (r["turn"] <= 3, 0))
+            active[g, i], agg[g, i] = is_active, aggression
+            hostile[g, i] = pid in declared
+            coord[g, i] = pid in asked
+            ally[g, i] = pid in r["our_allies"]
+    return Positions(*scal, e_id, e_hp, e_armor, e_level, present, active, agg, hostile, coord, ally,
+                     observed)
+
+
+def actions(p: Positions, d: Decisions, g: int) -> List[Dict]:
+    """Row `g` as the action list strategy.combat would return."""
+    out: List[Dict] = []
+    if d.upgrade[g]: out.append({"type": "upgrade"})
+    if d.armor[g]: out.append({"type": "armor", "amount": int(d.armor[g])})
+    issued = np.flatnonzero(d.attack_rank[g] >= 0)
+    for slot in issued[np.argsort(d.attack_rank[g, issued])]:
+        out.append({"type": "attack", "targetId": int(p.e_id[g, slot]), "troopCount": int(d.troops[g, slot])})
+    return out
+
+
+# ─── Benchmark ───────────────────────────────────────────────────────
+
+def random_rows(n: int, max_enemies: int = 7, seed: int = 0) -> List[Dict]:
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(n):
+        k = int(rng.integers(1, max_enemies + 1))
+        ids = list(range(2, k + 2))
+        rows.append({
+            "turn": int(rng.integers(1, 40)),
+            "player": {"playerId": 1, "hp": int(rng.integers(1, 101)), "armor": int(rng.integers(0, 30)),
+                       "resources": int(rng.integers(0, 300)), "level": int(rng.integers(1, 6))},
+            "enemies": [{"playerId": i, "hp": int(rng.integers(0, 101)), "armor": int(rng.integers(0, 30)),
+                         "level": int(rng.integers(1, 6))} for i in ids],
+            "diplomacy": [{"playerId": i, "action": {"allyId": int(rng.choice([1] + ids)),
+                                                     "attackTargetId": int(rng.choice([1] + ids))}}
+                          for i in ids if rng.random() < 0.5],
+            "intel": {i: (bool(rng.random() < 0.7), int(rng.integers(0, 200))) for i in ids},
+            "our_allies": {i for i in ids if rng.random() < 0.3},
+        })
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--positions", type=int, default=100_000)
+    ap.add_argument("--enemies", type=int, default=7)
+    args = ap.parse_args()
+
+    rows = random_rows(args.positions, args.enemies)
+    t0 = time.perf_counter()
+    p = pack(rows)
+    t1 = time.perf_counter()
+    evaluate(p)
+    t2 = time.perf_counter()
+    print(f"positions: {args.positions} (up to {args.enemies} enemies)")
+    print(f"pack:      {t1 - t0:.2f}s")
+    print(f"evaluate:  {t2 - t1:.3f}s ({(t2 - t1) / args.positions * 1e6:.2f}us/position)")
+
+
+if __name__ == "__main__":
+    main()
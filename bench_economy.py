@@ -0,0 +1,112 @@
+"""
+Microbenchmark: precomputed economy tables vs the float-power formulas.
+
+Times res_per_turn / upg_cost / fatigue_damage per call, strategy.combat
+per request (4- and 8-player lobbies, each call a new turn so its intel is
+ingested) and single-process simulated games, once with the formulas
+patched back in (payback_turns included) and once with the economy tables.
+
+Run: python bench_economy.py [--iters 20000] [--games 300]
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+import economy
+import search
+import simulator
+import strategy
+from bench_request_path import make_payloads, plays
+from models import CombatRequest
+
+
+def _payback_formula(level: int) -> float:
+    gain = economy._res_formula(level + 1) - economy._res_formula(level)
+    return economy._upg_formula(level) / gain if 0 < level <= economy.MAX_LEVEL else float("inf")
+
+
+_FORMULAS = {"res_per_turn": economy._res_formula, "upg_cost": economy._upg_formula,
+             "fatigue_damage": economy._fatigue_formula, "payback_turns": _payback_formula}
+
+
+@contextlib.contextmanager
+def formulas():
+    """Temporarily route every caller back to the uncached formulas."""
+    saved = [(m, n, getattr(m, n)) for m in (strategy, search, simulator) for n in _FORMULAS
+             if hasattr(m, n)]
+    for m, n, _ in saved:
+        setattr(m, n, _FORMULAS[n])
+    try:
+        yield
+    finally:
+        for m, n, fn in saved:
+            setattr(m, n, fn)
+
+
+def best_of(fn, iters: int) -> float:
+    """Best-of-3 mean microseconds per call of fn()."""
+    best = float("inf")
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(3):
+            t0 = time.perf_counter()
+            for _ in range(iters):
+                fn()
+            best = min(best, (time.perf_counter() - t0) / iters * 1e6)
+    return best
+
+
+def calls(res, upg, fat):
+    def run():
+        for level in (1, 2, 3, 4, 5):
+            res(level); upg(level)
+        for turn in (10, 30, 50):
+            fat(turn)
+    return run
+
+
+def combat_request(players: int, iters: int):
+    req = CombatRequest.model_validate_json(make_payloads(players)[1])
+    turns = iter(plays(3 * iters))  # best_of makes 3 * iters calls
+    def run():
+        gid, turn = next(turns)
+        strategy.combat(gid=gid, turn=turn, player=req.playerTower,
+                        enemies=req.enemyTowers, diplomacy=req.diplomacy,
+                        previous_attacks=req.previousAttacks)
+    return run
+
+
+def games_per_second(games: int) -> float:
+    simulator._init_worker()
+    t0 = time.perf_counter()
+    simulator.run_chunk(0, games, 4, ["random", "aggressor", "economist", "diplomat"], 0)
+    return games / (time.perf_counter() - t0)
+
+
+def row(name: str, old: float, new: float, unit: str = "us"):
+    print(f"{name:<24} {old:>10.2f} {new:>10.2f} {unit:<8} {(old - new) / old:>+6.0%}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--iters", type=int, default=20000)
+    ap.add_argument("--games", type=int, default=300)
+    args = ap.parse_args()
+
+    print(f"{'':<24} {'formula':>10} {'table':>10} {'':<8} {'saved':>6}")
+    row("13 economy calls", best_of(calls(economy._res_formula, economy._upg_formula,
+                                          economy._fatigue_formula), args.iters),
+        best_of(calls(economy.res_per_turn, economy.upg_cost, economy.fatigue_damage), args.iters))
+    for players in (4, 8):
+        with formulas():
+            old = best_of(combat_request(players, args.iters), args.iters)
+        row(f"combat, {players} players", old, best_of(combat_request(players, args.iters), args.iters))
+    with formulas():
+        old = games_per_second(args.games)
+    new = games_per_second(args.games)
+    print(f"{'simulated games (4p)':<24} {old:>10.1f} {new:>10.1f} {'games/s':<8} {(new - old) / old:>+6.0%}")
+
+
+if __name__ == "__main__":
+    main()
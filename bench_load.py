@@ -0,0 +1,299 @@
+"""
+HTTP load test against `server:app` with a local game-server stand-in.
+
+Starts the bot under uvicorn, then plays many concurrent games against it
+over real HTTP (stdlib asyncio, one keep-alive connection per game). Each
+game follows the simulator rules: the bot's seat is driven through
+/negotiate -> /combat every turn, the other seats are simulator bots, and
+previousAttacks/combatActions carry the real attacks of the last turn.
+
+Reports throughput, p50/p99/p999 latency per endpoint and error rate for
+every (router workers, lobby size) combination, plus the latency of a
+/healthz probe sent every 10 ms alongside the games (how long the event
+loop is blocked by strategy work; compare `--executor inline` with
+`--executor offload` under `KW_SEARCH_MS`). `--save` writes the results
+as a baseline; `--compare` checks a run against one and exits non-zero on
+a regression (throughput -10%, p99 +10%, or more errors).
+
+Run: python bench_load.py --workers 0,2 --players 4,8 --games 64 --turns 30
+     KW_SEARCH_MS=50 python bench_load.py --executor offload --workers 2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import metrics
+import simulator
+from economy import fatigue_damage, res_per_turn
+
+REGRESSION = 0.10
+
+
+# ─── HTTP client ─────────────────────────────────────────────────────
+
+class Connection:
+    """Minimal HTTP/1.1 keep-alive client for JSON POSTs."""
+
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def post(self, path: str, payload) -> Tuple[int, bytes]:
+        return await self.request("POST", path, json.dumps(payload, separators=(",", ":")).encode())
+
+    async def request(self, method: str, path: str, body: bytes = b"") -> Tuple[int, bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        return status, await self.reader.readexactly(length)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+# ─── Game-server stand-in ────────────────────────────────────────────
+
+async def play(conn: Connection, gid: int, players: int, turns: int, seed: int,
+               latency: Dict[str, metrics.Histogram], counts: Dict[str, int]):
+    """One game: simulator rules, our seat served over HTTP."""
+    rng = random.Random(seed)
+    names = [n for n in simulator.OPPONENTS if n != "passive"]
+    towers = {pid: {"playerId": pid, "hp": simulator.START_HP, "armor": 0, "resources": 0, "level": 1}
+              for pid in range(1, players + 1)}
+    bots = {pid: simulator.OPPONENTS[rng.choice(names)](rng) for pid in range(2, players + 1)}
+    prev_attacks: List[Dict] = []
+
+    async def call(path: str, payload) -> List[Dict]:
+        t0 = time.perf_counter()
+        try:
+            status, body = await conn.post(path, payload)
+            out = json.loads(body) if status == 200 else None
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            conn.close()
+            status, out = 0, None
+        latency[path].record(time.perf_counter() - t0)
+        counts["requests"] += 1
+        if not isinstance(out, list):
+            counts["errors"] += 1
+            return []
+        return out
+
+    for turn in range(1, turns + 1):
+        alive = [pid for pid, t in towers.items() if t["hp"] > 0]
+        if simulator.OUR_ID not in alive or len(alive) <= 1:
+            break
+        alive_ids = set(alive)
+        for pid in alive:
+            towers[pid]["resources"] += res_per_turn(towers[pid]["level"])
+
+        def view(pid, **extra):
+            enemies = [{k: towers[o][k] for k in ("playerId", "hp", "armor", "level")}
+                       for o in alive if o != pid]
+            return {"gameId": gid, "turn": turn, "playerTower": dict(towers[pid]),
+                    "enemyTowers": enemies, **extra}
+
+        diplomacy = []
+        for pid in alive:
+            if pid == simulator.OUR_ID:
+                proposals = await call("/negotiate", view(pid, combatActions=prev_attacks))
+            else:
+                proposals = bots[pid].negotiate(gid, view(pid, combatActions=prev_attacks))
+            for p in (proposals or [])[:2]:
+                diplomacy.append({"playerId": pid, "action": dict(p)})
+
+        orders = {}
+        for pid in alive:
+            v = view(pid, diplomacy=diplomacy, previousAttacks=prev_attacks)
+            orders[pid] = (await call("/combat", v)) if pid == simulator.OUR_ID else bots[pid].combat(gid, v)
+        prev_attacks = []
+        for pid in alive:
+            for a in simulator._spend(towers[pid], orders[pid], alive_ids):
+                prev_attacks.append({"playerId": pid, "action": {
+                    "targetId": a["targetId"], "troopCount": a["troopCount"]}})
+        for pa in prev_attacks:
+            simulator._hit(towers[pa["action"]["targetId"]], pa["action"]["troopCount"])
+        for pid in alive:
+            simulator._hit(towers[pid], fatigue_damage(turn))
+
+
+async def _client(port: int, first_gid: int, games: int, players: int, turns: int,
+                  seed: int, deadline: float) -> dict:
+    latency = {p: metrics.Histogram() for p in ("/negotiate", "/combat", "/healthz")}
+    counts = {"requests": 0, "errors": 0}
+    gid = first_gid
+
+    async def probe():
+        # Event-loop responsiveness: a trivial endpoint polled during the load
+        conn = Connection("127.0.0.1", port)
+        try:
+            while time.time() < deadline:
+                t0 = time.perf_counter()
+                await conn.request("GET", "/healthz")
+                latency["/healthz"].record(time.perf_counter() - t0)
+                await asyncio.sleep(0.01)
+        finally:
+            conn.close()
+
+    async def lane():
+        # Each lane keeps one game in flight, starting new games until the deadline
+        nonlocal gid
+        conn = Connection("127.0.0.1", port)
+        try:
+            while time.time() < deadline:
+                gid += 1
+                await play(conn, gid, players, turns, seed + gid, latency, counts)
+        finally:
+            conn.close()
+
+    await asyncio.gather(probe(), *(lane() for _ in range(games)))
+    return {**counts, "latency": {p: h.to_state() for p, h in latency.items()}}
+
+
+def run_client(*args) -> dict:
+    return asyncio.run(_client(*args))
+
+
+# ─── Server under test ───────────────────────────────────────────────
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, workers: int, executor: str = None) -> subprocess.Popen:
+    env = {**os.environ, "KW_ROUTER_WORKERS": str(workers), "KW_LOG_LEVEL": "WARNING"}
+    if executor:
+        env["KW_EXECUTOR"] = executor
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", "1", "--log-level", "warning", "--no-access-log"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        cwd=os.path.dirname(os.path.abspath(__file__)))
+    for _ in range(200):
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1).read()
+            return proc
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError("server exited during startup")
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("server did not become healthy")
+
+
+def run_case(workers: int, players: int, games: int, turns: int, seconds: float,
+             clients: int, seed: int, executor: str = None) -> dict:
+    port = _free_port()
+    server = start_server(port, workers, executor)
+    try:
+        deadline = time.time() + seconds
+        per = [games // clients + (i < games % clients) for i in range(clients)]
+        jobs = [(port, i * 1_000_000, n, players, turns, seed, deadline) for i, n in enumerate(per) if n]
+        t0 = time.perf_counter()
+        with ProcessPoolExecutor(len(jobs)) as pool:
+            parts = list(pool.map(run_client, *zip(*jobs)))
+        elapsed = time.perf_counter() - t0
+    finally:
+        server.terminate()
+        server.wait(10)
+
+    requests = sum(p["requests"] for p in parts)
+    result = {"workers": workers, "players": players, "games_in_flight": games,
+              "requests": requests, "rps": requests / elapsed,
+              "error_rate": sum(p["errors"] for p in parts) / max(1, requests), "endpoints": {}}
+    for path in ("/negotiate", "/combat", "/healthz"):
+        h = metrics.Histogram()
+        for p in parts:
+            h.merge(metrics.Histogram.from_state(p["latency"][path]))
+        result["endpoints"][path] = {f"p{q * 100:g}_ms": round(h.quantile(q) * 1000, 3)
+                                     for q in (0.5, 0.99, 0.999)}
+    return result
+
+
+def compare(results: List[dict], baseline: List[dict]) -> List[str]:
+    """Regressions of `results` against `baseline` (matched by workers/players)."""
+    old = {(b["workers"], b["players"]): b for b in baseline}
+    problems = []
+    for r in results:
+        b = old.get((r["workers"], r["players"]))
+        if b is None:
+            continue
+        case = f"workers={r['workers']} players={r['players']}"
+        if r["rps"] < b["rps"] * (1 - REGRESSION):
+            problems.append(f"{case}: throughput {b['rps']:.0f} -> {r['rps']:.0f} req/s")
+        if r["error_rate"] > b["error_rate"]:
+            problems.append(f"{case}: error rate {b['error_rate']:.2%} -> {r['error_rate']:.2%}")
+        for path, q in r["endpoints"].items():
+            was = b["endpoints"].get(path, {}).get("p99_ms")
+            if was and q["p99_ms"] > was * (1 + REGRESSION):
+                problems.append(f"{case} {path}: p99 {was:.2f} -> {q['p99_ms']:.2f} ms")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--workers", default="0,2", help="KW_ROUTER_WORKERS values (0 = inline)")
+    ap.add_argument("--executor", help="KW_EXECUTOR for the server (default: server's own)")
+    ap.add_argument("--players", default="4,8", help="lobby sizes")
+    ap.add_argument("--games", type=int, default=64, help="concurrent games")
+    ap.add_argument("--turns", type=int, default=30, help="max turns per game")
+    ap.add_argument("--seconds", type=float, default=10.0, help="duration per case")
+    ap.add_argument("--clients", type=int, default=2, help="load-generator processes")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--save", help="write results to this baseline file")
+    ap.add_argument("--compare", help="baseline file to check for regressions")
+    args = ap.parse_args()
+
+    results = []
+    print(f"{'workers':>7} {'players':>7} {'req/s':>8} {'errors':>7}  "
+          f"{'combat p50/p99/p999 ms':>24}  {'negotiate p50/p99/p999 ms':>26}  {'healthz p99 ms':>14}")
+    for workers in map(int, args.workers.split(",")):
+        for players in map(int, args.players.split(",")):
+            r = run_case(workers, players, args.games, args.turns, args.seconds, args.clients, args.seed,
+                         args.executor)
+            results.append(r)
+            c, n = r["endpoints"]["/combat"], r["endpoints"]["/negotiate"]
+            print(f"{workers:>7} {players:>7} {r['rps']:>8.0f} {r['error_rate']:>7.2%}  "
+                  f"{c['p50_ms']:>7.2f} {c['p99_ms']:>7.2f} {c['p99.9_ms']:>8.2f}  "
+                  f"{n['p50_ms']:>8.2f} {n['p99_ms']:>7.2f} {n['p99.9_ms']:>8.2f}  "
+                  f"{r['endpoints']['/healthz']['p99_ms']:>14.2f}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            problems = compare(results, json.load(f))
+        for p in problems:
+            print(f"REGRESSION {p}")
+        sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
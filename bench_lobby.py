@@ -0,0 +1,58 @@
+"""
+Microbenchmark: negotiate + combat latency as the lobby grows.
+
+Runs the strategy on validated request models for lobbies of 2 to 1000
+towers (every enemy attacking and proposing an alliance each turn) and
+reports microseconds per turn and per enemy. Per-enemy cost should stay
+flat: every step is one pass or a partial selection over the enemies.
+Every iteration plays the next turn of a game (bench_request_path.plays),
+so each turn's intel is ingested rather than skipped as a retry.
+
+Run: python bench_lobby.py [--iters 2000]
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+import kwlog
+import strategy
+from bench_request_path import make_payloads, plays
+from models import CombatRequest, NegotiateRequest
+
+
+def bench(players: int, iters: int) -> float:
+    """Best-of-3 mean microseconds per negotiate+combat pair."""
+    neg_body, com_body = make_payloads(players)
+    neg = NegotiateRequest.model_validate_json(neg_body)
+    com = CombatRequest.model_validate_json(com_body)
+    best = float("inf")
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(3):
+            turns = plays(iters)
+            t0 = time.perf_counter()
+            for gid, turn in turns:
+                strategy.negotiate(gid=gid, turn=turn, player=neg.playerTower,
+                                   enemies=neg.enemyTowers, combat_actions=neg.combatActions)
+                strategy.combat(gid=gid, turn=turn, player=com.playerTower,
+                                enemies=com.enemyTowers, diplomacy=com.diplomacy,
+                                previous_attacks=com.previousAttacks)
+            best = min(best, (time.perf_counter() - t0) / iters * 1e6)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--iters", type=int, default=2000, help="turns per lobby size (scaled down for big lobbies)")
+    args = ap.parse_args()
+
+    kwlog.set_level(kwlog.logging.WARNING)  # per-attack logs are not under test
+    print(f"{'players':>7} {'us/turn':>10} {'us/enemy':>9}")
+    for players in (2, 4, 8, 32, 128, 512, 1000):
+        us = bench(players, max(20, args.iters * 8 // players))
+        print(f"{players:>7} {us:>10.1f} {us / (players - 1):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
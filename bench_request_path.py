@@ -0,0 +1,112 @@
+"""
+Microbenchmark: per-request CPU of the server's strategy call path.
+
+Compares the old path (validate -> model_dump() every tower/action -> strategy)
+with the zero-copy path (validate -> strategy reads the models directly) for
+2-, 4- and 8-player games. Parsing/validation is included in both so the
+numbers are what a request costs end to end, minus HTTP. Every iteration
+plays the next turn of a game (see `plays`), so each request's intel is
+ingested as it is on the server.
+
+Run: python bench_request_path.py [--iters 20000]
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import random
+import time
+from typing import List, Tuple
+
+from models import NegotiateRequest, CombatRequest
+import strategy
+
+GAME_TURNS = 20  # turns each benchmark game plays before the next gameId starts
+_gids = itertools.count(1)
+
+
+def make_payloads(players: int, seed: int = 0):
+    """Realistic mid-game negotiate/combat bodies for a lobby of `players`."""
+    r = random.Random(seed)
+    ids = list(range(1, players + 1))
+    towers = [{"playerId": i, "hp": r.randint(30, 100), "armor": r.randint(0, 20),
+               "level": r.randint(1, 4)} for i in ids[1:]]
+    me = {"playerId": 1, "hp": 80, "armor": 5, "resources": 120, "level": 3}
+    attacks = [{"playerId": i, "action": {"targetId": r.choice(ids), "troopCount": r.randint(5, 40)}}
+               for i in ids[1:]]
+    diplomacy = [{"playerId": i, "action": {"allyId": r.choice(ids), "attackTargetId": r.choice(ids)}}
+                 for i in ids[1:]]
+    negotiate = {"gameId": 1, "turn": 12, "playerTower": me, "enemyTowers": towers,
+                 "combatActions": attacks}
+    combat = {"gameId": 1, "turn": 12, "playerTower": me, "enemyTowers": towers,
+              "diplomacy": diplomacy, "previousAttacks": attacks}
+    return json.dumps(negotiate).encode(), json.dumps(combat).encode()
+
+
+def plays(iters: int) -> List[Tuple[int, int]]:
+    """(gameId, turn) for each iteration, never repeated within a process.
+
+    A repeated (gameId, turn) is taken for a retry and its intel is not
+    ingested again, so each iteration plays the next turn of a game.
+    """
+    out: List[Tuple[int, int]] = []
+    while len(out) < iters:
+        gid = next(_gids)
+        out += [(gid, turn) for turn in range(1, GAME_TURNS + 1)]
+    return out[:iters]
+
+
+def legacy_path(neg_body: bytes, com_body: bytes, gid: int, turn: int):
+    req = NegotiateRequest.model_validate(json.loads(neg_body))
+    strategy.negotiate(gid=gid, turn=turn,
+                       player=req.playerTower.model_dump(),
+                       enemies=[e.model_dump() for e in req.enemyTowers],
+                       combat_actions=[a.model_dump() for a in req.combatActions])
+    req = CombatRequest.model_validate(json.loads(com_body))
+    strategy.combat(gid=gid, turn=turn,
+                    player=req.playerTower.model_dump(),
+                    enemies=[e.model_dump() for e in req.enemyTowers],
+                    diplomacy=[d.model_dump() for d in req.diplomacy],
+                    previous_attacks=[p.model_dump() for p in req.previousAttacks])
+
+
+def direct_path(neg_body: bytes, com_body: bytes, gid: int, turn: int):
+    req = NegotiateRequest.model_validate(json.loads(neg_body))
+    strategy.negotiate(gid=gid, turn=turn, player=req.playerTower,
+                       enemies=req.enemyTowers, combat_actions=req.combatActions)
+    req = CombatRequest.model_validate(json.loads(com_body))
+    strategy.combat(gid=gid, turn=turn, player=req.playerTower,
+                    enemies=req.enemyTowers, diplomacy=req.diplomacy,
+                    previous_attacks=req.previousAttacks)
+
+
+def bench(fn, bodies, iters: int) -> float:
+    """Best-of-3 mean microseconds per negotiate+combat pair."""
+    best = float("inf")
+    with contextlib.redirect_stdout(io.StringIO()):  # strategy logs are not under test
+        for _ in range(3):
+            turns = plays(iters)
+            t0 = time.perf_counter()
+            for gid, turn in turns:
+                fn(*bodies, gid, turn)
+            best = min(best, (time.perf_counter() - t0) / iters * 1e6)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--iters", type=int, default=20000)
+    args = ap.parse_args()
+
+    print(f"{'players':>7} {'model_dump us':>14} {'direct us':>10} {'saved':>7}")
+    for players in (2, 4, 8):
+        bodies = make_payloads(players)
+        old = bench(legacy_path, bodies, args.iters)
+        new = bench(direct_path, bodies, args.iters)
+        print(f"{players:>7} {old:>14.1f} {new:>10.1f} {(old - new) / old:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Microbenchmark: serving overhead of the legacy FastAPI stack vs the lean path.
+
+Legacy: typed body params (json.loads + python-mode validation), list
+results through jsonable_encoder + JSONResponse, and two
+`@app.middleware("http")` wrappers. Lean (server.app): model_validate_json
+on the raw body, orjson-encoded bytes, one plain ASGI middleware.
+
+Both apps call the same strategy inline and are driven with direct ASGI
+calls (no sockets), so the difference is the framework path only.
+
+Run: python bench_serving.py [--iters 5000]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+from time import perf_counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+import kwlog
+import metrics
+import server
+import strategy
+import warmup
+from bench_request_path import make_payloads
+from models import CombatRequest, NegotiateRequest
+
+
+def legacy_app() -> FastAPI:
+    """The serving stack before the lean path (same endpoints and strategy)."""
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def kw_log(request: Request, call_next):
+        print("[KW-BOT] Mega ogudor", flush=True)
+        start = request.scope["kw_start"] = perf_counter()
+        response = await call_next(request)
+        path = request.url.path
+        if path in server.GAME_ENDPOINTS:
+            metrics.observe(f"endpoint:{path}", perf_counter() - start)
+            metrics.incr(f"requests:{path}")
+        return response
+
+    @app.middleware("http")
+    async def error_handler(request: Request, call_next):
+        try:
+            return await call_next(request)
+        except Exception:
+            return JSONResponse(content=[], status_code=200)
+
+    @app.post("/negotiate")
+    async def negotiate(req: NegotiateRequest, request: Request):
+        metrics.lap("phase:parse", request.scope.get("kw_start", perf_counter()))
+        return strategy.negotiate(gid=req.gameId, turn=req.turn, player=req.playerTower,
+                                  enemies=req.enemyTowers, combat_actions=req.combatActions)
+
+    @app.post("/combat")
+    async def combat(req: CombatRequest, request: Request):
+        metrics.lap("phase:parse", request.scope.get("kw_start", perf_counter()))
+        return strategy.combat(gid=req.gameId, turn=req.turn, player=req.playerTower,
+                               enemies=req.enemyTowers, diplomacy=req.diplomacy,
+                               previous_attacks=req.previousAttacks)
+
+    return app
+
+
+async def post(app, path: str, body: bytes) -> bytes:
+    """One request through the ASGI app; returns the response body."""
+    return (await warmup.request(app, path, body))[1]
+
+
+async def bench(app, bodies, iters: int) -> float:
+    """Best-of-3 mean microseconds per negotiate+combat pair."""
+    neg, com = bodies
+    best = float("inf")
+    for _ in range(3):
+        t0 = time.perf_counter()
+        for _ in range(iters):
+            await post(app, "/negotiate", neg)
+            await post(app, "/combat", com)
+        best = min(best, (time.perf_counter() - t0) / iters * 1e6)
+    return best
+
+
+async def run(iters: int):
+    legacy = legacy_app()
+    print(f"{'players':>7} {'legacy us':>10} {'lean us':>8} {'saved':>7}")
+    for players in (2, 4, 8, 32):
+        bodies = make_payloads(players)
+        assert await post(legacy, "/combat", bodies[1]) == await post(server.app, "/combat", bodies[1])
+        old = await bench(legacy, bodies, iters)
+        new = await bench(server.app, bodies, iters)
+        print(f"{players:>7} {old:>10.1f} {new:>8.1f} {(old - new) / old:>7.0%}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--iters", type=int, default=5000)
+    args = ap.parse_args()
+
+    kwlog.set_level(kwlog.logging.WARNING)
+    with contextlib.redirect_stdout(io.StringIO()) as quiet:  # the marker print is not under test
+        asyncio.run(run(args.iters))
+    print("\n".join(l for l in quiet.getvalue().splitlines() if not l.startswith("[KW-BOT]")))
+
+
+if __name__ == "__main__":
+    main()
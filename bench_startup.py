@@ -0,0 +1,123 @@
+"""
+Startup benchmark: time-to-first-response and first-request latency.
+
+Starts `server:app` under uvicorn, polls /healthz every 5 ms until it
+answers 200 (ready), then plays one game over a keep-alive connection.
+Reports, as medians over --runs fresh processes:
+
+    ready      process spawn -> /healthz 200
+    ttfr       process spawn -> first /negotiate answered
+    first      latency of the first /negotiate and /combat
+    steady     median latency of the next --turns turns
+
+for each case with the startup warm-up off (KW_WARMUP=0) and on.
+
+Run: python bench_startup.py [--runs 5] [--turns 20]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from bench_request_path import make_payloads
+
+CASES = {
+    "inline": {},
+    "inline rollout": {"KW_PLANNER": "rollout", "KW_SEARCH_MS": "20"},
+    "router x2": {"KW_ROUTER_WORKERS": "2"},
+    "offload x2 rollout": {"KW_ROUTER_WORKERS": "2", "KW_EXECUTOR": "offload",
+                           "KW_PLANNER": "rollout", "KW_SEARCH_MS": "20"},
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _post(conn: http.client.HTTPConnection, path: str, body: bytes) -> float:
+    t0 = time.perf_counter()
+    conn.request("POST", path, body, {"Content-Type": "application/json"})
+    resp = conn.getresponse()
+    resp.read()
+    if resp.status != 200:
+        raise RuntimeError(f"{path} answered {resp.status}")
+    return (time.perf_counter() - t0) * 1e3
+
+
+def _turn(players: int, gid: int, seed: int):
+    neg, com = (json.loads(b) for b in make_payloads(players, seed))
+    neg["gameId"] = com["gameId"] = gid
+    return json.dumps(neg).encode(), json.dumps(com).encode()
+
+
+def run_once(env: Dict[str, str], players: int, turns: int) -> Dict[str, float]:
+    port = _free_port()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", "1", "--log-level", "warning", "--no-access-log"],
+        env={**os.environ, "KW_LOG_LEVEL": "WARNING", **env},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError("server exited during startup")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+                conn.request("GET", "/healthz")
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status == 200:
+                    break
+                conn.close()
+            except OSError:
+                pass
+            time.sleep(0.005)
+        ready = (time.perf_counter() - t0) * 1e3
+        neg, com = _turn(players, 1, 0)
+        first_neg = _post(conn, "/negotiate", neg)
+        ttfr = (time.perf_counter() - t0) * 1e3
+        first_com = _post(conn, "/combat", com)
+        steady_neg, steady_com = [], []
+        for turn in range(1, turns + 1):
+            neg, com = _turn(players, 1 + turn, turn)
+            steady_neg.append(_post(conn, "/negotiate", neg))
+            steady_com.append(_post(conn, "/combat", com))
+        conn.close()
+    finally:
+        proc.terminate()
+        proc.wait()
+    return {"ready": ready, "ttfr": ttfr, "first_neg": first_neg, "first_com": first_com,
+            "steady_neg": statistics.median(steady_neg), "steady_com": statistics.median(steady_com)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--runs", type=int, default=5, help="fresh processes per case")
+    ap.add_argument("--turns", type=int, default=20, help="turns after the first one")
+    ap.add_argument("--players", type=int, default=8)
+    args = ap.parse_args()
+
+    print(f"{'case':<20} {'warmup':>6} {'ready ms':>9} {'ttfr ms':>8} "
+          f"{'first neg/com ms':>17} {'steady neg/com ms':>18}")
+    for name, env in CASES.items():
+        for warm in ("0", "1"):
+            runs: List[Dict[str, float]] = [run_once({**env, "KW_WARMUP": warm}, args.players, args.turns)
+                                            for _ in range(args.runs)]
+            m = {k: statistics.median(r[k] for r in runs) for k in runs[0]}
+            print(f"{name:<20} {'on' if warm == '1' else 'off':>6} {m['ready']:>9.0f} {m['ttfr']:>8.0f} "
+                  f"{m['first_neg']:>8.2f}/{m['first_com']:<8.2f} {m['steady_neg']:>9.2f}/{m['steady_com']:<8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Bounded caches in front of the strategy: game-server retries and repeated
+turn states.
+
+- RetryCache (server.py): the response to a (path, raw body) pair, keyed by
+  a 16-byte BLAKE2b digest of the body. A retried turn is answered from here
+  before parsing and never reaches the strategy, so its intel is not
+  recorded twice; a duplicate arriving while the first copy is still being
+  served waits for that answer instead of running the turn again.
+- DecisionCache (strategy.py): the refined combat plan (KW_SEARCH_MS > 0)
+  for a canonical turn state: everything `plan_combat` reads once the
+  turn's intel is recorded (our tower, the living enemies with their
+  GameMemory summary - active, aggression, allied, hostile, coordinated,
+  profile stash - the turn, the planner and the game's strategy config).
+  PlayerIds are replaced by positions, so the same state in another game
+  (turn-1 openings) hits too. A memory change changes the key, so nothing is
+  invalidated by hand; old entries age out of the LRU. Enemies keep their
+  request order rather than being sorted: tie-breaks between equal targets
+  follow it, and a sorted key would change those decisions. Only searches
+  that scored every candidate are stored, so a hit returns exactly what
+  refining again would. The heuristic alone (and `negotiate`) is not
+  cached: it costs about what building the key does.
+
+Hits, misses and evictions are counted as `cache:<name>:<event>` metrics
+and reported, with hit rates, under `cache` in GET /metrics.
+
+Env:
+    KW_RETRY_CACHE=4096      responses kept (0 = off)
+    KW_DECISION_CACHE=4096   decisions kept (0 = off)
+"""
+
+import asyncio
+import os
+from collections import OrderedDict
+from hashlib import blake2b
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import metrics
+
+RETRY_SIZE = int(os.getenv("KW_RETRY_CACHE", "4096"))
+DECISION_SIZE = int(os.getenv("KW_DECISION_CACHE", "4096"))
+
+_PID_FIELDS = ("targetId", "allyId", "attackTargetId")
+
+
+class LRU:
+    """Size-bounded LRU map that counts hits, misses and evictions."""
+
+    def __init__(self, name: str, size: int):
+        self.size = max(1, size)
+        self._d: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._hit, self._miss, self._evict = (f"cache:{name}:{e}" for e in ("hits", "misses", "evictions"))
+
+    def get(self, key: Hashable) -> Any:
+        value = self._d.get(key)
+        if value is None:
+            metrics.incr(self._miss)
+            return None
+        self._d.move_to_end(key)
+        metrics.incr(self._hit)
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        self._d[key] = value
+        self._d.move_to_end(key)
+        if len(self._d) > self.size:
+            self._d.popitem(last=False)
+            metrics.incr(self._evict)
+
+    def __len__(self):
+        return len(self._d)
+
+
+class RetryCache(LRU):
+    """Encoded responses by (path, body digest), with in-flight dedup."""
+
+    def __init__(self, size: int = RETRY_SIZE):
+        super().__init__("retry", size)
+        self._inflight: Dict[Tuple[str, bytes], asyncio.Future] = {}
+
+    @staticmethod
+    def key(path: str, body: bytes) -> Tuple[str, bytes]:
+        return path, blake2b(body, digest_size=16).digest()
+
+    async def claim(self, key: Tuple[str, bytes]) -> Optional[bytes]:
+        """The cached response, or None: the caller serves it, then put/release."""
+        while True:
+            raw = self.get(key)
+            if raw is not None:
+                return raw
+            pending = self._inflight.get(key)
+            if pending is None:
+                self._inflight[key] = asyncio.get_running_loop().create_future()
+                return None
+            await pending  # the first copy is being served: take its answer
+
+    def put(self, key: Tuple[str, bytes], raw: bytes):
+        super().put(key, raw)
+        self.release(key)
+
+    def release(self, key: Tuple[str, bytes]):
+        """End the in-flight claim (after put, or when the call failed)."""
+        pending = self._inflight.pop(key, None)
+        if pending is not None and not pending.done():
+            pending.set_result(None)
+
+
+class DecisionCache(LRU):
+    """Decisions by canonical turn state, with playerIds as positions."""
+
+    def __init__(self, size: int = DECISION_SIZE):
+        super().__init__("decision", size)
+
+    def lookup(self, key: Hashable, pids: Sequence[int]) -> Optional[List[Dict]]:
+        entry = self.get(key)
+        return decode(entry, pids) if entry is not None else None
+
+    def store(self, key: Hashable, pids: Sequence[int], actions: List[Dict]):
+        entry = encode(actions, pids)
+        if entry is not None:
+            self.put(key, entry)
+
+
+def encode(actions: List[Dict], pids: Sequence[int]) -> Optional[tuple]:
+    """Actions with playerIds replaced by their position in `pids` (None if one is missing)."""
+    pos = {pid: i for i, pid in enumerate(pids)}
+    try:
+        return tuple(tuple((k, pos[v] if k in _PID_FIELDS else v) for k, v in a.items())
+                     for a in actions)
+    except KeyError:
+        return None
+
+
+def decode(entry: tuple, pids: Sequence[int]) -> List[Dict]:
+    """Fresh action dicts for this game's playerIds."""
+    return [{k: pids[v] if k in _PID_FIELDS else v for k, v in a} for a in entry]
+
+
+def create_decisions() -> Optional[DecisionCache]:
+    """Decision cache from KW_DECISION_CACHE (None = off)."""
+    return DecisionCache(DECISION_SIZE) if DECISION_SIZE > 0 else None
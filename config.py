@@ -0,0 +1,201 @@
+"""
+Tunable strategy parameters with hot reload and A/B variants by gameId.
+
+`StrategyConfig` holds every constant the heuristics use; its defaults are
+the shipped strategy. A JSON file (KW_STRATEGY_CONFIG) can override them
+and define variants that get a percentage of games:
+
+    {
+      "default":  {"bluff_ratio": 1.4},
+      "variants": {"cautious": {"armor_floor": 50, "armor_target": 60}},
+      "split":    {"cautious": 10}
+    }
+
+"default" applies to every game; each variant applies its overrides on top
+of it; "split" gives each variant a percentage of gameIds (by a stable
+hash, so every turn of a game gets the same variant while the split is
+unchanged). The file is re-read when its mtime changes (checked at most
+every KW_CONFIG_CHECK seconds on the request path). A new config is fully
+parsed and validated, then swapped in as one object, so a request never
+sees half of an update; an invalid file is logged and the previous config
+stays active.
+
+Outcomes (won / lost / max_turn) are counted per variant in metrics; the
+per-variant negotiate/combat latency is recorded only while a split is
+live (the endpoint histograms already cover the single-config case).
+
+Env:
+    KW_STRATEGY_CONFIG=<file.json>   (unset = built-in defaults only)
+    KW_CONFIG_CHECK=1.0
+"""
+
+import dataclasses
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import kwlog
+import metrics
+from economy import FATIGUE_TURN
+from profiles import DEFAULT_STASH
+
+
+@dataclass(frozen=True)
+class StrategyConfig:
+    name: str = "default"
+    # Negotiate
+    strength_hp: float = 0.5        # strength = income + hp * strength_hp
+    bluff_ratio: float = 1.5        # ally with a leader this much stronger than us
+    # Threat prediction
+    stash: float = DEFAULT_STASH    # turns of income an enemy commits per attack
+    stash_share: float = 0.6        # share of that stash expected at us
+    level_bonus: float = 0.1        # extra threat per enemy level
+    afk_threat: float = 0.2         # threat multiplier for inactive enemies
+    hostile_threat: float = 1.8     # threat multiplier for declared attackers
+    threat_margin: float = 1.1      # safety margin on the top-2 sum
+    observed_threat: float = 0.0    # floor from the observed top-2 attack averages (0 = off)
+    # Upgrades
+    rush_turn: int = 5              # always upgrade when affordable up to here
+    roi_last_turn: int = 18         # ROI upgrades only before this turn
+    roi_horizon: int = FATIGUE_TURN + 5  # turn after which income stops mattering
+    roi_factor: float = 0.7         # payback must be under this share of turns left
+    roi_hp_margin: float = 25       # and we keep this much eff HP after the threat
+    # Armor
+    armor_floor: float = 40         # buy armor if eff HP after threat is below
+    armor_target: float = 50        # ... up to this eff HP
+    # Targeting
+    w_kill: float = 5000
+    w_coordinated: float = 500
+    w_ally: float = -1000
+    w_afk: float = -800
+    w_level: float = 50
+    w_aggression: float = 0.5
+    skip_below: float = -1500       # do not attack targets scored below this
+    commit_priority: float = 1000   # above this, a non-kill attack commits...
+    commit_share: float = 0.8       # ... this share of the troops left
+
+
+DEFAULT = StrategyConfig()
+_FIELDS = {f.name: f.type for f in dataclasses.fields(StrategyConfig) if f.name != "name"}
+_FINISHED = 4096  # recently finished games remembered to count each outcome once
+_SALT = 0x5BD1E995  # decorrelates variant buckets from router slots
+
+
+def bucket(gid: int) -> int:
+    """Stable 0..99 bucket for a gameId (independent of router.game_slot)."""
+    return (((gid ^ _SALT) * 0x9E3779B97F4A7C15 & 0xFFFFFFFFFFFFFFFF) >> 32) % 100
+
+
+class _Active(NamedTuple):
+    default: StrategyConfig
+    variants: Dict[str, StrategyConfig]
+    split: Tuple[Tuple[int, StrategyConfig], ...]  # (cumulative % upper bound, config)
+    version: int
+
+
+def _apply(base: StrategyConfig, name: str, overrides: dict) -> StrategyConfig:
+    values = {}
+    for k, v in overrides.items():
+        if k not in _FIELDS:
+            raise ValueError(f"unknown parameter {k!r}")
+        values[k] = int(v) if _FIELDS[k] in (int, "int") else float(v)
+    return dataclasses.replace(base, name=name, **values)
+
+
+def parse(doc: dict, version: int = 0) -> _Active:
+    """Build (and validate) an active config from a config document."""
+    default = _apply(DEFAULT, "default", doc.get("default", {}))
+    variants = {name: _apply(default, name, o) for name, o in doc.get("variants", {}).items()}
+    split, upper = [], 0
+    for name, pct in doc.get("split", {}).items():
+        if name not in variants:
+            raise ValueError(f"split names unknown variant {name!r}")
+        upper += int(pct)
+        split.append((upper, variants[name]))
+    if upper > 100:
+        raise ValueError(f"split adds up to {upper}% (> 100%)")
+    return _Active(default, variants, tuple(split), version)
+
+
+class ConfigStore:
+    """Current StrategyConfig per game, reloaded from `path` when it changes."""
+
+    def __init__(self, path: Optional[str] = None, check_every: float = None):
+        self.path = path
+        self.check_every = check_every if check_every is not None else float(os.getenv("KW_CONFIG_CHECK", "1.0"))
+        self._active = _Active(DEFAULT, {}, (), 0)
+        self.split = False      # any variant live: per-variant latency is recorded
+        self._mtime = None      # mtime of the active file
+        self._rejected = ()     # mtime of the last invalid file, None if missing (logged once)
+        self._next_check = 0.0
+        self._finished: "OrderedDict[int, None]" = OrderedDict()
+        if path:
+            self.reload()
+
+    def for_game(self, gid: int) -> StrategyConfig:
+        if self.path is not None:
+            now = time.monotonic()
+            if now >= self._next_check:
+                self._next_check = now + self.check_every
+                self.reload()
+        active = self._active  # one read: a concurrent swap cannot mix versions
+        if active.split:
+            b = bucket(gid)
+            for upper, cfg in active.split:
+                if b < upper:
+                    return cfg
+        return active.default
+
+    def reload(self, force: bool = False) -> bool:
+        """Re-read the file if its mtime changed; True if a new config is active."""
+        mtime = None
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if not force and mtime in (self._mtime, self._rejected):
+                return False
+            with open(self.path) as f:
+                active = parse(json.load(f), self._active.version + 1)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            if mtime != self._rejected:
+                kwlog.error("CONFIG", "Keeping previous strategy config: %s", e, path=self.path)
+            self._rejected = mtime
+            return False
+        self._active, self._mtime = active, mtime
+        self.split = bool(active.split)
+        kwlog.info("CONFIG", "Loaded strategy config v%s", active.version, path=self.path,
+                   variants=",".join(active.variants) or "-")
+        return True
+
+    def finish(self, gid: int, outcome: str):
+        """Count a game's outcome (won / lost / max_turn) once for its variant."""
+        if gid in self._finished:
+            return
+        self._finished[gid] = None
+        if len(self._finished) > _FINISHED:
+            self._finished.popitem(last=False)
+        name = self.for_game(gid).name
+        metrics.incr(f"variant:{name}:games")
+        metrics.incr(f"variant:{name}:{outcome}")
+
+    def evicted(self, gid: int):
+        """Count a game dropped from memory unfinished (lru / ttl / bytes) for its variant."""
+        if gid not in self._finished:
+            metrics.incr(f"variant:{self.for_game(gid).name}:evicted")
+
+    def describe(self) -> dict:
+        a = self._active
+        shares, prev = {}, 0
+        for upper, cfg in a.split:
+            shares[cfg.name] = upper - prev
+            prev = upper
+        shares["default"] = 100 - prev
+        return {"version": a.version, "path": self.path, "split": shares,
+                "default": dataclasses.asdict(a.default),
+                "variants": {n: dataclasses.asdict(c) for n, c in a.variants.items()}}
+
+
+def create_store() -> ConfigStore:
+    return ConfigStore(os.getenv("KW_STRATEGY_CONFIG") or None)
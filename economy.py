@@ -0,0 +1,71 @@
+"""
+Kingdom Wars economy: game constants and precomputed lookup tables.
+
+Everything the strategy, search, simulator and batch paths need about
+income, upgrade costs and fatigue is computed once at import time, so the
+hot paths do tuple indexing instead of floating-point powers.
+
+Tables (index = level or turn):
+    RES_PER_TURN[level]      income per turn at a level (1..MAX_LEVEL+1)
+    UPG_COST[level]          cost to upgrade from a level
+    UPGRADE_GAIN[level]      extra income per turn after upgrading from a level
+    PAYBACK[level]           turns for that upgrade to pay for itself
+    FATIGUE[turn]            fatigue damage taken on a turn
+"""
+
+import math
+from typing import Tuple
+
+FATIGUE_TURN = 25
+MAX_LEVEL = 5
+TABLE_TURNS = 256  # turns covered by the per-turn tables (beyond: formula)
+
+
+def _res_formula(level: int) -> int:
+    return int(round(20 * (1.5 ** (level - 1))))
+
+
+def _upg_formula(current_level: int) -> int:
+    return math.ceil(50 * (1.75 ** (current_level - 1)))
+
+
+def _fatigue_formula(turn: int) -> int:
+    if turn <= FATIGUE_TURN: return 0
+    return 5 * (turn - FATIGUE_TURN)
+
+
+_LEVELS = range(MAX_LEVEL + 2)  # 0 is a placeholder so tables index by level
+
+RES_PER_TURN: Tuple[int, ...] = tuple(_res_formula(l) if l else 0 for l in _LEVELS)
+UPG_COST: Tuple[int, ...] = tuple(_upg_formula(l) if l else 0 for l in _LEVELS)
+UPGRADE_GAIN: Tuple[int, ...] = tuple(
+    RES_PER_TURN[l + 1] - RES_PER_TURN[l] if 0 < l <= MAX_LEVEL else 0 for l in _LEVELS)
+PAYBACK: Tuple[float, ...] = tuple(
+    UPG_COST[l] / UPGRADE_GAIN[l] if UPGRADE_GAIN[l] else math.inf for l in _LEVELS)
+FATIGUE: Tuple[int, ...] = tuple(_fatigue_formula(t) for t in range(TABLE_TURNS + 1))
+
+
+def res_per_turn(level: int) -> int:
+    """Accurate game resources per level."""
+    if 0 < level <= MAX_LEVEL + 1:
+        return RES_PER_TURN[level]
+    return _res_formula(level)
+
+
+def upg_cost(current_level: int) -> int:
+    """Accurate upgrade costs per level."""
+    if 0 < current_level <= MAX_LEVEL + 1:
+        return UPG_COST[current_level]
+    return _upg_formula(current_level)
+
+
+def fatigue_damage(turn: int) -> int:
+    """Fatigue starts at 5 and grows by 5 each turn."""
+    if 0 <= turn <= TABLE_TURNS:
+        return FATIGUE[turn]
+    return _fatigue_formula(turn)
+
+
+def payback_turns(level: int) -> float:
+    """Turns for an upgrade from `level` to pay back its cost."""
+    return PAYBACK[level] if 0 < level <= MAX_LEVEL else math.inf
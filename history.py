@@ -0,0 +1,189 @@
+"""
+Per-game turn history: append-only columnar ring buffers on typed arrays.
+
+GameMemory's counters answer "how much has X sent at us this game"; the
+history answers windowed questions: who attacked us in the last k turns,
+each player's average attack size, who offered whom alliances lately, and
+how fast a player is levelling. Each game keeps three rings:
+
+    attacks    (turn, attacker, target, troops)   one row per attack seen
+    proposals  (turn, proposer, ally, target)     one row per proposal seen
+    levels     (turn, player, level)              one row per level change
+
+A ring grows its `array("q")` columns up to KW_HISTORY_ROWS rows and then
+overwrites the oldest row, so a game costs at most 8 bytes x columns x
+rows (about 11 KB per game at the default 128). A turn's rows are written
+column-wise in one call, and a query bisects to its window edge and slices,
+so recording an 8-player turn costs about 10 us and asking for the last
+few turns touches only those rows (about 5 us).
+
+Rows carry the turn they were reported on: `previousAttacks` of turn t
+(last turn's attacks) are stored with turn t, like GameMemory's counters.
+
+Env:
+    KW_HISTORY_ROWS=128   rows kept per ring per game
+"""
+
+import os
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+ROWS = int(os.getenv("KW_HISTORY_ROWS", "128"))
+_NO_TARGET = -1  # proposal without an attack target
+
+
+class Ring:
+    """The last `cap` rows of `width` int64 columns."""
+
+    __slots__ = ("cols", "cap", "total")
+
+    def __init__(self, width: int, cap: int = ROWS):
+        self.cols = tuple(array("q") for _ in range(width))
+        self.cap = max(1, cap)
+        self.total = 0  # rows ever appended; the next row goes to total % cap
+
+    def extend(self, rows: List[Tuple[int, ...]]):
+        """Append rows: one `extend` or slice write per column and ring segment."""
+        rows = rows[-self.cap:]
+        if not rows:
+            return
+        values = list(zip(*rows))
+        k, cap = len(rows), self.cap
+        done = max(0, min(k, cap - self.total))  # rows that still grow the columns
+        if done:
+            for col, vals in zip(self.cols, values):
+                col.extend(vals[:done])
+        while done < k:  # full: overwrite from the oldest row on, wrapping once at most
+            i = (self.total + done) % cap
+            m = min(k - done, cap - i)
+            for col, vals in zip(self.cols, values):
+                col[i:i + m] = array("q", vals[done:done + m])
+            done += m
+        self.total += k
+
+    def window(self, since: int = 0) -> Tuple[array, ...]:
+        """Columns of the rows whose turn (first column) is >= since, oldest first.
+
+        Turns are appended in order, so the window edge is a bisect on each
+        of the (at most two) physical segments and the rest is slicing.
+        """
+        turns, n = self.cols[0], min(self.total, self.cap)
+        if self.total <= self.cap:
+            j = bisect_left(turns, since, 0, n)
+            return tuple(col[j:n] for col in self.cols)
+        i = self.total % self.cap  # oldest kept row
+        if i and turns[self.cap - 1] < since:  # window lies in the newer segment
+            j = bisect_left(turns, since, 0, i)
+            return tuple(col[j:i] for col in self.cols)
+        j = bisect_left(turns, since, i, self.cap)
+        return tuple(col[j:] + col[:i] for col in self.cols)
+
+    def rows(self, since: int = 0) -> List[Tuple[int, ...]]:
+        """Rows whose turn is >= since, oldest first."""
+        return list(zip(*self.window(since)))
+
+    def export(self) -> Tuple[Tuple[array, ...], int]:
+        """The columns as stored and the index of the oldest row (no copy)."""
+        return self.cols, self.total % self.cap if self.total > self.cap else 0
+
+    def load(self, cols: Iterable[array], oldest: int = 0):
+        """Replace the rows with exported columns (the newest `cap` are kept)."""
+        cols = [array("q", col[oldest:] + col[:oldest]) for col in cols]
+        skip = max(0, len(cols[0]) - self.cap)
+        self.cols = tuple(col[skip:] for col in cols)
+        self.total = len(self.cols[0])
+
+    @property
+    def nbytes(self) -> int:
+        return 8 * len(self.cols) * min(self.total, self.cap)
+
+
+class TurnHistory:
+    """Attack, proposal and level-change rings of one game."""
+
+    __slots__ = ("attacks", "proposals", "levels", "level_of")
+
+    def __init__(self, cap: int = ROWS):
+        self.attacks = Ring(4, cap)
+        self.proposals = Ring(4, cap)
+        self.levels = Ring(3, cap)
+        self.level_of: Dict[int, int] = {}  # last recorded level per player
+
+    # ─── Recording ──────────────────────────────────────────────────
+
+    def record_attacks(self, turn: int, attacks: Iterable):
+        rows = []
+        for pa in attacks:
+            act = pa.get("action", {}) or {}
+            troops = int(act.get("troopCount", 0) or 0)
+            target = act.get("targetId")
+            if troops > 0 and target is not None:
+                rows.append((turn, pa["playerId"], int(target), troops))
+        self.attacks.extend(rows)
+
+    def record_levels(self, turn: int, towers: Iterable):
+        rows = []
+        for e in towers:
+            pid, level = e["playerId"], e["level"]
+            if self.level_of.get(pid) != level:
+                self.level_of[pid] = level
+                rows.append((turn, pid, level))
+        self.levels.extend(rows)
+
+    def record_proposals(self, turn: int, diplomacy: Iterable):
+        rows = []
+        for d in diplomacy:
+            act = d.get("action", {}) or {}
+            ally = act.get("allyId")
+            if ally is not None:
+                target = act.get("attackTargetId")
+                rows.append((turn, d["playerId"], int(ally), int(target) if target else _NO_TARGET))
+        self.proposals.extend(rows)
+
+    def rings(self) -> Tuple[Ring, Ring, Ring]:
+        return self.attacks, self.proposals, self.levels
+
+    def load(self, attacks, proposals, levels):
+        """Restore exported (columns, oldest) rings (see snapshot.py)."""
+        for ring, exported in zip(self.rings(), (attacks, proposals, levels)):
+            ring.load(*exported)
+        self.level_of = {}
+        for _, pid, level in self.levels.rows():
+            self.level_of[pid] = level
+
+    # ─── Windowed queries ───────────────────────────────────────────
+
+    def attacks_on(self, target: int, since: int) -> Dict[int, int]:
+        """Troops each player sent at `target` in turns >= since."""
+        _, attackers, targets, troops = self.attacks.window(since)
+        out: Dict[int, int] = {}
+        for a, t, n in zip(attackers, targets, troops):
+            if t == target:
+                out[a] = out.get(a, 0) + n
+        return out
+
+    def avg_troops(self, since: int = 0) -> Dict[int, float]:
+        """Mean troops per attack of each player in turns >= since."""
+        _, attackers, _, troops = self.attacks.window(since)
+        total: Dict[int, int] = {}
+        count: Dict[int, int] = {}
+        for a, n in zip(attackers, troops):
+            total[a] = total.get(a, 0) + n
+            count[a] = count.get(a, 0) + 1
+        return {a: total[a] / count[a] for a in total}
+
+    def levels_gained(self, pid: int, since: int) -> int:
+        """Levels `pid` gained in turns >= since (counted from its first row if none is older)."""
+        turns, players, levels = self.levels.window()
+        first = last = None
+        for t, p, lvl in zip(turns, players, levels):
+            if p == pid:
+                if first is None or t < since:
+                    first = lvl
+                last = lvl
+        return last - first if last is not None else 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.attacks.nbytes + self.proposals.nbytes + self.levels.nbytes
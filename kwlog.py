@@ -0,0 +1,96 @@
+"""
+Non-blocking structured logging for the request path.
+
+Log calls only build a LogRecord and `put_nowait` it on a bounded queue; a
+background thread formats and writes to stdout/stderr. When stdout is slow
+the queue fills and new records are dropped (and counted) instead of
+stalling a turn response. Records carry structured fields (gameId, turn,
+decision, ...) that are rendered as `key=value` pairs.
+
+Env:
+    KW_LOG_LEVEL=INFO      (DEBUG, INFO, WARNING, ERROR)
+    KW_LOG_QUEUE=10000     (max records buffered before dropping)
+
+Usage:
+    kwlog.info("STRATEGY", "Attacking %s with %s troops", tid, troops,
+               gameId=gid, turn=turn, decision="attack")
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+_LEVEL = getattr(logging, os.getenv("KW_LOG_LEVEL", "INFO").upper(), logging.INFO)
+_QUEUE_SIZE = int(os.getenv("KW_LOG_QUEUE", "10000"))
+
+_logger = logging.getLogger("kw")
+_logger.setLevel(_LEVEL)
+_logger.propagate = False
+
+
+class _Formatter(logging.Formatter):
+    """`[TAG] message key=value ...` (levels above INFO are prefixed)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"[{record.tag}] {record.getMessage()}"
+        if record.levelno > logging.INFO:
+            line = f"{record.levelname} {line}"
+        if record.fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in record.fields.items())
+        return line
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue without blocking or formatting; count drops when full."""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record  # formatting happens on the writer thread
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _stream(stream, errors: bool) -> logging.Handler:
+    h = logging.StreamHandler(stream)
+    h.setFormatter(_Formatter())
+    h.addFilter(lambda r: (r.levelno >= logging.ERROR) == errors)
+    return h
+
+
+_queue: queue.Queue = queue.Queue(_QUEUE_SIZE)
+handler = _DroppingQueueHandler(_queue)
+_logger.addHandler(handler)
+_listener = logging.handlers.QueueListener(
+    _queue, _stream(sys.stdout, errors=False), _stream(sys.stderr, errors=True))
+_listener.start()
+atexit.register(_listener.stop)  # drain the queue on interpreter exit
+
+
+def log(level: int, tag: str, msg: str, *args, **fields):
+    if _logger.isEnabledFor(level):
+        _logger.log(level, msg, *args, extra={"tag": tag, "fields": fields})
+
+
+def debug(tag: str, msg: str, *args, **fields): log(logging.DEBUG, tag, msg, *args, **fields)
+def info(tag: str, msg: str, *args, **fields): log(logging.INFO, tag, msg, *args, **fields)
+def warning(tag: str, msg: str, *args, **fields): log(logging.WARNING, tag, msg, *args, **fields)
+def error(tag: str, msg: str, *args, **fields): log(logging.ERROR, tag, msg, *args, **fields)
+
+
+def set_level(level: int):
+    """Change verbosity at runtime (e.g. quiet batch simulations)."""
+    _logger.setLevel(level)
+
+
+def stats() -> dict:
+    return {"queued": _queue.qsize(), "dropped": handler.dropped}
@@ -0,0 +1,405 @@
+"""
+Pluggable storage backends for cross-turn game memory.
+
+`strategy.GameMemory` keeps everything in a process-local dict, which is the
+fastest option but splits a game's state when uvicorn runs several workers.
+`SQLiteMemory` keeps the same intel in a WAL-mode SQLite file that every
+worker on the host reads and writes, so `/negotiate` and `/combat` calls for
+one game see the same betrayal, aggression and alliance state no matter
+which worker serves them.
+
+Select the backend with env vars (see `strategy.create_memory`):
+    KW_MEMORY_BACKEND=local|sqlite   (default: local)
+    KW_MEMORY_PATH=/tmp/kw_memory.db (sqlite only)
+    KW_MEMORY_MAX_GAMES=500          (LRU game cap)
+    KW_MEMORY_TTL=1800               (seconds before an idle game is evicted)
+    KW_MEMORY_MAX_BYTES=67108864     (estimated byte budget, local only)
+    KW_THREAT_DECAY=0.5              (per-turn weight kept by the observed-threat EWMA)
+"""
+
+import heapq
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import kwlog
+
+# Ingestion phases of a game turn (MemoryBackend.claim_turn). Negotiate's
+# combatActions and combat's previousAttacks both carry last turn's attacks,
+# and a retried request repeats everything, so each phase is applied once.
+INGEST_ATTACKS = 0   # last turn's attacks (record_intel)
+INGEST_COMBAT = 1    # the combat request's diplomacy (record_diplomacy, profiles)
+INGEST_PHASES = 2
+
+# Observed threat (MemoryBackend.threat): an exponentially weighted average
+# of the troops each enemy sends at us per turn, turns without an attack
+# counting as 0
+THREAT_DECAY = float(os.getenv("KW_THREAT_DECAY", "0.5"))
+if not 0.0 < THREAT_DECAY < 1.0:
+    raise ValueError("KW_THREAT_DECAY must be in (0, 1)")
+
+
+class MemoryBackend(ABC):
+    """Interface the strategy engine uses to read and write game intel."""
+
+    @abstractmethod
+    def claim_turn(self, gid: int, turn: int, phase: int) -> bool:
+        """True the first time a game's (turn, phase) is seen: the caller ingests it."""
+
+    @abstractmethod
+    def record_intel(self, gid: int, turn: int, my_id: int, prev_attacks: List[Dict]): ...
+
+    @abstractmethod
+    def record_diplomacy(self, gid: int, turn: int, diplomacy: List[Dict], my_id: int): ...
+
+    @abstractmethod
+    def record_turn(self, gid: int, turn: int, enemies: List[Dict], attacks: List[Dict]):
+        """Append last turn's attacks and any tower level changes to the game's history."""
+
+    @abstractmethod
+    def attacks_on(self, gid: int, target: int, since: int) -> Dict[int, int]:
+        """Troops each player sent at `target` in turns >= since."""
+
+    @abstractmethod
+    def avg_troops(self, gid: int, since: int = 0) -> Dict[int, float]:
+        """Mean troops per attack of each player in turns >= since."""
+
+    @abstractmethod
+    def levels_gained(self, gid: int, pid: int, since: int) -> int:
+        """Levels `pid` gained in turns >= since."""
+
+    @abstractmethod
+    def proposals(self, gid: int, since: int) -> List[Tuple[int, int, int, int]]:
+        """(turn, proposer, ally, target) rows of turns >= since, oldest first (target -1 = none)."""
+
+    @abstractmethod
+    def is_active(self, gid: int, pid: int, turn: int) -> bool: ...
+
+    @abstractmethod
+    def get_trust(self, gid: int, pid: int) -> float: ...
+
+    @abstractmethod
+    def aggression(self, gid: int, pid: int) -> int:
+        """Total troops `pid` has sent at us in this game."""
+
+    @abstractmethod
+    def enemy_intel(self, gid: int, turn: int, pids: Iterable[int]) -> Dict[int, Tuple[bool, int]]:
+        """Batch read for scoring: pid -> (is_active, aggression)."""
+
+    @abstractmethod
+    def threat(self, gid: int, turn: int, my_id: int, pids: Iterable[int]) -> float:
+        """Sum of the two largest per-turn attack averages at us among `pids` (alive enemies)."""
+
+    @abstractmethod
+    def set_our_allies(self, gid: int, ids: Iterable[int]): ...
+
+    @abstractmethod
+    def get_our_allies(self, gid: int) -> Set[int]: ...
+
+    @abstractmethod
+    def finish_game(self, gid: int):
+        """Free a game's state as soon as it is over."""
+
+    @abstractmethod
+    def cleanup(self): ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """Live game count and eviction counters."""
+
+
+# ─── SQLite (WAL) backend ────────────────────────────────────────────
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    gid INTEGER PRIMARY KEY,
+    last_seen REAL NOT NULL,
+    our_allies TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS intel (
+    gid INTEGER NOT NULL,
+    pid INTEGER NOT NULL,
+    agg INTEGER NOT NULL DEFAULT 0,
+    betrayals INTEGER NOT NULL DEFAULT 0,
+    active_turn INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (gid, pid)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ally_turns (
+    gid INTEGER NOT NULL,
+    pid INTEGER NOT NULL,
+    turn INTEGER NOT NULL,
+    PRIMARY KEY (gid, pid, turn)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS attack_log (
+    gid INTEGER NOT NULL,
+    turn INTEGER NOT NULL,
+    attacker INTEGER NOT NULL,
+    target INTEGER NOT NULL,
+    troops INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attack_log_turn ON attack_log (gid, turn);
+CREATE TABLE IF NOT EXISTS proposal_log (
+    gid INTEGER NOT NULL,
+    turn INTEGER NOT NULL,
+    proposer INTEGER NOT NULL,
+    ally INTEGER NOT NULL,
+    target INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS proposal_log_turn ON proposal_log (gid, turn);
+CREATE TABLE IF NOT EXISTS level_log (
+    gid INTEGER NOT NULL,
+    pid INTEGER NOT NULL,
+    turn INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    PRIMARY KEY (gid, pid, turn)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ingested (
+    gid INTEGER NOT NULL,
+    turn INTEGER NOT NULL,
+    phase INTEGER NOT NULL,
+    PRIMARY KEY (gid, turn, phase)
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteMemory(MemoryBackend):
+    """Game memory shared by every worker process through one SQLite file.
+
+    Each process opens its own connection lazily (after uvicorn forks or
+    spawns workers). WAL mode lets readers proceed while one writer commits,
+    and each `record_*` call is a single short transaction.
+    """
+
+    CLEANUP_EVERY = 256  # record_intel calls between request-time sweeps
+
+    def __init__(self, path: str, max_games: int = 500,
+                 ttl: float = 1800.0, on_evict: Optional[Callable[[int, str], None]] = None):
+        self.path = path
+        self.max_games = max_games
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        self.evictions = {"lru": 0, "ttl": 0, "finished": 0}
+        self.on_evict = on_evict  # called with (gid, reason) for games dropped unfinished
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _touch(self, db: sqlite3.Connection, gid: int):
+        db.execute(
+            "INSERT INTO games (gid, last_seen) VALUES (?, ?) "
+            "ON CONFLICT(gid) DO UPDATE SET last_seen = excluded.last_seen",
+            (gid, time.time()),
+        )
+
+    def claim_turn(self, gid: int, turn: int, phase: int) -> bool:
+        # The primary key makes the claim atomic across worker processes; the
+        # games row lets TTL/LRU cleanup find the claim log with the game
+        db = self._db
+        self._touch(db, gid)
+        return db.execute(
+            "INSERT OR IGNORE INTO ingested (gid, turn, phase) VALUES (?, ?, ?)",
+            (gid, turn, phase)).rowcount == 1
+
+    def record_intel(self, gid: int, turn: int, my_id: int, prev_attacks: List[Dict]):
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            self._touch(db, gid)
+            for pa in prev_attacks:
+                act = pa.get("action", {}) or {}
+                pid = int(pa["playerId"])
+                target = act.get("targetId")
+                troops = int(act.get("troopCount", 0) or 0)
+                if troops <= 0:
+                    continue
+
+                hit_us = target == my_id
+                betrayed = hit_us and db.execute(
+                    "SELECT 1 FROM ally_turns WHERE gid=? AND pid=? AND turn=?",
+                    (gid, pid, turn - 1),
+                ).fetchone() is not None
+                db.execute(
+                    "INSERT INTO intel (gid, pid, agg, betrayals, active_turn) "
+                    "VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(gid, pid) DO UPDATE SET "
+                    "agg = agg + excluded.agg, betrayals = betrayals + excluded.betrayals, "
+                    "active_turn = excluded.active_turn",
+                    (gid, pid, troops if hit_us else 0, int(betrayed), turn),
+                )
+                if betrayed:
+                    kwlog.info("INTEL", "BETRAYAL detected! Player %s attacked us.", pid,
+                               gameId=gid, turn=turn)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self._writes += 1
+        if self._writes % self.CLEANUP_EVERY == 0:
+            self.cleanup()
+
+    def record_diplomacy(self, gid: int, turn: int, diplomacy: List[Dict], my_id: int):
+        rows = [(gid, int(d["playerId"]), turn) for d in diplomacy
+                if (d.get("action", {}) or {}).get("allyId") == my_id]
+        if rows:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO ally_turns (gid, pid, turn) VALUES (?, ?, ?)", rows)
+        log = []
+        for d in diplomacy:
+            act = d.get("action", {}) or {}
+            if act.get("allyId") is not None:
+                target = act.get("attackTargetId")
+                log.append((gid, turn, int(d["playerId"]), int(act["allyId"]),
+                            int(target) if target else -1))
+        if log:
+            self._db.executemany(
+                "INSERT INTO proposal_log (gid, turn, proposer, ally, target) VALUES (?, ?, ?, ?, ?)", log)
+
+    def record_turn(self, gid: int, turn: int, enemies: List[Dict], attacks: List[Dict]):
+        # Rows live as long as the game (at most MAX_TURN turns of them) and
+        # go with it in _delete_games
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = []
+            for pa in attacks:
+                act = pa.get("action", {}) or {}
+                troops = int(act.get("troopCount", 0) or 0)
+                if troops > 0 and act.get("targetId") is not None:
+                    rows.append((gid, turn, int(pa["playerId"]), int(act["targetId"]), troops))
+            db.executemany(
+                "INSERT INTO attack_log (gid, turn, attacker, target, troops) VALUES (?, ?, ?, ?, ?)", rows)
+            last = dict(db.execute(
+                "SELECT pid, level FROM level_log l WHERE gid=? AND turn = "
+                "(SELECT MAX(turn) FROM level_log WHERE gid=l.gid AND pid=l.pid)", (gid,)))
+            db.executemany(
+                "INSERT OR REPLACE INTO level_log (gid, pid, turn, level) VALUES (?, ?, ?, ?)",
+                [(gid, int(e["playerId"]), turn, int(e["level"])) for e in enemies
+                 if last.get(int(e["playerId"])) != e["level"]])
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def attacks_on(self, gid: int, target: int, since: int) -> Dict[int, int]:
+        return dict(self._db.execute(
+            "SELECT attacker, SUM(troops) FROM attack_log WHERE gid=? AND turn>=? AND target=? "
+            "GROUP BY attacker", (gid, since, target)))
+
+    def avg_troops(self, gid: int, since: int = 0) -> Dict[int, float]:
+        return dict(self._db.execute(
+            "SELECT attacker, AVG(troops) FROM attack_log WHERE gid=? AND turn>=? "
+            "GROUP BY attacker", (gid, since)))
+
+    def levels_gained(self, gid: int, pid: int, since: int) -> int:
+        rows = self._db.execute(
+            "SELECT turn, level FROM level_log WHERE gid=? AND pid=? ORDER BY turn", (gid, pid)).fetchall()
+        if not rows:
+            return 0
+        before = [level for turn, level in rows if turn < since]
+        return rows[-1][1] - (before[-1] if before else rows[0][1])
+
+    def proposals(self, gid: int, since: int) -> List[Tuple[int, int, int, int]]:
+        return self._db.execute(
+            "SELECT turn, proposer, ally, target FROM proposal_log WHERE gid=? AND turn>=? "
+            "ORDER BY rowid", (gid, since)).fetchall()
+
+    def _intel(self, gid: int, pid: int):
+        return self._db.execute(
+            "SELECT agg, betrayals, active_turn FROM intel WHERE gid=? AND pid=?",
+            (gid, pid),
+        ).fetchone()
+
+    def is_active(self, gid: int, pid: int, turn: int) -> bool:
+        row = self._intel(gid, pid)
+        last = row[2] if row else 0
+        return (turn - last) <= 3
+
+    def get_trust(self, gid: int, pid: int) -> float:
+        row = self._intel(gid, pid)
+        if row and row[1] > 0: return 0.0
+        allied = self._db.execute(
+            "SELECT 1 FROM ally_turns WHERE gid=? AND pid=? LIMIT 1", (gid, pid)
+        ).fetchone()
+        return 0.8 if allied else 0.5
+
+    def aggression(self, gid: int, pid: int) -> int:
+        row = self._intel(gid, pid)
+        return row[0] if row else 0
+
+    def enemy_intel(self, gid: int, turn: int, pids: Iterable[int]) -> Dict[int, Tuple[bool, int]]:
+        out = {pid: (turn <= 3, 0) for pid in pids}
+        if out:
+            marks = ",".join("?" * len(out))
+            for pid, agg, active_turn in self._db.execute(
+                    f"SELECT pid, agg, active_turn FROM intel WHERE gid=? AND pid IN ({marks})",
+                    (gid, *out)):
+                out[pid] = (turn - active_turn <= 3, agg)
+        return out
+
+    def threat(self, gid: int, turn: int, my_id: int, pids: Iterable[int]) -> float:
+        alive, hits = set(pids), {}
+        for attacker, t, troops in self._db.execute(
+                "SELECT attacker, turn, troops FROM attack_log WHERE gid=? AND target=?", (gid, my_id)):
+            if attacker in alive:
+                hits[attacker] = hits.get(attacker, 0.0) + troops * THREAT_DECAY ** (turn - t)
+        return (1.0 - THREAT_DECAY) * sum(heapq.nlargest(2, hits.values()))
+
+    def set_our_allies(self, gid: int, ids: Iterable[int]):
+        db = self._db
+        db.execute(
+            "INSERT INTO games (gid, last_seen, our_allies) VALUES (?, ?, ?) "
+            "ON CONFLICT(gid) DO UPDATE SET last_seen = excluded.last_seen, "
+            "our_allies = excluded.our_allies",
+            (gid, time.time(), ",".join(str(int(i)) for i in ids)),
+        )
+
+    def get_our_allies(self, gid: int) -> Set[int]:
+        row = self._db.execute("SELECT our_allies FROM games WHERE gid=?", (gid,)).fetchone()
+        if not row or not row[0]: return set()
+        return {int(i) for i in row[0].split(",")}
+
+    def _delete_games(self, db: sqlite3.Connection, where: str, args: tuple, reason: str) -> int:
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            gids = [(r[0],) for r in db.execute(f"SELECT gid FROM games WHERE {where}", args)]
+            for table in ("intel", "ally_turns", "ingested", "attack_log", "proposal_log",
+                          "level_log", "games"):
+                db.executemany(f"DELETE FROM {table} WHERE gid = ?", gids)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self.evictions[reason] += sum(gid >= 0 for (gid,) in gids)  # not warm-up games
+        if reason != "finished" and self.on_evict is not None:
+            for (gid,) in gids:
+                self.on_evict(gid, reason)
+        return len(gids)
+
+    def finish_game(self, gid: int):
+        self._delete_games(self._db, "gid = ?", (gid,), "finished")
+
+    def cleanup(self):
+        db = self._db
+        self._delete_games(db, "last_seen < ?", (time.time() - self.ttl,), "ttl")
+        (count,) = db.execute("SELECT COUNT(*) FROM games").fetchone()
+        if count > self.max_games:
+            self._delete_games(
+                db, "gid IN (SELECT gid FROM games ORDER BY last_seen DESC LIMIT -1 OFFSET ?)",
+                (self.max_games,), "lru")
+
+    def stats(self) -> Dict[str, int]:
+        (count,) = self._db.execute("SELECT COUNT(*) FROM games").fetchone()
+        return {"games": count, **{f"evicted_{k}": v for k, v in self.evictions.items()}}
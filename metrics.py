@@ -0,0 +1,186 @@
+"""
+In-process latency histograms and counters for the request hot path.
+
+Histograms use fixed log-spaced buckets (8 per doubling, 1us..~2min), so
+recording is O(1), each histogram is ~1.8 KB, quantiles are accurate to
+~9%, and snapshots from several processes (router workers) merge by adding
+bucket counts.
+
+Usage on the hot path:
+    t = perf_counter()
+    ...work...
+    t = metrics.lap("threat", t)   # records the phase, returns a new start
+"""
+
+import math
+from array import array
+from time import perf_counter
+from typing import Dict, Iterable, List
+
+_STEPS_PER_DOUBLING = 8
+_MIN_SECONDS = 1e-6
+_BUCKETS = 27 * _STEPS_PER_DOUBLING  # 1us * 2**27 ~= 134s
+_SCALE = _STEPS_PER_DOUBLING / math.log(2)
+
+
+def _bucket_upper(i: int) -> float:
+    return _MIN_SECONDS * 2 ** ((i + 1) / _STEPS_PER_DOUBLING)
+
+
+class Histogram:
+    """Log-bucketed latency histogram (seconds in, quantiles out)."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = array("q", bytes(8 * _BUCKETS))
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        if seconds > _MIN_SECONDS:
+            i = min(int(math.log(seconds / _MIN_SECONDS) * _SCALE), _BUCKETS - 1)
+        else:
+            i = 0
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th sample (capped at max)."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(_bucket_upper(i), self.max)
+        return self.max
+
+    def merge(self, other: "Histogram"):
+        for i, c in enumerate(other.counts):
+            if c:
+                self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def to_state(self) -> list:
+        return [self.counts.tobytes(), self.count, self.total, self.max]
+
+    @classmethod
+    def from_state(cls, state: list) -> "Histogram":
+        h = cls()
+        h.counts = array("q", state[0])
+        h.count, h.total, h.max = state[1], state[2], state[3]
+        return h
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "p50_ms": round(self.quantile(0.50) * 1e3, 3),
+            "p99_ms": round(self.quantile(0.99) * 1e3, 3),
+            "max_ms": round(self.max * 1e3, 3),
+            "mean_ms": round(self.total / self.count * 1e3, 3) if self.count else 0.0,
+        }
+
+
+# ─── Process-wide registry ───────────────────────────────────────────
+
+timings: Dict[str, Histogram] = {}
+counters: Dict[str, int] = {}
+
+
+def observe(name: str, seconds: float):
+    h = timings.get(name)
+    if h is None:
+        h = timings[name] = Histogram()
+    h.record(seconds)
+
+
+def lap(name: str, start: float) -> float:
+    """Record time since `start` under `name`; return now for the next phase."""
+    now = perf_counter()
+    observe(name, now - start)
+    return now
+
+
+def incr(name: str, n: int = 1):
+    counters[name] = counters.get(name, 0) + n
+
+
+def snapshot() -> dict:
+    """Picklable copy of this process's metrics (for merging across workers)."""
+    return {
+        "timings": {k: h.to_state() for k, h in timings.items()},
+        "counters": dict(counters),
+    }
+
+
+def merge(snapshots: Iterable[dict]) -> dict:
+    out_t: Dict[str, Histogram] = {}
+    out_c: Dict[str, int] = {}
+    for snap in snapshots:
+        for k, state in snap["timings"].items():
+            h = Histogram.from_state(state)
+            if k in out_t:
+                out_t[k].merge(h)
+            else:
+                out_t[k] = h
+        for k, v in snap["counters"].items():
+            out_c[k] = out_c.get(k, 0) + v
+    return {"timings": out_t, "counters": out_c}
+
+
+def report(merged: dict, endpoints: List[str]) -> dict:
+    """Shape merged metrics into the /metrics response."""
+    t, c = merged["timings"], merged["counters"]
+    ep = {}
+    for name in endpoints:
+        h = t.get(f"endpoint:{name}", Histogram())
+        ep[name] = {
+            "requests": c.get(f"requests:{name}", 0),
+            "errors": c.get(f"errors:{name}", 0),
+            **h.summary(),
+        }
+    phases = {k.split(":", 1)[1]: h.summary() for k, h in sorted(t.items())
+              if k.startswith("phase:")}
+    # variant:<name>:<negotiate|combat> latencies, variant:<name>:<outcome> counts
+    variants: Dict[str, dict] = {}
+    for k, h in sorted(t.items()):
+        if k.startswith("variant:"):
+            _, name, field = k.split(":", 2)
+            variants.setdefault(name, {})[field] = h.summary()
+    for k, n in sorted(c.items()):
+        if k.startswith("variant:"):
+            _, name, field = k.split(":", 2)
+            variants.setdefault(name, {})[field] = n
+    for v in variants.values():
+        # Games dropped from memory (idle, LRU, byte budget) never report an
+        # outcome: count them next to the finished ones
+        if v.get("games") or v.get("evicted"):
+            v.setdefault("games", 0)
+            v.setdefault("evicted", 0)
+            v["win_rate"] = round(v.get("won", 0) / v["games"], 4) if v["games"] else 0.0
+            v["evicted_rate"] = round(v["evicted"] / (v["games"] + v["evicted"]), 4)
+    offload = {k.split(":", 1)[1]: n for k, n in sorted(c.items()) if k.startswith("offload:")}
+    # cache:<retry|decision>:<hits|misses|evictions>
+    cache: Dict[str, dict] = {}
+    for k, n in sorted(c.items()):
+        if k.startswith("cache:"):
+            _, name, event = k.split(":", 2)
+            cache.setdefault(name, {})[event] = n
+    for v in cache.values():
+        looked = v.get("hits", 0) + v.get("misses", 0)
+        v["hit_rate"] = round(v.get("hits", 0) / looked, 4) if looked else 0.0
+    return {"endpoints": ep, "phases": phases, "variants": variants, "offload": offload,
+            "cache": cache}
+
+
+def reset():
+    timings.clear()
+    counters.clear()
@@ -4,9 +4,24 @@ from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 
 
+class Record(BaseModel):
+    """Validated model with read-only dict-style access.
+
+    strategy.py indexes its inputs like dicts (`e["hp"]`, `pa.get("action")`),
+    so the server can hand it these objects directly instead of paying for a
+    `model_dump()` round-trip on every tower and action.
+    """
+
+    def __getitem__(self, key: str) -> Any:
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+
 # === Request Models ===
 
-class PlayerTower(BaseModel):
+class PlayerTower(Record):
     playerId: int
     hp: int
     armor: int
@@ -14,14 +29,14 @@ class PlayerTower(BaseModel):
     level: int
 
 
-class EnemyTower(BaseModel):
+class EnemyTower(Record):
     playerId: int
     hp: int
     armor: int
     level: int
 
 
-class ActionEntry(BaseModel):
+class ActionEntry(Record):
     playerId: int
     action: Dict[str, Any] = {}
 
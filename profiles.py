@@ -0,0 +1,229 @@
+"""
+Cross-game opponent profiles keyed by playerId, in a memory-mapped table.
+
+GameMemory forgets everything when a game ends; over a tournament we meet
+the same opponents again. Each profile keeps:
+- stash: EWMA of attack size / attacker income, i.e. how many turns of
+  income a player saves up before it hits (combat's threat estimate uses
+  `income * stash` instead of a fixed `income * 2.0`)
+- attacks / troops / at_us: attack counts, troops sent, attacks on us
+- kept / betrayals: turns they allied with us and then held the peace or
+  attacked us anyway (negotiate skips partners with low trust)
+
+The table is fixed-size open addressing (64-byte records, linear probing)
+over an mmap, so lookups are O(1) with no load step: a restarted server
+maps the file and reads straight from the page cache. Slots never move, so
+each process caches pid -> offset. Router workers can map the same file;
+inserts take an flock, counter updates are unlocked (a rare lost increment
+only nudges a statistic).
+
+Env:
+    KW_PROFILE_PATH=<file>     enable profiles, persisted in this file
+    KW_PROFILE_CAPACITY=65536  slots when creating a new file (4 MiB)
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+from economy import res_per_turn
+
+MAGIC = b"KWPF"
+VERSION = 1
+DEFAULT_STASH = 2.0   # prior: enemies hit with ~2 turns of income
+STASH_ALPHA = 0.2     # EWMA weight of the newest attack
+MIN_TRUST = 0.3       # negotiate skips partners below this
+MAX_LOAD = 0.75       # stop inserting beyond this fill ratio
+_GAMES = 4096         # games whose last-turn alliances are remembered
+
+_HEADER = struct.Struct("<4sIQQ")  # magic, version, capacity, count
+_HEADER_BYTES = 64
+# key (pid + 1, 0 = empty), turns, attacks, at_us, troops, betrayals, kept, stash
+_REC = struct.Struct("<qqqqqqqd")
+_KEY = struct.Struct("<q")
+_FIELDS = ("turns", "attacks", "at_us", "troops", "betrayals", "kept", "stash")
+
+
+class ProfileStore:
+    """mmap-backed hash table of per-player behaviour across games."""
+
+    def __init__(self, path: Optional[str] = None, capacity: int = None):
+        capacity = capacity or int(os.getenv("KW_PROFILE_CAPACITY", "65536"))
+        if capacity & (capacity - 1):
+            raise ValueError("capacity must be a power of two")
+        self.path = path
+        self._fd = None
+        size = _HEADER_BYTES + capacity * _REC.size
+        if path is None:
+            self._map = mmap.mmap(-1, size)
+            _HEADER.pack_into(self._map, 0, MAGIC, VERSION, capacity, 0)
+        else:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            with self._locked():
+                if os.fstat(self._fd).st_size < _HEADER_BYTES:
+                    os.ftruncate(self._fd, size)
+                    os.pwrite(self._fd, _HEADER.pack(MAGIC, VERSION, capacity, 0), 0)
+                magic, version, capacity, _ = _HEADER.unpack(os.pread(self._fd, _HEADER.size, 0))
+                if magic != MAGIC or version != VERSION:
+                    raise ValueError(f"{path}: not a v{VERSION} profile file")
+            self._map = mmap.mmap(self._fd, _HEADER_BYTES + capacity * _REC.size)
+        self.capacity = capacity
+        self._mask = capacity - 1
+        self._offsets: Dict[int, int] = {}
+        self._allied: "OrderedDict[int, tuple]" = OrderedDict()  # gid -> (turn, pids allied with us)
+        self.full_skips = 0
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive file lock across processes (no-op for anonymous maps)."""
+        if self._fd is None:
+            yield
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    # ─── Slots ───────────────────────────────────────────────────────
+
+    def _offset(self, pid: int, create: bool) -> Optional[int]:
+        off = self._offsets.get(pid)
+        if off is not None:
+            return off
+        key = pid + 1
+        if key <= 0:
+            return None
+        i = (pid * 0x9E3779B97F4A7C15) & self._mask
+        for _ in range(self.capacity):
+            off = _HEADER_BYTES + i * _REC.size
+            k = _KEY.unpack_from(self._map, off)[0]
+            if k == key:
+                self._offsets[pid] = off
+                return off
+            if k == 0:
+                return self._insert(pid, i) if create else None
+            i = (i + 1) & self._mask
+        return None
+
+    def _insert(self, pid: int, i: int) -> Optional[int]:
+        with self._locked():
+            count = _HEADER.unpack_from(self._map, 0)[3]
+            if count >= self.capacity * MAX_LOAD:
+                self.full_skips += 1
+                return None
+            key = pid + 1
+            while True:  # re-probe: another process may have inserted meanwhile
+                off = _HEADER_BYTES + i * _REC.size
+                k = _KEY.unpack_from(self._map, off)[0]
+                if k == key:
+                    break
+                if k == 0:
+                    _REC.pack_into(self._map, off, key, 0, 0, 0, 0, 0, 0, DEFAULT_STASH)
+                    _HEADER.pack_into(self._map, 0, MAGIC, VERSION, self.capacity, count + 1)
+                    break
+                i = (i + 1) & self._mask
+        self._offsets[pid] = off
+        return off
+
+    def _read(self, pid: int) -> Optional[tuple]:
+        off = self._offset(pid, create=False)
+        return _REC.unpack_from(self._map, off) if off is not None else None
+
+    # ─── Updates ─────────────────────────────────────────────────────
+
+    def observe_turn(self, gid: int, turn: int, my_id: int, enemies: Iterable,
+                     previous_attacks: Iterable, diplomacy: Iterable):
+        """Fold one combat turn into the profiles (call once per game turn).
+
+        previous_attacks are last turn's attacks; they are checked against
+        the alliances offered to us last turn (remembered per game).
+        """
+        levels = {e["playerId"]: e["level"] for e in enemies if e["hp"] > 0}
+        last = self._allied.get(gid)
+        allied_before = last[1] if last is not None and last[0] == turn - 1 else ()
+        hit_us = set()
+
+        for pa in previous_attacks:
+            act = pa.get("action", {}) or {}
+            troops = int(act.get("troopCount", 0) or 0)
+            pid = pa["playerId"]
+            if troops <= 0 or pid == my_id:
+                continue
+            off = self._offset(pid, create=True)
+            if off is None:
+                continue
+            key, turns, attacks, at_us, total, betrayals, kept, stash = _REC.unpack_from(self._map, off)
+            attacks += 1
+            total += troops
+            if act.get("targetId") == my_id:
+                at_us += 1
+                hit_us.add(pid)
+                if pid in allied_before:
+                    betrayals += 1
+            level = levels.get(pid)
+            if level is not None:
+                stash += STASH_ALPHA * (troops / res_per_turn(level) - stash)
+            _REC.pack_into(self._map, off, key, turns, attacks, at_us, total, betrayals, kept, stash)
+
+        for pid in allied_before:
+            if pid not in hit_us:
+                off = self._offset(pid, create=True)
+                if off is not None:
+                    self._add(off, 6, 1)  # kept
+        for pid in levels:
+            off = self._offset(pid, create=True)
+            if off is not None:
+                self._add(off, 1, 1)  # turns observed
+
+        self._allied[gid] = (turn, frozenset(
+            d["playerId"] for d in diplomacy if (d.get("action", {}) or {}).get("allyId") == my_id))
+        self._allied.move_to_end(gid)
+        if len(self._allied) > _GAMES:
+            self._allied.popitem(last=False)
+
+    def _add(self, off: int, field: int, n: int):
+        pos = off + field * 8
+        _KEY.pack_into(self._map, pos, _KEY.unpack_from(self._map, pos)[0] + n)
+
+    # ─── Reads (request path) ────────────────────────────────────────
+
+    def stash(self, pid: int) -> float:
+        """Turns of income this player typically commits to one attack."""
+        rec = self._read(pid)
+        return rec[7] if rec is not None else DEFAULT_STASH
+
+    def trust(self, pid: int) -> float:
+        """Share of alliances with us kept, with a 1-1 prior (0.5 if unknown)."""
+        rec = self._read(pid)
+        if rec is None:
+            return 0.5
+        return (rec[6] + 1) / (rec[6] + rec[5] + 2)
+
+    def profile(self, pid: int) -> Optional[Dict[str, float]]:
+        rec = self._read(pid)
+        return dict(zip(_FIELDS, rec[1:])) if rec is not None else None
+
+    def stats(self) -> Dict[str, int]:
+        return {"players": _HEADER.unpack_from(self._map, 0)[3], "capacity": self.capacity,
+                "full_skips": self.full_skips}
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        self._map.flush()
+        self._map.close()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def create_profiles() -> Optional[ProfileStore]:
+    """ProfileStore at KW_PROFILE_PATH, or None when profiles are off."""
+    path = os.getenv("KW_PROFILE_PATH", "")
+    return ProfileStore(path) if path else None
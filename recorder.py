@@ -0,0 +1,123 @@
+"""
+Opt-in traffic recorder for /negotiate and /combat.
+
+`record` only puts the request model, response and timings on a bounded
+queue; a background thread serializes them as JSON lines into append-only
+gzip segments and rotates to a new segment every `segment_records`
+records. When the writer falls behind, records are dropped (and counted)
+instead of delaying a turn response. `replay.py` reads the segments back.
+
+Env:
+    KW_RECORD_DIR=<dir>          enable recording into this directory
+    KW_RECORD_SEGMENT=5000       records per segment file
+    KW_RECORD_QUEUE=10000        max records buffered before dropping
+
+Record line:
+    {"t": <unix time>, "path": "/combat", "request": {...}, "response": [...],
+     "latency_ms": <endpoint total>, "strategy_ms": <strategy call only>}
+"""
+
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from typing import Iterator, Optional
+
+import kwlog
+
+SEGMENT_RECORDS = int(os.getenv("KW_RECORD_SEGMENT", "5000"))
+QUEUE_SIZE = int(os.getenv("KW_RECORD_QUEUE", "10000"))
+_STOP = object()
+
+
+class Recorder:
+    """Non-blocking request/response recorder writing gzip JSONL segments."""
+
+    def __init__(self, directory: str, segment_records: int = SEGMENT_RECORDS,
+                 queue_size: int = QUEUE_SIZE):
+        self.directory = directory
+        self.segment_records = segment_records
+        self._queue: queue.Queue = queue.Queue(queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._prefix = f"kw-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.recorded = 0
+        self.dropped = 0
+        self.segments = 0
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="kw-recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, path: str, request, response, latency: float, strategy_time: float):
+        """Queue one exchange; `request` may be a pydantic model (dumped later)."""
+        try:
+            self._queue.put_nowait((time.time(), path, request, response, latency, strategy_time))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Flush queued records and close the current segment."""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {"recorded": self.recorded, "dropped": self.dropped,
+                "queued": self._queue.qsize(), "segments": self.segments}
+
+    # ─── Writer thread ───────────────────────────────────────────────
+
+    def _open_segment(self):
+        self.segments += 1
+        name = os.path.join(self.directory, f"{self._prefix}-{self.segments:05d}.jsonl.gz")
+        return gzip.open(name, "at", encoding="utf-8")
+
+    def _run(self):
+        out, in_segment = None, 0
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            t, path, request, response, latency, strategy_time = item
+            try:
+                if out is None or in_segment >= self.segment_records:
+                    if out is not None:
+                        out.close()
+                    out, in_segment = self._open_segment(), 0
+                if hasattr(request, "model_dump"):
+                    request = request.model_dump(mode="json")
+                out.write(json.dumps({
+                    "t": round(t, 3), "path": path, "request": request, "response": response,
+                    "latency_ms": round(latency * 1000, 3),
+                    "strategy_ms": round(strategy_time * 1000, 3),
+                }, separators=(",", ":")) + "\n")
+                in_segment += 1
+                self.recorded += 1
+                # Drain bursts before flushing so a crash loses at most one batch
+                if self._queue.empty():
+                    out.flush()
+            except Exception as e:
+                kwlog.error("RECORDER", "%s", e)
+        if out is not None:
+            out.close()
+
+
+def read_segments(directory: str) -> Iterator[dict]:
+    """Records from every segment in `directory`, oldest segment first.
+
+    A segment cut short by a crash yields the records before the damage.
+    """
+    for name in sorted(glob.glob(os.path.join(directory, "*.jsonl.gz"))):
+        try:
+            with gzip.open(name, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        except (EOFError, OSError, zlib.error, json.JSONDecodeError) as e:
+            kwlog.warning("RECORDER", "Truncated segment %s: %s", name, e)
@@ -0,0 +1,149 @@
+"""
+Deterministic replay of recorded traffic (see recorder.py).
+
+Feeds every recorded /negotiate and /combat request, in recorded order,
+through the strategy engine at full speed. Each strategy module gets a
+fresh GameMemory, decision cache, config store and (when on) opponent
+profiles, so memory is rebuilt turn by turn exactly as the server built it
+and replaying the same records twice gives the same decisions. Reports decisions that differ and per-endpoint strategy latency.
+
+By default the current `strategy.py` is compared with the recorded
+responses and the recorded `strategy_ms`. With `--baseline OLD.py` both
+versions are replayed offline on the same machine, which is the fair
+latency comparison. Set KW_SEARCH_MS=0: the anytime search is deadline
+bound and not deterministic.
+
+Run: python replay.py RECORD_DIR [--baseline old_strategy.py] [--show 10]
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+import time
+from types import ModuleType
+from typing import Callable, Dict, Iterable, List, Optional
+
+import kwlog
+import metrics
+import strategy
+from cache import create_decisions
+from config import ConfigStore
+from profiles import ProfileStore
+from recorder import read_segments
+
+REGRESSION = 1.10  # flag when p50/p99 grow by more than 10%
+
+
+def load_strategy(path: str, name: str = "strategy_baseline") -> ModuleType:
+    """Import another strategy.py version as a separate module."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def fresh(module: ModuleType) -> ModuleType:
+    """Reset a strategy module's cross-request state for a replay run.
+
+    Game memory and the decision cache start empty, the strategy config is
+    read once (no hot reload mid-replay), and opponent profiles, when on,
+    move to an empty in-memory table so a replay neither reads nor updates
+    the live profile file. Attributes an older `--baseline` lacks are skipped.
+    """
+    module.memory = module.GameMemory()
+    if hasattr(module, "decisions"):
+        module.decisions = create_decisions()
+    if hasattr(module, "configs"):
+        module.configs = ConfigStore(os.getenv("KW_STRATEGY_CONFIG") or None, check_every=float("inf"))
+    if getattr(module, "profiles", None) is not None:
+        module.profiles = ProfileStore()
+    return module
+
+
+def call(module: ModuleType, rec: dict) -> List[Dict]:
+    req = rec["request"]
+    common = dict(gid=req["gameId"], turn=req["turn"], player=req["playerTower"],
+                  enemies=req["enemyTowers"])
+    if rec["path"] == "/negotiate":
+        return module.negotiate(combat_actions=req.get("combatActions", []), **common)
+    return module.combat(diplomacy=req.get("diplomacy", []),
+                         previous_attacks=req.get("previousAttacks", []), **common)
+
+
+def replay(records: Iterable[dict], module: ModuleType,
+           baseline: Optional[ModuleType] = None) -> dict:
+    """Replay records; return {"records", "diffs", "latency": {side: {path: Histogram}}}."""
+    fresh(module)
+    if baseline is not None:
+        fresh(baseline)
+    latency: Dict[str, Dict[str, metrics.Histogram]] = {"baseline": {}, "candidate": {}}
+    diffs = []
+    n = 0
+
+    def timed(side: str, path: str, fn: Callable[[], List[Dict]]) -> List[Dict]:
+        t0 = time.perf_counter()
+        out = fn()
+        latency[side].setdefault(path, metrics.Histogram()).record(time.perf_counter() - t0)
+        return out
+
+    for rec in records:
+        n += 1
+        path = rec["path"]
+        if baseline is not None:
+            want = timed("baseline", path, lambda: call(baseline, rec))
+        else:
+            want = rec["response"]
+            latency["baseline"].setdefault(path, metrics.Histogram()).record(rec["strategy_ms"] / 1000)
+        got = timed("candidate", path, lambda: call(module, rec))
+        if got != want:
+            req = rec["request"]
+            diffs.append({"path": path, "gameId": req["gameId"], "turn": req["turn"],
+                          "baseline": want, "candidate": got})
+    return {"records": n, "diffs": diffs, "latency": latency}
+
+
+def report(result: dict, show: int = 10, baseline_name: str = "recorded") -> bool:
+    """Print the replay report; True if there were no diffs or regressions."""
+    ok = True
+    print(f"records: {result['records']}   decision diffs: {len(result['diffs'])}")
+    for d in result["diffs"][:show]:
+        print(f"  {d['path']} game {d['gameId']} turn {d['turn']}")
+        print(f"    {baseline_name}: {d['baseline']}")
+        print(f"    candidate: {d['candidate']}")
+    ok &= not result["diffs"]
+
+    print(f"\n{'endpoint':<12} {'side':<10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for path, cand in sorted(result["latency"]["candidate"].items()):
+        base = result["latency"]["baseline"].get(path)
+        for side, h in ((baseline_name, base), ("candidate", cand)):
+            if h is not None:
+                s = h.summary()
+                print(f"{path:<12} {side:<10} {s['p50_ms']:>8.3f} {s['p99_ms']:>8.3f} {s['max_ms']:>8.3f}")
+        if base is not None:
+            for q in (0.5, 0.99):
+                if cand.quantile(q) > base.quantile(q) * REGRESSION:
+                    print(f"  REGRESSION {path} p{q * 100:g}: "
+                          f"{base.quantile(q) * 1000:.3f} -> {cand.quantile(q) * 1000:.3f} ms")
+                    ok = False
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("record_dir")
+    ap.add_argument("--baseline", help="older strategy.py to compare against (default: recorded responses)")
+    ap.add_argument("--show", type=int, default=10, help="diffs to print")
+    args = ap.parse_args()
+    if not os.path.isdir(args.record_dir):
+        ap.error(f"no such directory: {args.record_dir}")
+
+    kwlog.set_level(kwlog.logging.WARNING)  # decision logs would dominate the timings
+    baseline = load_strategy(args.baseline) if args.baseline else None
+    result = replay(read_segments(args.record_dir), strategy, baseline)
+    ok = report(result, args.show, "baseline" if baseline else "recorded")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
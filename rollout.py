@@ -0,0 +1,203 @@
+"""
+Monte Carlo rollout planner (NumPy): an alternative to `search.improve`.
+
+`improve` takes the heuristic plan and search's candidate plans, resolves
+each against KW_ROLLOUTS sampled opponent responses and keeps the plan with
+the best mean value: survival, then kills (eff HP + bonus), chip damage,
+our eff HP after the turn, banked resources and upgrade income. With
+KW_ROLLOUT_TURNS > 1 the sampled games continue under a fixed policy (take
+income, armor up to the expected damage, kill-shot the weakest enemy,
+fatigue on everyone) and a death in those turns is charged at
+DEATH x DEATH_DECAY^turn.
+
+Opponent model, from what GameMemory observed this game:
+- an enemy's expected troops at us per turn is its observed rate (troops it
+  sent at us / turns so far), blended with the heuristic threat estimate as
+  a PRIOR_TURNS-turn prior, so early turns lean on the heuristic
+- it attacks us on a turn with probability p = expected / full_stash
+  (clipped to [0.02, 1]) with full_stash x U(0.5, 1.5) troops, where
+  full_stash = two turns of its income
+- enemies do not buy armor or level up; their attacks on each other only
+  show up as attacks not aimed at us
+
+Horizon: in 800 4-player simulator games (KW_SEARCH_MS=20) one turn won
+59.1%, two 50.0%, three 51.9% (search.improve 49.1%, no search 4.2%); the
+fixed later-turn policy is too crude for its outcomes to help pick this
+turn's plan, so the default is 1.
+
+Candidates x rollouts x enemies are one (K, N, E) array per turn, and every
+candidate sees the same sampled futures (common random numbers), so the
+difference between two plans is not sampling noise. Candidates are scored
+in batches until the deadline; the heuristic plan is in the first batch, so
+a short budget falls back to it. Without numpy, `improve` returns the
+heuristic plan.
+
+Env (with KW_SEARCH_MS > 0 and KW_PLANNER=rollout):
+    KW_ROLLOUTS=128        sampled futures per candidate
+    KW_ROLLOUT_TURNS=1     turns simulated, including this one
+"""
+
+import os
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional (requirements-dev.txt): heuristic plan only
+    np = None
+
+import economy
+import search
+import strategy
+from economy import FATIGUE_TURN
+
+ROLLOUTS = int(os.getenv("KW_ROLLOUTS", "128"))
+HORIZON = max(1, int(os.getenv("KW_ROLLOUT_TURNS", "1")))
+BATCH = 16          # candidates per vectorized batch
+MAX_ENEMIES = 16    # modelled one by one; the rest only add incoming damage
+STASH = 2.0         # turns of income an enemy commits per attack
+MIN_P = 0.02        # even an idle enemy may attack
+PRIOR_TURNS = 2     # weight of the heuristic threat against the observed rate
+ARMOR_MARGIN = 10   # our later-turn armor policy keeps this much spare eff HP
+DEATH_DECAY = 0.1   # a death h turns ahead costs DEATH x DEATH_DECAY^h
+WIN = 2000.0        # our attacks leave no enemy standing
+
+
+def _hp_value(eff):
+    return 2.0 * np.minimum(eff, 60.0) + 0.25 * np.maximum(0.0, eff - 60.0)
+
+
+class _Model:
+    """Sampled futures for one turn state, shared by every candidate."""
+
+    def __init__(self, s: "search.TurnState", rollouts: int, horizon: int):
+        ranked = sorted(s.enemies, key=lambda e: e.score, reverse=True)
+        kept, rest = ranked[:MAX_ENEMIES], ranked[MAX_ENEMIES:]
+        self.pids = [e.pid for e in kept]
+        self.eff = np.array([e.eff_hp for e in kept], dtype=np.float64)
+        self.threat = np.array([e.threat for e in kept], dtype=np.float64)
+        res = np.array(economy.RES_PER_TURN, dtype=np.float64)
+        full = res[np.clip([e.level for e in kept], 1, economy.MAX_LEVEL)] * STASH
+        seen = max(0, s.turn - 1)  # turns whose attacks are in GameMemory
+        agg = np.array([e.agg for e in kept], dtype=np.float64)
+        self.threat = (agg + self.threat * PRIOR_TURNS) / (seen + PRIOR_TURNS)
+        p = np.clip(self.threat / full, MIN_P, 1.0)
+
+        rng = np.random.default_rng(hash((s.turn, s.hp, s.armor, s.res, s.level)) & 0xFFFFFFFF)
+        shape = (horizon, rollouts, len(kept))
+        self.incoming = (rng.random(shape) < p) * full * rng.uniform(0.5, 1.5, shape)
+        # Enemies beyond MAX_ENEMIES: their expected damage every turn
+        self.background = sum((e.agg + e.threat * PRIOR_TURNS) / (seen + PRIOR_TURNS) for e in rest)
+        self.fatigue = [economy.fatigue_damage(s.turn + h) for h in range(horizon)]
+        self.res = res
+
+    def evaluate(self, plans: List["search.Plan"], s: "search.TurnState") -> "np.ndarray":
+        """Mean rollout value of each plan, shape (K,)."""
+        K, E = len(plans), len(self.pids)
+        H, N = self.incoming.shape[:2]
+        col = {pid: j for j, pid in enumerate(self.pids)}
+        up = np.array([p[0] for p in plans])
+        arm = np.array([p[1] for p in plans], dtype=np.float64)
+        troops = np.zeros((K, E))
+        sent = np.zeros(K)  # also troops at enemies beyond MAX_ENEMIES
+        for k, (_, _, attacks) in enumerate(plans):
+            for pid, x in attacks:
+                sent[k] += x
+                if pid in col:
+                    troops[k, col[pid]] += x
+        spent = arm + sent + np.where(up, economy.upg_cost(s.level), 0)
+        level = s.level + up
+
+        # Turn 0: our plan and the sampled enemy attacks resolve together
+        killed = troops >= self.eff
+        value = ((self.eff + search.KILL_BONUS) * killed).sum(axis=1) + 0.5 * (troops * ~killed).sum(axis=1)
+        enemy = np.broadcast_to(np.where(killed, 0.0, self.eff - troops)[:, None, :], (K, N, E)).copy()
+        alive = np.broadcast_to(~killed[:, None, :], (K, N, E)).copy()
+        eff = (s.hp + s.armor + arm)[:, None] - self.incoming[0].sum(axis=1)[None, :] \
+            - self.background - self.fatigue[0]
+        bank = np.broadcast_to((s.res - spent)[:, None], (K, N)).copy()
+        died = np.where(eff <= 0, 0, H)
+        # Valued at the end of this turn; later turns only add the risk of dying
+        now = _hp_value(eff) + bank + WIN * ~alive.any(axis=2)
+        rows = np.arange(K)[:, None], np.arange(N)[None, :]
+
+        # Later turns: fixed policy against the same sampled attacks
+        for h in range(1, H):
+            bank += self.res[level][:, None]
+            expected = (alive * self.threat).sum(axis=2) + self.background + self.fatigue[h]
+            armor = np.minimum(bank, np.maximum(0.0, np.floor(expected + ARMOR_MARGIN - eff)))
+            eff += armor
+            bank -= armor
+            incoming = (alive * self.incoming[h]).sum(axis=2)
+            if E:
+                # Kill-shot the weakest enemy if affordable (it stops attacking)
+                j = np.where(alive, enemy, np.inf).argmin(axis=2)
+                target = enemy[rows + (j,)]
+                shot = alive[rows + (j,)] & (target <= bank)
+                bank -= np.where(shot, target, 0.0)
+                alive[rows + (j,)] &= ~shot
+            eff -= incoming + self.background + self.fatigue[h]
+            enemy -= self.fatigue[h]
+            alive &= enemy > 0
+            died = np.where((eff <= 0) & (died == H), h, died)
+
+        gain = (self.res[level] - self.res[s.level]) * max(0, FATIGUE_TURN + 5 - s.turn)
+        outcome = np.where(died == 0, search.DEATH, now)
+        outcome += np.where((died > 0) & (died < H), search.DEATH * DEATH_DECAY ** died, 0.0)
+        return value + gain + outcome.mean(axis=1)
+
+
+def _plans(heuristic: "search.Plan", s: "search.TurnState"):
+    """Heuristic plan first, then search's candidates (affordable, distinct)."""
+    yield heuristic
+    seen = {heuristic}
+    for plan in search._candidates(s):
+        if plan not in seen:
+            seen.add(plan)
+            yield plan
+
+
+def improve(actions: List[Dict], s: "search.TurnState", deadline: float,
+            alive_ids, validate=None, rollouts: int = None,
+            horizon: int = None) -> Tuple[List[Dict], Dict[str, float]]:
+    """Best validated plan by mean rollout value before `deadline` (perf_counter).
+
+    Same contract as `search.improve`; info has the candidates scored, the
+    rollouts per candidate, the value gain over the heuristic plan and
+    whether every candidate was scored.
+    """
+    validate = validate or strategy._validate
+    best = validate(actions, s.res, s.level, alive_ids)
+    if np is None:
+        return best, {"candidates": 0, "rollouts": 0, "gain": 0.0, "complete": True}
+    heuristic = search._from_actions(best)
+    model = _Model(s, rollouts or ROLLOUTS, horizon or HORIZON)
+    plans = _plans(heuristic, s)
+    best_plan, best_value, base_value, tried, complete = heuristic, None, None, 0, False
+    while True:
+        batch = [p for _, p in zip(range(BATCH), plans)]
+        if not batch:
+            complete = True
+            break
+        values = model.evaluate(batch, s)
+        if base_value is None:
+            base_value = best_value = values[0]
+        k = int(values.argmax())
+        if values[k] > best_value:
+            best_plan, best_value = batch[k], values[k]
+        tried += len(batch)
+        if len(batch) < BATCH:
+            complete = True
+            break
+        if perf_counter() >= deadline:
+            complete = next(plans, None) is None
+            break
+
+    if best_plan != heuristic:
+        cand = validate(search._to_actions(best_plan), s.res, s.level, alive_ids)
+        if search._from_actions(cand) == best_plan:  # only accept plans that survive validation
+            best = cand
+        else:
+            best_value = base_value
+    return best, {"candidates": tried, "rollouts": model.incoming.shape[1],
+                  "gain": float(best_value - base_value), "complete": complete}
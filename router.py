@@ -0,0 +1,198 @@
+"""
+Game-affinity router: pin every gameId to one strategy worker process.
+
+The front-end (one uvicorn worker) parses requests and forwards the strategy
+call over a pipe to worker `hash(gameId) % N`. Every turn of a game hits the
+same worker, so its `GameMemory` stays hot in one process with no locking
+or shared-storage round-trips, while N workers use N cores.
+
+Enable with KW_ROUTER_WORKERS=N (0 = run strategy inline, the default).
+The same pool also serves KW_EXECUTOR=offload (see server.py), where only
+the plan refinement of each combat turn is sent to the game's worker.
+"""
+
+import asyncio
+import itertools
+import multiprocessing as mp
+import threading
+from typing import Any, Dict, List, Optional
+
+import kwlog
+
+
+def _worker_main(conn, index: int = 0, n: int = 1, snapshots: bool = True):
+    """Strategy worker loop: (req_id, fn, args, kwargs) in, (req_id, ok, result) out."""
+    from time import monotonic, perf_counter
+
+    import metrics
+    import snapshot
+    import strategy
+
+    # Resume the games that route here from the last snapshot (any worker's);
+    # off when the front-end owns game memory (offload executor)
+    snap = None
+    if snapshots:
+        snap = snapshot.create(strategy.memory, f"{snapshot.PATH}.w{index}" if snapshot.PATH else "")
+    if snap is not None:
+        snap.restore(snapshot.worker_files(snapshot.PATH), keep=lambda gid: game_slot(gid, n) == index)
+
+    def snapshot_call(op):
+        """save | stats, on this worker's snapshot (None when snapshots are off)."""
+        if snap is None:
+            return None
+        return snap.save() if op == "save" else snap.stats()
+
+    def memory_call(name, *args):
+        return getattr(strategy.memory, name)(*args)
+
+    def refine(actions, state, deadline):
+        """Improve an inline heuristic plan until `deadline` (time.monotonic,
+        comparable across processes); a request that waited past it in the
+        queue is returned as-is, the front-end has already moved on.
+        Returns (actions, whether the search was complete)."""
+        start = perf_counter()
+        budget = deadline - monotonic()
+        if budget <= 0:
+            metrics.incr("offload:stale")
+            return actions, False
+        result, info = strategy.refine(actions, state, start + budget)
+        metrics.lap("phase:search", start)
+        return result, info["complete"]
+
+    calls = {
+        "negotiate": strategy.negotiate,
+        "combat": strategy.combat,
+        "refine": refine,
+        "memory": memory_call,
+        "snapshot": snapshot_call,
+        "metrics": metrics.snapshot,
+        "reset_metrics": metrics.reset,
+    }
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        if msg is None:
+            break
+        req_id, fn, args, kwargs = msg
+        try:
+            conn.send((req_id, True, calls[fn](*args, **kwargs)))
+        except Exception as e:
+            conn.send((req_id, False, f"{type(e).__name__}: {e}"))
+    strategy.memory.cleanup()
+    if snap is not None:
+        snap.close()
+
+
+def game_slot(gid: int, n: int) -> int:
+    """Stable gameId -> worker index (Fibonacci hashing spreads sequential ids)."""
+    return ((int(gid) * 0x9E3779B1) & 0xFFFFFFFF) * n >> 32
+
+
+class _Worker:
+    def __init__(self, ctx, index: int, n: int, snapshots: bool = True):
+        self.index = index
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child, index, n, snapshots),
+                                name=f"kw-strategy-{index}", daemon=True)
+        self.proc.start()
+        child.close()
+        self.send_lock = threading.Lock()
+        self.pending: Dict[int, tuple] = {}
+        self.reader = threading.Thread(target=self._read, daemon=True,
+                                       name=f"kw-router-{index}")
+        self.reader.start()
+
+    def _read(self):
+        while True:
+            try:
+                req_id, ok, result = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            entry = self.pending.pop(req_id, None)
+            if entry is None:
+                continue
+            loop, fut = entry
+            loop.call_soon_threadsafe(_resolve, fut, ok, result)
+        # Worker is gone: fail everything still waiting on it
+        for loop, fut in list(self.pending.values()):
+            loop.call_soon_threadsafe(_resolve, fut, False, "strategy worker exited")
+        self.pending.clear()
+
+    def send(self, msg):
+        with self.send_lock:
+            self.conn.send(msg)
+
+    def close(self, timeout: float = 2.0):
+        try:
+            self.send(None)
+        except (OSError, ValueError):
+            pass
+        self.proc.join(timeout)
+        if self.proc.is_alive():
+            self.proc.terminate()
+        self.conn.close()
+
+
+def _resolve(fut: asyncio.Future, ok: bool, result: Any):
+    if fut.done():
+        return
+    if ok:
+        fut.set_result(result)
+    else:
+        fut.set_exception(RuntimeError(result))
+
+
+class AffinityRouter:
+    """Pool of strategy processes addressed by gameId."""
+
+    def __init__(self, workers: int, snapshots: bool = True):
+        self.n = max(1, int(workers))
+        self.snapshots = snapshots  # workers own game memory and snapshot it
+        self._ctx = mp.get_context("spawn")
+        self._workers: List[Optional[_Worker]] = [None] * self.n
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.n):
+            self._workers[i] = _Worker(self._ctx, i, self.n, self.snapshots)
+
+    def _worker(self, i: int) -> _Worker:
+        w = self._workers[i]
+        if w is None or not w.proc.is_alive():
+            with self._lock:
+                w = self._workers[i]
+                if w is None or not w.proc.is_alive():
+                    if w is not None:
+                        kwlog.warning("ROUTER", "Restarting strategy worker %s", i)
+                    w = self._workers[i] = _Worker(self._ctx, i, self.n, self.snapshots)
+        return w
+
+    async def call(self, gid: int, fn: str, /, *args, **kwargs) -> Any:
+        """Run `fn` in the worker that owns `gid` and await its result."""
+        return await self._submit(self._worker(game_slot(gid, self.n)), fn, args, kwargs)
+
+    async def broadcast(self, fn: str, /, *args, **kwargs) -> List[Any]:
+        """Run `fn` on every worker (e.g. memory stats); one result per worker."""
+        return list(await asyncio.gather(
+            *(self._submit(self._worker(i), fn, args, kwargs) for i in range(self.n))))
+
+    async def _submit(self, w: _Worker, fn: str, args: tuple, kwargs: dict) -> Any:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        req_id = next(self._ids)
+        w.pending[req_id] = (loop, fut)
+        try:
+            w.send((req_id, fn, args, kwargs))
+        except (OSError, ValueError):
+            w.pending.pop(req_id, None)
+            raise
+        return await fut
+
+    def close(self):
+        for w in self._workers:
+            if w is not None:
+                w.close()
+        self._workers = [None] * self.n
@@ -0,0 +1,169 @@
+"""
+Anytime combat planner.
+
+`strategy.combat` produces one heuristic plan. When a search budget is set
+(KW_SEARCH_MS, e.g. 150), `improve` starts from that plan and scores
+alternative armor / upgrade / attack-split combinations with a one-turn
+lookahead model until the deadline, returning the best `_validate`d plan
+found. The heuristic plan is always scored first, so running out of time
+can only cost the improvement, never validity.
+
+Lookahead model (all terms in resource-equivalents):
+- survive this turn: hp + armor + new armor vs predicted damage + fatigue;
+  dying is scored as a large loss
+- effective HP is worth more while low (first 60 points x2, then x0.25)
+- next turn's exposure: fatigue of turn+1 minus the threat of enemies we kill
+- upgrade: income gain x turns left before fatigue takes over
+- attacks: troops that land are worth 0.5; a kill is worth its eff HP plus
+  a bonus and removes that enemy's threat
+- unspent resources carry over at face value
+"""
+
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import strategy
+from economy import FATIGUE_TURN, MAX_LEVEL, fatigue_damage, res_per_turn, upg_cost
+
+DEATH = -10_000.0
+KILL_BONUS = 300.0
+
+
+class Enemy(NamedTuple):
+    pid: int
+    eff_hp: int      # hp + armor
+    threat: float    # predicted troops it sends at us
+    score: float     # heuristic target_score (used to order candidates)
+    level: int = 1   # tower level (income when rollouts model its attacks)
+    agg: int = 0     # troops it sent at us so far this game (GameMemory)
+
+
+class TurnState(NamedTuple):
+    turn: int
+    hp: int
+    armor: int
+    res: int
+    level: int
+    incoming: float  # predicted enemy damage this turn (top-2, with margin)
+    enemies: Tuple[Enemy, ...]
+    key: Any = None  # decision-cache key the refined plan is stored under (cache.py)
+
+
+Plan = Tuple[bool, int, Tuple[Tuple[int, int], ...]]  # (upgrade, armor, ((pid, troops), ...))
+
+
+def _hp_value(eff: float) -> float:
+    return 2.0 * min(eff, 60.0) + 0.25 * max(0.0, eff - 60.0)
+
+
+def evaluate(plan: Plan, s: TurnState) -> float:
+    """One-turn lookahead value of a plan (higher is better)."""
+    upgrade, armor, attacks = plan
+    spent = armor + sum(x for _, x in attacks)
+    level = s.level
+    value = 0.0
+    if upgrade:
+        spent += upg_cost(level)
+        turns_left = max(0, FATIGUE_TURN + 5 - s.turn)
+        value += (res_per_turn(level + 1) - res_per_turn(level)) * turns_left
+        level += 1
+    if spent > s.res:
+        return float("-inf")
+
+    eff = s.hp + s.armor + armor - s.incoming - fatigue_damage(s.turn)
+    if eff <= 0:
+        return DEATH + eff
+
+    by_pid = {e.pid: e for e in s.enemies}
+    removed_threat = 0.0
+    for pid, troops in attacks:
+        e = by_pid[pid]
+        if troops >= e.eff_hp:
+            value += e.eff_hp + KILL_BONUS
+            removed_threat += e.threat
+        else:
+            value += 0.5 * troops
+
+    next_eff = eff - max(0.0, s.incoming - removed_threat) - fatigue_damage(s.turn + 1)
+    value += _hp_value(eff) + 0.5 * _hp_value(next_eff)
+    value += s.res - spent  # banked resources
+    return value
+
+
+def _to_actions(plan: Plan) -> List[Dict]:
+    upgrade, armor, attacks = plan
+    actions: List[Dict] = []
+    if upgrade: actions.append({"type": "upgrade"})
+    if armor > 0: actions.append({"type": "armor", "amount": armor})
+    for pid, troops in attacks:
+        if troops > 0:
+            actions.append({"type": "attack", "targetId": pid, "troopCount": troops})
+    return actions
+
+
+def _from_actions(actions: List[Dict]) -> Plan:
+    upgrade = any(a["type"] == "upgrade" for a in actions)
+    armor = sum(a["amount"] for a in actions if a["type"] == "armor")
+    attacks = tuple((a["targetId"], a["troopCount"]) for a in actions if a["type"] == "attack")
+    return upgrade, armor, attacks
+
+
+def _candidates(s: TurnState) -> Iterator[Plan]:
+    """Plans roughly in order of promise, so early deadlines still help."""
+    targets = sorted(s.enemies, key=lambda e: e.score, reverse=True)[:4]
+    can_upgrade = s.level < MAX_LEVEL and s.res >= upg_cost(s.level)
+    exposure = s.incoming + fatigue_damage(s.turn)
+
+    for upgrade in ((True, False) if can_upgrade else (False,)):
+        budget = s.res - (upg_cost(s.level) if upgrade else 0)
+        need = max(0, int(exposure - (s.hp + s.armor)) + 1)
+        armors = sorted({0, min(budget, need), min(budget, need + 10), min(budget, need + 25),
+                         budget // 4, budget // 2}, key=lambda a: abs(a - need))
+        for armor in armors:
+            left = budget - armor
+            if left <= 0:
+                yield upgrade, armor, ()
+                continue
+            # Single target: exact kill shots first, then everything on one
+            for e in targets:
+                if e.eff_hp <= left:
+                    yield upgrade, armor, ((e.pid, e.eff_hp),)
+            for e in targets:
+                yield upgrade, armor, ((e.pid, left),)
+            # Two targets: kill one and dump the rest, or fixed splits
+            for i, a in enumerate(targets):
+                for b in targets[i + 1:]:
+                    if a.eff_hp < left:
+                        yield upgrade, armor, ((a.pid, a.eff_hp), (b.pid, left - a.eff_hp))
+                    if b.eff_hp < left:
+                        yield upgrade, armor, ((b.pid, b.eff_hp), (a.pid, left - b.eff_hp))
+                    for share in (0.5, 0.7):
+                        x = int(left * share)
+                        if 0 < x < left:
+                            yield upgrade, armor, ((a.pid, x), (b.pid, left - x))
+            yield upgrade, armor, ()
+
+
+def improve(actions: List[Dict], s: TurnState, deadline: float,
+            alive_ids, validate=None) -> Tuple[List[Dict], Dict[str, float]]:
+    """Best validated plan found before `deadline` (perf_counter seconds).
+
+    Returns (actions, info) where info has the evaluated candidate count,
+    the value gain over the heuristic plan and whether every candidate was
+    scored (`complete`, False when the deadline cut the search short).
+    """
+    validate = validate or strategy._validate
+    best = validate(actions, s.res, s.level, alive_ids)
+    best_value = base_value = evaluate(_from_actions(best), s)
+    tried, complete = 0, True
+    for plan in _candidates(s):
+        if perf_counter() >= deadline:
+            complete = False
+            break
+        tried += 1
+        v = evaluate(plan, s)
+        if v > best_value:
+            cand = validate(_to_actions(plan), s.res, s.level, alive_ids)
+            if _from_actions(cand) == plan:  # only accept plans that survive validation
+                best, best_value = cand, v
+    return best, {"candidates": tried, "gain": best_value - base_value, "complete": complete}
@@ -1,46 +1,213 @@
 """Kingdom Wars Bot — FastAPI Server (Optimized)"""
 
-import sys
+import asyncio
+import json
+import os
+from time import monotonic, perf_counter
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response
+from pydantic import ValidationError
 from models import NegotiateRequest, CombatRequest
+import kwlog
+import metrics
+import snapshot
 import strategy
+import warmup
+from cache import RETRY_SIZE, RetryCache
+
+try:
+    import orjson
+
+    def dumps(content) -> bytes:
+        return orjson.dumps(content)
+except ImportError:  # stdlib fallback, same wire format
+    def dumps(content) -> bytes:
+        return json.dumps(content, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+class FastJSONResponse(Response):
+    """JSON encoded once straight to bytes (no jsonable_encoder pass)."""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
 
 app = FastAPI(
     title="Kingdom Wars Bot - Apex Predator",
-    version="2.0"
+    version="2.0",
+    default_response_class=FastJSONResponse,
 )
 
 TEAM_NAME = "Apex Predator"
+GAME_ENDPOINTS = ["/negotiate", "/combat"]
+
+# Where strategy runs (KW_EXECUTOR):
+#   inline  - on the event loop (default without workers)
+#   router  - every call in the game's pinned worker process (default with
+#             KW_ROUTER_WORKERS > 0)
+#   offload - the heuristic inline, its KW_SEARCH_MS refinement in the game's
+#             worker under a deadline; a late or failed refinement falls back
+#             to the inline plan, so a slow game never holds the event loop
+ROUTER_WORKERS = int(os.getenv("KW_ROUTER_WORKERS", "0"))
+EXECUTOR = os.getenv("KW_EXECUTOR", "router" if ROUTER_WORKERS > 0 else "inline")
+if EXECUTOR not in ("inline", "router", "offload"):
+    raise ValueError(f"KW_EXECUTOR must be inline, router or offload, not {EXECUTOR!r}")
+OFFLOAD_SLACK_MS = float(os.getenv("KW_OFFLOAD_SLACK_MS", "20"))  # IPC allowance past the budget
+router = None
+if EXECUTOR != "inline":
+    from router import AffinityRouter  # multiprocessing is only imported when used
+    router = AffinityRouter(ROUTER_WORKERS or 2, snapshots=EXECUTOR == "router")
+
+# Traffic recording for replay.py (off unless KW_RECORD_DIR is set)
+RECORD_DIR = os.getenv("KW_RECORD_DIR", "")
+recorder = None
+if RECORD_DIR:
+    from recorder import Recorder
+    recorder = Recorder(RECORD_DIR)
+
+# /healthz answers 503 until the startup warm-up has run (warmup.py)
+ready = not warmup.ENABLED
+
+# Responses to recent game calls by raw body: a retried turn is answered
+# without parsing or re-recording its intel (KW_RETRY_CACHE, 0 = off)
+retries = RetryCache(RETRY_SIZE) if RETRY_SIZE > 0 else None
+
+# Game-memory snapshots for warm restarts (off unless KW_SNAPSHOT_PATH is
+# set); with router workers every worker snapshots its own games
+snapshots = snapshot.create(strategy.memory) if EXECUTOR != "router" else None
+_snapshot_task = None
+
+
+async def run_strategy(fn: str, gid: int, **kwargs):
+    """Call strategy.<fn> inline, or in the worker that owns this game."""
+    if EXECUTOR == "router":
+        return await router.call(gid, fn, gid=gid, **kwargs)
+    if EXECUTOR == "offload" and fn == "combat":
+        return await offload_combat(gid, **kwargs)
+    return getattr(strategy, fn)(gid=gid, **kwargs)
+
 
+async def offload_combat(gid: int, **kwargs):
+    """Heuristic plan inline, search refinement in the game's worker.
 
-# ─── Logging middleware ──────────────────────────────────────────────
+    Game memory stays in this process (the heuristic owns it); the worker
+    only gets the pure TurnState, so a timeout loses the improvement, never
+    intel. The deadline is the same KW_SEARCH_MS budget the inline search
+    uses, measured from here.
+    """
+    start = perf_counter()
+    deadline = monotonic() + strategy.SEARCH_MS / 1000
+    result, state = strategy.plan_combat(gid, with_state=strategy.SEARCH_MS > 0, **kwargs)
+    if state is not None:
+        try:
+            result, complete = await asyncio.wait_for(
+                router.call(gid, "refine", result, state, deadline),
+                deadline - monotonic() + OFFLOAD_SLACK_MS / 1000)
+            metrics.incr("offload:refined")
+            if complete:
+                strategy.remember(state, result)
+        except asyncio.TimeoutError:
+            metrics.incr("offload:timeout")
+        except Exception as e:
+            kwlog.error("OFFLOAD", "Refinement failed, using heuristic plan: %s", e, gameId=gid)
+            metrics.incr("offload:errors")
+    if strategy.configs.split:
+        metrics.observe(f"variant:{strategy.configs.for_game(gid).name}:combat", perf_counter() - start)
+    return result
 
-@app.middleware("http")
-async def kw_log(request: Request, call_next):
-    """Required logging for game system."""
-    print("[KW-BOT] Mega ogudor", flush=True)
-    return await call_next(request)
 
+# ─── Middleware ──────────────────────────────────────────────────────
 
-# ─── Error handling middleware ───────────────────────────────────────
+class KWMiddleware:
+    """Required logging marker, per-endpoint latency/counts, never-crash guard.
 
-@app.middleware("http")
-async def error_handler(request: Request, call_next):
-    """Ensure we never crash - return empty actions on error."""
+    Plain ASGI (no BaseHTTPMiddleware task/stream wrapping): one function
+    call around the app per request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        # The game system requires this marker synchronously on every request;
+        # everything else goes through the buffered kwlog writer. Warm-up
+        # requests (warmup.py) are not the game system's and go unmarked.
+        synthetic = scope.get("kw_synthetic", False)
+        if not synthetic:
+            print("[KW-BOT] Mega ogudor", flush=True)
+        start = scope["kw_start"] = perf_counter()
+        path = scope["path"]
+        measured = path in GAME_ENDPOINTS and not synthetic
+        status = 500
+        started = False
+
+        async def send_wrapper(message):
+            nonlocal status, started
+            if message["type"] == "http.response.start":
+                status, started = message["status"], True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            kwlog.error("ERROR", "%s", e, path=path)
+            if started:
+                raise
+            # Return empty action list on any error
+            status = 200
+            if measured:
+                metrics.incr(f"errors:{path}")
+            await FastJSONResponse([])(scope, receive, send)
+        if measured:
+            metrics.observe(f"endpoint:{path}", perf_counter() - start)
+            metrics.incr(f"requests:{path}")
+            if status >= 400:
+                metrics.incr(f"errors:{path}")
+
+
+app.add_middleware(KWMiddleware)
+
+
+def parse(body: bytes, model):
+    """Validate the raw body straight into `model` (JSON parsed in pydantic-core).
+
+    Returns the model, or a 422 response in FastAPI's error format.
+    """
     try:
-        return await call_next(request)
-    except Exception as e:
-        print(f"[ERROR] {e}", file=sys.stderr, flush=True)
-        # Return empty action list on any error
-        return JSONResponse(content=[], status_code=200)
+        return model.model_validate_json(body)
+    except ValidationError as e:
+        errors = [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)]
+        return Response(json.dumps({"detail": errors}, default=str),
+                        status_code=422, media_type="application/json")
+
+
+async def claim_retry(request: Request, body: bytes):
+    """(cached response or None, retry-cache key or None) for a game call."""
+    if retries is None:
+        return None, None
+    key = retries.key(request.url.path, body)
+    raw = await retries.claim(key)
+    return (Response(raw, media_type="application/json") if raw is not None else None), key
+
+
+def respond(result: list, key) -> Response:
+    """Encode once (skips jsonable_encoder) and keep it for retries."""
+    raw = dumps(result)
+    if key is not None:
+        retries.put(key, raw)
+    return Response(raw, media_type="application/json")
 
 
 # ─── Endpoints ───────────────────────────────────────────────────────
 
 @app.get("/healthz")
 async def healthz():
-    """Health check endpoint."""
+    """Health check endpoint (503 until the startup warm-up is done)."""
+    if not ready:
+        return FastJSONResponse({"status": "WARMING_UP"}, status_code=503)
     return {"status": "OK"}
 
 
@@ -54,60 +221,145 @@ async def info():
     }
 
 
+@app.get("/memory")
+async def memory_stats():
+    """Live game count and eviction counters (summed over strategy workers)."""
+    if EXECUTOR != "router":  # offload keeps game memory in this process
+        return strategy.memory.stats()
+    total: dict = {}
+    for stats in await router.broadcast("memory", "stats"):
+        for k, v in stats.items():
+            total[k] = total.get(k, 0) + v
+    return total
+
+
+@app.get("/metrics")
+async def metrics_report():
+    """p50/p99 latency per endpoint and strategy phase, counts, live games."""
+    snapshots = [metrics.snapshot()]
+    if router is not None:
+        snapshots += await router.broadcast("metrics")
+    mem = await memory_stats()
+    return {
+        **metrics.report(metrics.merge(snapshots), GAME_ENDPOINTS),
+        "games": mem["games"],
+        "memory": mem,
+        "log": kwlog.stats(),
+        **({"snapshot": await snapshot_stats()} if snapshot.PATH else {}),
+        **({"recorder": recorder.stats()} if recorder is not None else {}),
+    }
+
+
+async def snapshot_stats():
+    if EXECUTOR == "router":
+        return [s for s in await router.broadcast("snapshot", "stats") if s is not None]
+    return snapshots.stats() if snapshots is not None else {}
+
+
+async def snapshot_loop():
+    """Snapshot game memory every KW_SNAPSHOT_EVERY seconds.
+
+    Encoding runs on the thread that owns the memory (here, or each worker's
+    loop), so it never sees a half-applied turn; the write is in a thread.
+    """
+    while True:
+        await asyncio.sleep(snapshot.EVERY)
+        try:
+            if EXECUTOR == "router":
+                await router.broadcast("snapshot", "save")
+            else:
+                snapshots.save()
+        except Exception as e:
+            kwlog.error("SNAPSHOT", "%s", e)
+
+
+@app.get("/config")
+async def config_report():
+    """Active strategy parameters, variants and their gameId split."""
+    return strategy.configs.describe()
+
+
 @app.post("/negotiate")
-async def negotiate(req: NegotiateRequest):
+async def negotiate(request: Request):
     """Negotiation phase - return diplomatic proposals."""
+    start = request.scope.get("kw_start", perf_counter())
+    body = await request.body()
+    cached, key = await claim_retry(request, body)
+    if cached is not None:
+        return cached  # retried turn: same answer, intel not recorded twice
     try:
-        player = req.playerTower.model_dump()
-        enemies = [e.model_dump() for e in req.enemyTowers]
-        actions = [a.model_dump() for a in req.combatActions]
-
-        result = strategy.negotiate(
-            gid=req.gameId,
-            turn=req.turn,
-            player=player,
-            enemies=enemies,
-            combat_actions=actions,
-        )
-        
-        # Ensure valid response
-        if not isinstance(result, list):
+        req = parse(body, NegotiateRequest)
+        if isinstance(req, Response):
+            return req
+        # Time from middleware entry to here = routing + body parse + validation
+        called = metrics.lap("phase:parse", start)
+        try:
+            # Validated models go straight to strategy (no model_dump round-trip)
+            result = await run_strategy(
+                "negotiate",
+                gid=req.gameId,
+                turn=req.turn,
+                player=req.playerTower,
+                enemies=req.enemyTowers,
+                combat_actions=req.combatActions,
+            )
+
+            # Ensure valid response
+            if not isinstance(result, list):
+                result = []
+            if recorder is not None:
+                done = perf_counter()
+                recorder.record(request.url.path, req, result, done - start, done - called)
+            return respond(result, key)
+
+        except Exception as e:
+            kwlog.error("NEGOTIATE ERROR", "%s", e, gameId=req.gameId, turn=req.turn)
+            metrics.incr("errors:/negotiate")
             return []
-        
-        return result
-    
-    except Exception as e:
-        print(f"[NEGOTIATE ERROR] {e}", file=sys.stderr, flush=True)
-        return []
+    finally:
+        if key is not None:
+            retries.release(key)
 
 
 @app.post("/combat")
-async def combat(req: CombatRequest):
+async def combat(request: Request):
     """Combat phase - return actions (armor/attack/upgrade)."""
+    start = request.scope.get("kw_start", perf_counter())
+    body = await request.body()
+    cached, key = await claim_retry(request, body)
+    if cached is not None:
+        return cached
     try:
-        player = req.playerTower.model_dump()
-        enemies = [e.model_dump() for e in req.enemyTowers]
-        diplo = [d.model_dump() for d in req.diplomacy]
-        prev = [p.model_dump() for p in req.previousAttacks]
-
-        result = strategy.combat(
-            gid=req.gameId,
-            turn=req.turn,
-            player=player,
-            enemies=enemies,
-            diplomacy=diplo,
-            previous_attacks=prev,
-        )
-        
-        # Ensure valid response
-        if not isinstance(result, list):
+        req = parse(body, CombatRequest)
+        if isinstance(req, Response):
+            return req
+        called = metrics.lap("phase:parse", start)
+        try:
+            result = await run_strategy(
+                "combat",
+                gid=req.gameId,
+                turn=req.turn,
+                player=req.playerTower,
+                enemies=req.enemyTowers,
+                diplomacy=req.diplomacy,
+                previous_attacks=req.previousAttacks,
+            )
+
+            # Ensure valid response
+            if not isinstance(result, list):
+                result = []
+            if recorder is not None:
+                done = perf_counter()
+                recorder.record(request.url.path, req, result, done - start, done - called)
+            return respond(result, key)
+
+        except Exception as e:
+            kwlog.error("COMBAT ERROR", "%s", e, gameId=req.gameId, turn=req.turn)
+            metrics.incr("errors:/combat")
             return []
-        
-        return result
-    
-    except Exception as e:
-        print(f"[COMBAT ERROR] {e}", file=sys.stderr, flush=True)
-        return []
+    finally:
+        if key is not None:
+            retries.release(key)
 
 
 # ─── Startup / Shutdown ──────────────────────────────────────────────
@@ -115,15 +367,77 @@ async def combat(req: CombatRequest):
 @app.on_event("startup")
 async def startup():
     """Bot initialization."""
-    print("[STARTUP] Apex Predator Bot initialized", flush=True)
-    print("[STARTUP] Strategy: Elite multi-factor prediction with trust system", flush=True)
+    kwlog.info("STARTUP", "Apex Predator Bot initialized")
+    kwlog.info("STARTUP", "Strategy: Elite multi-factor prediction with trust system")
+    if router is not None:
+        router.start()
+        kwlog.info("STARTUP", "Game-affinity router: %s strategy workers (%s)", router.n, EXECUTOR)
+    if snapshot.PATH:
+        await start_snapshots()
+    if warmup.ENABLED:
+        await warm_up()
+    if recorder is not None:
+        recorder.start()
+        kwlog.info("STARTUP", "Recording traffic to %s", RECORD_DIR)
+
+
+async def warm_up():
+    """Play synthetic games through the app, then report ready on /healthz.
+
+    The warm-up's requests are real ones (middleware, parsing, strategy in
+    whichever executor is configured), so they are kept out of the traffic
+    recorder and the endpoint metrics, and the strategy metrics they leave
+    are reset afterwards. A failure is logged
+    and the bot serves cold rather than not at all.
+    """
+    global ready, recorder
+    saved, recorder = recorder, None
+    try:
+        if router is not None:
+            await router.broadcast("metrics")  # every worker has finished importing
+        stats = await warmup.run(app, warmup.game_ids(router.n if router is not None else 0))
+        if router is not None:
+            await router.broadcast("reset_metrics")
+        metrics.reset()
+        kwlog.info("STARTUP", "Warmed up with %s requests in %.1f ms (first %.2f ms, %s errors)",
+                   stats["requests"], stats["ms"], stats["first_ms"], stats["errors"])
+    except Exception as e:
+        kwlog.error("STARTUP", "Warm-up failed, serving cold: %s", e)
+    finally:
+        recorder = saved
+        ready = True
+
+
+async def start_snapshots():
+    """Restore game memory from the last snapshot and start the periodic one."""
+    global _snapshot_task
+    if EXECUTOR == "router":
+        restored = await snapshot_stats()  # workers restore as they start
+    else:
+        restored = [snapshots.restore()] if snapshots is not None else []
+    for r in restored:
+        kwlog.info("STARTUP", "Restored %s games (%s live) from %s snapshot file(s) in %.1f ms",
+                   r["games"], r["live"], r["files"], r["restore_ms"])
+    if EXECUTOR == "router" and snapshot.remove_orphans(snapshot.PATH, router.n):
+        kwlog.info("STARTUP", "Removed snapshot files no worker rewrites (workers: %s)", router.n)
+    if restored:
+        _snapshot_task = asyncio.create_task(snapshot_loop())
+        kwlog.info("STARTUP", "Snapshotting game memory to %s every %ss", snapshot.PATH, snapshot.EVERY)
 
 
 @app.on_event("shutdown")
 async def shutdown():
     """Cleanup on shutdown."""
     strategy.memory.cleanup()
-    print("[SHUTDOWN] Bot terminated gracefully", flush=True)
+    if _snapshot_task is not None:
+        _snapshot_task.cancel()
+    if snapshots is not None:
+        snapshots.close()
+    if router is not None:
+        router.close()
+    if recorder is not None:
+        recorder.close()
+    kwlog.info("SHUTDOWN", "Bot terminated gracefully")
 
 
 # ─── Main ────────────────────────────────────────────────────────────
@@ -0,0 +1,319 @@
+"""
+Offline Kingdom Wars simulator and batch self-play harness.
+
+Plays full N-player games locally with the rules the strategy engine
+assumes, driving `strategy.negotiate` / `strategy.combat` for our seat and
+simple scripted bots for the others, across a process pool.
+
+Rules:
+- every tower starts at 100 HP, 0 armor, 0 resources, level 1 (max 5)
+- each turn starts with income `res_per_turn(level)`
+- negotiate: every alive player proposes up to 2 alliances
+  {allyId, attackTargetId}; proposals are visible to everyone in combat
+- combat: every player spends resources on armor (1:1), one upgrade
+  (`upg_cost(level)`) and attacks; all actions resolve simultaneously
+- attack troops hit armor first, then HP
+- after FATIGUE_TURN every tower also takes `fatigue_damage(turn)`,
+  absorbed by armor the same way
+- a tower at 0 HP is out; the last tower standing wins. If everyone left
+  dies on the same turn, or MAX_TURNS is reached, the game is a draw
+
+With KW_STRATEGY_CONFIG set, games are split across variants by gameId
+exactly as on the server and win rates are reported per variant.
+
+Run: python simulator.py --games 2000 --players 4 --procs 8
+"""
+
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+import kwlog
+import metrics
+import strategy
+from economy import MAX_LEVEL, fatigue_damage, res_per_turn, upg_cost
+
+START_HP = 100
+MAX_TURNS = 60
+OUR_ID = 1
+
+
+# ─── Opponent bots ───────────────────────────────────────────────────
+
+class Bot:
+    """Scripted opponent. Views use the same shapes as the HTTP API."""
+
+    name = "passive"
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+
+    def negotiate(self, gid: int, view: dict) -> List[Dict]:
+        return []
+
+    def combat(self, gid: int, view: dict) -> List[Dict]:
+        return []
+
+
+class RandomBot(Bot):
+    name = "random"
+
+    def combat(self, gid, view):
+        me, enemies = view["playerTower"], view["enemyTowers"]
+        res = me["resources"]
+        armor = self.rng.randint(0, res)
+        target = self.rng.choice(enemies)["playerId"]
+        return [{"type": "armor", "amount": armor},
+                {"type": "attack", "targetId": target, "troopCount": res - armor}]
+
+
+class AggressorBot(Bot):
+    """All-in on the weakest tower every turn."""
+    name = "aggressor"
+
+    def combat(self, gid, view):
+        weakest = min(view["enemyTowers"], key=lambda e: e["hp"] + e["armor"])
+        return [{"type": "attack", "targetId": weakest["playerId"],
+                 "troopCount": view["playerTower"]["resources"]}]
+
+
+class EconomistBot(Bot):
+    """Upgrades whenever it can, banks the rest, attacks the leader late."""
+    name = "economist"
+
+    def combat(self, gid, view):
+        me = view["playerTower"]
+        res, lvl = me["resources"], me["level"]
+        if lvl < MAX_LEVEL:
+            if res >= upg_cost(lvl):
+                return [{"type": "upgrade"}]
+            return [{"type": "armor", "amount": res // 4}] if me["hp"] < 50 else []
+        leader = max(view["enemyTowers"], key=lambda e: e["level"] * 100 + e["hp"])
+        return [{"type": "armor", "amount": res // 3},
+                {"type": "attack", "targetId": leader["playerId"], "troopCount": res - res // 3}]
+
+
+class DiplomatBot(Bot):
+    """Allies with the two strongest against the weakest and honours it."""
+    name = "diplomat"
+
+    def negotiate(self, gid, view):
+        enemies = sorted(view["enemyTowers"], key=lambda e: e["hp"] + e["level"] * 20, reverse=True)
+        if len(enemies) < 2:
+            return []
+        weakest = enemies[-1]["playerId"]
+        return [{"allyId": e["playerId"], "attackTargetId": weakest} for e in enemies[:2]
+                if e["playerId"] != weakest]
+
+    def combat(self, gid, view):
+        me = view["playerTower"]
+        asked = [d["action"]["attackTargetId"] for d in view["diplomacy"]
+                 if d["action"].get("allyId") == me["playerId"]]
+        alive = {e["playerId"] for e in view["enemyTowers"]}
+        targets = [t for t in asked if t in alive and t != me["playerId"]]
+        target = targets[0] if targets else min(view["enemyTowers"], key=lambda e: e["hp"])["playerId"]
+        armor = me["resources"] // 2
+        return [{"type": "armor", "amount": armor},
+                {"type": "attack", "targetId": target, "troopCount": me["resources"] - armor}]
+
+
+OPPONENTS = {cls.name: cls for cls in (Bot, RandomBot, AggressorBot, EconomistBot, DiplomatBot)}
+
+
+class ApexBot(Bot):
+    """Our strategy engine, timed per decision."""
+    name = "apex"
+
+    def __init__(self, rng, latency: metrics.Histogram):
+        super().__init__(rng)
+        self.latency = latency
+
+    def negotiate(self, gid, view):
+        t0 = time.perf_counter()
+        out = strategy.negotiate(gid=gid, turn=view["turn"], player=view["playerTower"],
+                                 enemies=view["enemyTowers"], combat_actions=view["combatActions"])
+        self.latency.record(time.perf_counter() - t0)
+        return out
+
+    def combat(self, gid, view):
+        t0 = time.perf_counter()
+        out = strategy.combat(gid=gid, turn=view["turn"], player=view["playerTower"],
+                              enemies=view["enemyTowers"], diplomacy=view["diplomacy"],
+                              previous_attacks=view["previousAttacks"])
+        self.latency.record(time.perf_counter() - t0)
+        return out
+
+
+# ─── Game engine ─────────────────────────────────────────────────────
+
+class GameResult(NamedTuple):
+    won: bool
+    draw: bool
+    survived_turns: int  # last turn our tower was standing at
+    turns: int           # turns played
+
+
+def _spend(tower: dict, actions: List[Dict], alive_ids) -> List[Dict]:
+    """Apply armor/upgrade immediately; return the attacks that were paid for."""
+    clean = strategy._validate(actions or [], tower["resources"], tower["level"],
+                               alive_ids - {tower["playerId"]})
+    attacks = []
+    for a in clean:
+        if a["type"] == "armor":
+            tower["armor"] += a["amount"]
+            tower["resources"] -= a["amount"]
+        elif a["type"] == "upgrade" and tower["level"] < MAX_LEVEL:
+            tower["resources"] -= upg_cost(tower["level"])
+            tower["level"] += 1
+        elif a["type"] == "attack":
+            tower["resources"] -= a["troopCount"]
+            attacks.append(a)
+    return attacks
+
+
+def _hit(tower: dict, damage: int):
+    absorbed = min(tower["armor"], damage)
+    tower["armor"] -= absorbed
+    tower["hp"] -= damage - absorbed
+
+
+def play_game(gid: int, players: int, opponents: List[str], seed: int,
+              latency: metrics.Histogram) -> GameResult:
+    rng = random.Random(seed)
+    towers = {pid: {"playerId": pid, "hp": START_HP, "armor": 0, "resources": 0, "level": 1}
+              for pid in range(1, players + 1)}
+    bots: Dict[int, Bot] = {OUR_ID: ApexBot(rng, latency)}
+    for pid in range(2, players + 1):
+        bots[pid] = OPPONENTS[rng.choice(opponents)](rng)
+
+    prev_attacks: List[Dict] = []
+    survived = None
+    played = 0
+    for turn in range(1, MAX_TURNS + 1):
+        alive = [pid for pid, t in towers.items() if t["hp"] > 0]
+        if len(alive) <= 1:
+            break
+        alive_ids = set(alive)
+        for pid in alive:
+            towers[pid]["resources"] += res_per_turn(towers[pid]["level"])
+
+        def view(pid, **extra):
+            me = dict(towers[pid])
+            enemies = [{k: towers[o][k] for k in ("playerId", "hp", "armor", "level")}
+                       for o in alive if o != pid]
+            return {"gameId": gid, "turn": turn, "playerTower": me, "enemyTowers": enemies, **extra}
+
+        diplomacy = []
+        for pid in alive:
+            for p in (bots[pid].negotiate(gid, view(pid, combatActions=prev_attacks)) or [])[:2]:
+                diplomacy.append({"playerId": pid, "action": dict(p)})
+
+        orders = {pid: bots[pid].combat(gid, view(pid, diplomacy=diplomacy, previousAttacks=prev_attacks))
+                  for pid in alive}
+        prev_attacks = []
+        for pid in alive:
+            for a in _spend(towers[pid], orders[pid], alive_ids):
+                prev_attacks.append({"playerId": pid, "action": {
+                    "targetId": a["targetId"], "troopCount": a["troopCount"]}})
+        for pa in prev_attacks:
+            _hit(towers[pa["action"]["targetId"]], pa["action"]["troopCount"])
+        fatigue = fatigue_damage(turn)
+        if fatigue:
+            for pid in alive:
+                _hit(towers[pid], fatigue)
+        played = turn
+        if towers[OUR_ID]["hp"] <= 0 and survived is None:
+            survived = turn
+
+    strategy.memory.finish_game(gid)
+    alive = [pid for pid, t in towers.items() if t["hp"] > 0]
+    won = alive == [OUR_ID]
+    return GameResult(won=won, draw=len(alive) != 1,
+                      survived_turns=survived if survived is not None else played, turns=played)
+
+
+# ─── Batch harness ───────────────────────────────────────────────────
+
+def _init_worker():
+    kwlog.set_level(kwlog.logging.WARNING)
+
+
+def run_chunk(first_gid: int, count: int, players: int, opponents: List[str], seed: int) -> dict:
+    """Play `count` games in this process; return mergeable totals."""
+    latency = metrics.Histogram()
+    wins = draws = survived = 0
+    variants: Dict[str, List[int]] = {}  # name -> [games, wins]
+    for gid in range(first_gid, first_gid + count):
+        r = play_game(gid, players, opponents, seed + gid, latency)
+        wins += r.won
+        draws += r.draw
+        survived += r.survived_turns
+        v = variants.setdefault(strategy.configs.for_game(gid).name, [0, 0])
+        v[0] += 1
+        v[1] += r.won
+    return {"games": count, "wins": wins, "draws": draws, "survived": survived,
+            "variants": variants, "latency": latency.to_state()}
+
+
+def run_batch(games: int, players: int, opponents: List[str], procs: Optional[int] = None,
+              seed: int = 0, chunk: int = 100) -> dict:
+    procs = procs or os.cpu_count() or 1
+    chunks = [(g, min(chunk, games - g), players, opponents, seed) for g in range(0, games, chunk)]
+    t0 = time.perf_counter()
+    if procs == 1:
+        _init_worker()
+        parts = [run_chunk(*c) for c in chunks]
+    else:
+        with ProcessPoolExecutor(procs, initializer=_init_worker) as pool:
+            parts = list(pool.map(run_chunk, *zip(*chunks)))
+    elapsed = time.perf_counter() - t0
+
+    latency = metrics.Histogram()
+    for p in parts:
+        latency.merge(metrics.Histogram.from_state(p["latency"]))
+    total = {k: sum(p[k] for p in parts) for k in ("games", "wins", "draws", "survived")}
+    variants: Dict[str, List[int]] = {}
+    for p in parts:
+        for name, (g, w) in p["variants"].items():
+            v = variants.setdefault(name, [0, 0])
+            v[0] += g
+            v[1] += w
+    return {
+        "games": total["games"],
+        "win_rate": total["wins"] / total["games"],
+        "draw_rate": total["draws"] / total["games"],
+        "avg_survival_turn": total["survived"] / total["games"],
+        "games_per_minute": total["games"] / elapsed * 60,
+        "decision_latency": latency.summary(),
+        "variants": {name: {"games": g, "win_rate": w / g} for name, (g, w) in sorted(variants.items())},
+        "elapsed_s": elapsed,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--games", type=int, default=1000)
+    ap.add_argument("--players", type=int, default=4)
+    ap.add_argument("--opponents", default=",".join(n for n in OPPONENTS if n != "passive"),
+                    help=f"comma-separated from: {', '.join(OPPONENTS)}")
+    ap.add_argument("--procs", type=int, default=None, help="worker processes (default: all cores)")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    r = run_batch(args.games, args.players, args.opponents.split(","), args.procs, args.seed)
+    lat = r["decision_latency"]
+    print(f"games:            {r['games']} ({r['games_per_minute']:.0f}/min, {r['elapsed_s']:.1f}s)")
+    print(f"win rate:         {r['win_rate']:.1%} (draws {r['draw_rate']:.1%})")
+    print(f"avg survival:     turn {r['avg_survival_turn']:.1f}")
+    print(f"decision latency: p50 {lat['p50_ms']:.3f}ms  p99 {lat['p99_ms']:.3f}ms  "
+          f"max {lat['max_ms']:.3f}ms  ({lat['count']} calls)")
+    if len(r["variants"]) > 1:
+        for name, v in r["variants"].items():
+            print(f"variant {name + ':':<9} {v['win_rate']:.1%} of {v['games']} games")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Periodic binary snapshots of GameMemory for warm restarts.
+
+A restart in the middle of a tournament would otherwise lose every live
+game's betrayal flags, aggression counters and alliance history. Every
+KW_SNAPSHOT_EVERY seconds the process that owns the memory encodes it
+(on its own thread, so the copy is consistent with the request path;
+the typed arrays are copied with `tobytes`) and a background thread joins,
+checksums and writes the file: tmp file + fsync + atomic rename, so a
+crash mid-write leaves the previous snapshot intact. At startup the snapshot is loaded back; games
+that went idle past the memory TTL (counting the downtime) are dropped.
+
+File layout (little-endian):
+    header  "KWSN", version u32, games u32, written_at f64 (unix time)
+    game    gid i64, idle_s f64, players u32, our_allies u32, ingested u32,
+            then rows u32 and oldest-row index u32 of the attack, proposal
+            and level history rings (history.py), then hit_base i64,
+            then per player: pid, agg, betrayals, active, ally_last (i64),
+            ally_bits (u64), hits (f64), then our_allies (i64), then the ingested
+            (turn, phase) bitset as `ingested` little-endian bytes, then
+            each ring's columns as stored (i64)
+    footer  crc32 of everything before it (u32)
+
+With router workers (KW_EXECUTOR=router) each worker owns its games,
+writes `<path>.w<index>` and, when it starts (or is restarted after a
+crash), loads every `<path>.w*` file keeping the games that now route to
+it, so a changed worker count still resumes every game. A single-process
+`<path>` is loaded only when no worker file exists yet (migrating to
+router mode). The front-end then removes `<path>` and the files of
+workers beyond the new count. Otherwise the process
+serving requests owns the memory and restores only `<path>`. A game found
+in several files is restored from the one that saw it last. The SQLite
+backend is durable already and is not snapshotted.
+
+Env:
+    KW_SNAPSHOT_PATH=<file>   enable snapshots (off by default)
+    KW_SNAPSHOT_EVERY=5       seconds between snapshots
+"""
+
+import glob
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+import kwlog
+
+MAGIC = b"KWSN"
+VERSION = 4
+_HEADER = struct.Struct("<4sIId")
+_GAME = struct.Struct("<qdIIIIIIIIIq")
+_CRC = struct.Struct("<I")
+_RING_WIDTHS = (4, 4, 3)  # attacks, proposals, levels columns
+
+PATH = os.getenv("KW_SNAPSHOT_PATH", "")
+EVERY = float(os.getenv("KW_SNAPSHOT_EVERY", "5"))
+
+
+def _i64(a: array) -> bytes:
+    # "l" arrays are already 8 bytes on 64-bit Linux: no per-cell conversion
+    return a.tobytes() if a.itemsize == 8 else array("q", a).tobytes()
+
+
+def encode(memory) -> List[bytes]:
+    """Copy every live game of a GameMemory into byte strings (header first)."""
+    now = time.monotonic()
+    games = memory.games()
+    parts = [_HEADER.pack(MAGIC, VERSION, len(games), time.time())]
+    for gid, g in games:
+        pids = array("q", g.slot)  # slot order == array index order
+        allies = array("q", g.our_allies)
+        ingested = g.ingested.to_bytes((g.ingested.bit_length() + 7) // 8, "little")
+        rings = [ring.export() for ring in g.history.rings()]
+        parts += [_GAME.pack(gid, now - g.seen, len(pids), len(allies), len(ingested),
+                             *(v for cols, oldest in rings for v in (len(cols[0]), oldest)), g.hit_base),
+                  pids.tobytes(), g.agg.tobytes(), _i64(g.betrayals), _i64(g.active),
+                  _i64(g.ally_last), g.ally_bits.tobytes(), g.hits.tobytes(), allies.tobytes(), ingested]
+        parts += [col.tobytes() for cols, _ in rings for col in cols]
+    return parts
+
+
+def seal(parts: List[bytes]) -> bytes:
+    """The snapshot file: encoded parts plus the checksum footer."""
+    body = b"".join(parts)
+    return body + _CRC.pack(zlib.crc32(body))
+
+
+def dumps(memory) -> bytes:
+    """Encode every live game of a GameMemory."""
+    return seal(encode(memory))
+
+
+def loads(memory, data: bytes, keep: Callable[[int], bool] = None,
+          seen: Dict[int, float] = None) -> int:
+    """Restore games from `data` into `memory`; returns the number loaded.
+
+    `seen` maps gid -> wall time the game was last seen, across the files
+    of one restore: a game already restored from a fresher file is skipped.
+    """
+    if len(data) < _HEADER.size + _CRC.size:
+        raise ValueError("snapshot too short")
+    body = memoryview(data)[:-_CRC.size]
+    if zlib.crc32(body) != _CRC.unpack_from(data, len(data) - _CRC.size)[0]:
+        raise ValueError("snapshot checksum mismatch")
+    magic, version, count, written = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"not a v{VERSION} snapshot")
+    downtime = max(0.0, time.time() - written)
+    off, loaded = _HEADER.size, 0
+    for _ in range(count):
+        gid, idle, n, m, k, *rings, hit_base = _GAME.unpack_from(data, off)
+        off += _GAME.size
+        cols = []
+        for code in "qqqqqQd":
+            col = array(code)
+            col.frombytes(body[off:off + 8 * n])
+            cols.append(col)
+            off += 8 * n
+        allies = array("q")
+        allies.frombytes(body[off:off + 8 * m])
+        off += 8 * m
+        ingested = int.from_bytes(body[off:off + k], "little")
+        off += k
+        history = []
+        for r, oldest, width in zip(rings[::2], rings[1::2], _RING_WIDTHS):
+            ring = []
+            for _ in range(width):
+                col = array("q")
+                col.frombytes(body[off:off + 8 * r])
+                ring.append(col)
+                off += 8 * r
+            history.append((ring, oldest))
+        if keep is not None and not keep(gid):
+            continue
+        if seen is not None:
+            at = written - idle
+            if seen.get(gid, -1.0) >= at:
+                continue
+            seen[gid] = at
+        *cols, hits = cols
+        memory.restore_game(gid, idle + downtime, *cols, allies, ingested, history, hits, hit_base)
+        loaded += 1
+    return loaded
+
+
+def write(path: str, data: bytes):
+    """Atomically replace `path` with `data` (durable before the rename)."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Snapshotter:
+    """Snapshots one GameMemory to `path`: encode inline, write in the background."""
+
+    def __init__(self, memory, path: str):
+        self.memory = memory
+        self.path = path
+        self._writer: Optional[threading.Thread] = None
+        self.last: Dict[str, float] = {}
+        self.saves = self.skipped = self.errors = 0
+
+    def save(self, wait: bool = False) -> bool:
+        """Snapshot now; False if the previous write is still running."""
+        if self._writer is not None and self._writer.is_alive():
+            if not wait:
+                self.skipped += 1
+                return False
+            self._writer.join()
+        t0 = perf_counter()
+        parts = encode(self.memory)  # inline: the memory must not change mid-copy
+        encode_ms = (perf_counter() - t0) * 1e3
+        self._writer = threading.Thread(target=self._write, args=(parts, encode_ms),
+                                        name="kw-snapshot", daemon=True)
+        self._writer.start()
+        if wait:
+            self._writer.join()
+        return True
+
+    def _write(self, parts: List[bytes], encode_ms: float):
+        t0 = perf_counter()
+        data = seal(parts)
+        try:
+            write(self.path, data)
+        except OSError as e:
+            self.errors += 1
+            kwlog.error("SNAPSHOT", "Write failed: %s", e, path=self.path)
+            return
+        self.saves += 1
+        self.last = {"encode_ms": round(encode_ms, 3), "write_ms": round((perf_counter() - t0) * 1e3, 3),
+                     "bytes": len(data), "at": time.time()}
+
+    def restore(self, pattern: str = None, keep: Callable[[int], bool] = None) -> Dict[str, float]:
+        """Load the snapshot(s) matching `pattern` (default: our own file)."""
+        t0 = perf_counter()
+        games = files = 0
+        seen: Dict[int, float] = {}  # a gid in several files: the freshest copy wins
+        for path in sorted(glob.glob(pattern or self.path)):
+            if path.endswith(".tmp"):
+                continue
+            try:
+                with open(path, "rb") as f:
+                    games += loads(self.memory, f.read(), keep, seen)
+                files += 1
+            except (OSError, ValueError, struct.error) as e:
+                kwlog.error("SNAPSHOT", "Skipping unreadable snapshot: %s", e, path=path)
+        self.memory.cleanup()  # games idle past the TTL (downtime included) go now
+        stats = {"files": files, "games": games, "live": self.memory.stats()["games"],
+                 "restore_ms": round((perf_counter() - t0) * 1e3, 3)}
+        self.last = {**self.last, **stats}
+        return stats
+
+    def stats(self) -> Dict[str, float]:
+        return {"path": self.path, "saves": self.saves, "skipped": self.skipped,
+                "errors": self.errors, **self.last}
+
+    def close(self):
+        """Final snapshot on shutdown (waits for the write)."""
+        self.save(wait=True)
+
+
+def worker_files(path: str) -> str:
+    """Glob of the files router workers restore from.
+
+    The `.w<i>` files of the previous run, or the single-process `path`
+    when there are none (its games migrate to the workers once).
+    """
+    workers = f"{glob.escape(path)}.w*"
+    return workers if glob.glob(workers) else glob.escape(path)
+
+
+def remove_orphans(path: str, workers: int) -> int:
+    """Delete the files no router worker rewrites: `<path>.w<i>` of workers
+    that no longer exist (i >= workers) and the single-process `<path>`.
+
+    Called once every worker has restored, so their games have migrated;
+    left behind, a file nobody rewrites would be restored on every start.
+    """
+    names = [path] if os.path.exists(path) else []
+    for name in glob.glob(f"{glob.escape(path)}.w*"):
+        index = name[len(path) + 2:]
+        if index.isdigit() and int(index) >= workers:
+            names.append(name)
+    removed = 0
+    for name in names:
+        try:
+            os.remove(name)
+            removed += 1
+        except OSError as e:
+            kwlog.error("SNAPSHOT", "Cannot remove orphaned snapshot: %s", e, path=name)
+    return removed
+
+
+def create(memory, path: str = None) -> Optional[Snapshotter]:
+    """Snapshotter for `memory` if KW_SNAPSHOT_PATH is set and the backend is in-process."""
+    path = PATH if path is None else path
+    if not path:
+        return None
+    if not hasattr(memory, "restore_game"):
+        kwlog.warning("SNAPSHOT", "%s is persistent already, snapshots off", type(memory).__name__)
+        return None
+    return Snapshotter(memory, path)
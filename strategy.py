@@ -9,89 +9,381 @@ Core Principles:
 5. FOCUS FIRE: Kill shot priority > Coordinated targets > Revenge.
 """
 
-import math
-from collections import defaultdict
-from typing import List, Dict, Any, Set
+import heapq
+import os
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from time import perf_counter
+from typing import List, Dict, Any, Callable, Optional, Set, Tuple
+
+import kwlog
+import metrics
+import search
+from cache import create_decisions
+from config import create_store
+from economy import MAX_LEVEL, res_per_turn, upg_cost, fatigue_damage, payback_turns
+from history import TurnHistory
+from memory_store import (INGEST_ATTACKS, INGEST_COMBAT, INGEST_PHASES, THREAT_DECAY, MemoryBackend,
+                          SQLiteMemory)
+from profiles import MIN_TRUST, create_profiles
+
+MAX_TURN = int(os.getenv("KW_MAX_TURN", "100"))  # last turn a game can reach
+SEARCH_MS = float(os.getenv("KW_SEARCH_MS", "0"))  # anytime search budget per combat (0 = off)
+PLANNER = os.getenv("KW_PLANNER", "search")  # what spends it: search (one-turn) or rollout (Monte Carlo)
 
-FATIGUE_TURN = 25
-MAX_LEVEL = 5
-
-
-def res_per_turn(level: int) -> int:
-    """Accurate game resources per level."""
-    return int(round(20 * (1.5 ** (level - 1))))
 
+# ─── Intelligence System ─────────────────────────────────────────────
 
-def upg_cost(current_level: int) -> int:
-    """Accurate upgrade costs per level."""
-    return math.ceil(50 * (1.75 ** (current_level - 1)))
+_NEVER = -1               # ally_last sentinel: never allied with us
+_ALLY_WINDOW = 64         # turns kept in the recent-alliance bitset
+_ALLY_MASK = (1 << _ALLY_WINDOW) - 1
+_THREAT_REBASE = 32       # turns between rescalings of the threat sums
 
+# Rough per-game footprint used for the byte budget (CPython, 64-bit)
+_GAME_BYTES = 1400        # _GameState + 5 empty arrays + slot dict + empty TurnHistory
+_PLAYER_BYTES = 148       # 6 array cells + one slot-dict entry
+_FINISHED = 4096          # finished gameIds remembered so late retries are ignored
+_INGEST_BYTES = sys.getsizeof(1 << (MAX_TURN + 1) * INGEST_PHASES)  # full `ingested` bitset
 
-def fatigue_damage(turn: int) -> int:
-    """Fatigue starts at 5 and grows by 5 each turn."""
-    if turn <= FATIGUE_TURN: return 0
-    return 5 * (turn - FATIGUE_TURN)
 
+class _GameState:
+    """Compact per-game intel: one slot per player in parallel typed arrays.
 
-# ─── Intelligence System ─────────────────────────────────────────────
+    ally_bits is a sliding bitset over the last 64 turns: bit i set means the
+    player allied with us on turn ally_last - i. `ingested` has bit
+    turn * INGEST_PHASES + phase set once that part of the turn is recorded;
+    turns past MAX_TURN are never claimed, so it stays within _INGEST_BYTES.
+    `history` keeps the raw attack/proposal/level timelines (history.py).
 
-class GameMemory:
-    """Elite cross-turn memory with activity tracking."""
+    hits is the observed-threat EWMA in scaled form: troops sent at us on
+    turn t are added times THREAT_DECAY ** (hit_base - t), so the average
+    at any turn is one shared factor times hits[i]. Sums only grow, which
+    keeps `top` (the two heaviest attackers) exact with O(1) work per hit.
+    """
 
-    def __init__(self):
-        self._g: Dict[int, Dict[str, Any]] = {}
+    __slots__ = ("slot", "agg", "betrayals", "active", "ally_last", "ally_bits",
+                 "hits", "hit_base", "top", "our_allies", "ingested", "history", "seen", "nbytes")
+
+    def __init__(self, now: float):
+        self.slot: Dict[int, int] = {}
+        self.agg = array("q")        # total troops sent at us
+        self.betrayals = array("l")  # attacked while allied
+        self.active = array("l")     # last turn they attacked
+        self.ally_last = array("l")  # last turn they allied with us
+        self.ally_bits = array("Q")  # recent-alliance window
+        self.hits = array("d")       # scaled troops-at-us EWMA
+        self.hit_base = 0
+        self.top: List[int] = []     # pids of the two largest hits, largest first
+        self.our_allies: Set[int] = set()  # who we proposed peace to
+        self.ingested = 0
+        self.history = TurnHistory()
+        self.seen = now
+        self.nbytes = _GAME_BYTES + _INGEST_BYTES
+
+    def index(self, pid: int) -> int:
+        i = self.slot.get(pid)
+        if i is None:
+            i = self.slot[pid] = len(self.agg)
+            self.agg.append(0); self.betrayals.append(0); self.active.append(0)
+            self.ally_last.append(_NEVER); self.ally_bits.append(0); self.hits.append(0.0)
+            self.nbytes += _PLAYER_BYTES
+        return i
+
+    def mark_allied(self, i: int, turn: int):
+        last = self.ally_last[i]
+        if last == _NEVER or turn > last:
+            shift = turn - last if last != _NEVER else _ALLY_WINDOW
+            self.ally_bits[i] = ((self.ally_bits[i] << shift) | 1) & _ALLY_MASK if shift < _ALLY_WINDOW else 1
+            self.ally_last[i] = turn
+        elif last - turn < _ALLY_WINDOW:
+            self.ally_bits[i] |= 1 << (last - turn)
+
+    def allied_at(self, i: int, turn: int) -> bool:
+        d = self.ally_last[i] - turn
+        return self.ally_last[i] != _NEVER and 0 <= d < _ALLY_WINDOW and bool(self.ally_bits[i] >> d & 1)
+
+    def add_hit(self, pid: int, turn: int, troops: int):
+        if turn - self.hit_base >= _THREAT_REBASE:  # keep the scale factor small
+            scale = THREAT_DECAY ** (turn - self.hit_base)
+            self.hits = array("d", (h * scale for h in self.hits))
+            self.hit_base = turn
+        hits, top = self.hits, self.top
+        hits[self.slot[pid]] += troops * THREAT_DECAY ** (self.hit_base - turn)
+        if pid not in top:
+            if len(top) < 2:
+                top.append(pid)
+            elif hits[self.slot[pid]] > hits[self.slot[top[1]]]:
+                top[1] = pid
+            else:
+                return
+        if len(top) == 2 and hits[self.slot[top[1]]] > hits[self.slot[top[0]]]:
+            top.reverse()
+
+    def threat(self, turn: int, alive) -> float:
+        top = self.top
+        if any(pid not in alive for pid in top):  # a top attacker died: once per death
+            for pid in top:
+                if pid not in alive:
+                    self.hits[self.slot[pid]] = 0.0
+            ranked = [pid for pid in self.slot if pid in alive and self.hits[self.slot[pid]] > 0]
+            top[:] = heapq.nlargest(2, ranked, key=lambda p: self.hits[self.slot[p]])
+        hits = self.hits
+        return ((1.0 - THREAT_DECAY) * THREAT_DECAY ** (turn - self.hit_base)
+                * sum(hits[self.slot[pid]] for pid in top))
+
+
+class GameMemory(MemoryBackend):
+    """Elite cross-turn memory with activity tracking (process-local).
+
+    Games live in an LRU-ordered dict and are evicted at request time when
+    the game count, idle TTL or estimated byte budget is exceeded, so memory
+    stays bounded during multi-day tournaments.
+    """
 
-    def _get(self, gid: int) -> Dict[str, Any]:
-        if gid not in self._g:
-            self._g[gid] = {
-                "agg": defaultdict(int),          # total troops sent at us
-                "ally_turns": defaultdict(set),   # turns they allied with us
-                "betrayals": defaultdict(int),    # attacked while allied
-                "our_allies": set(),              # who we proposed peace to
-                "active_turns": defaultdict(int), # last turn they attacked
-            }
-        return self._g[gid]
+    def __init__(self, max_games: int = None, ttl: float = None, max_bytes: int = None,
+                 on_evict: Optional[Callable[[int, str], None]] = None):
+        self.max_games = max_games if max_games is not None else int(os.getenv("KW_MEMORY_MAX_GAMES", "500"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("KW_MEMORY_TTL", "1800"))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("KW_MEMORY_MAX_BYTES", str(64 << 20)))
+        self._g: "OrderedDict[int, _GameState]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = {"lru": 0, "ttl": 0, "bytes": 0, "finished": 0}
+        self.on_evict = on_evict  # called with (gid, reason) for games dropped unfinished
+        self._finished: "OrderedDict[int, None]" = OrderedDict()  # tombstones, oldest first
+
+    def _get(self, gid: int) -> _GameState:
+        g = self._g.get(gid)
+        now = time.monotonic()
+        if g is None:
+            if gid in self._finished:  # a retry after the game ended: write to a throwaway
+                return _GameState(now)
+            g = self._g[gid] = _GameState(now)
+            self._bytes += g.nbytes
+            self._evict(now)
+        else:
+            g.seen = now
+            self._g.move_to_end(gid)
+        return g
+
+    def _peek(self, gid: int) -> _GameState:
+        """A game for reading: refreshed if live, else the shared empty state.
+
+        Reads never create a game, so they cannot evict a live one.
+        """
+        g = self._g.get(gid)
+        if g is None:
+            return _NO_GAME
+        g.seen = time.monotonic()
+        self._g.move_to_end(gid)
+        return g
+
+    def _drop(self, gid: int, reason: str):
+        if reason == "finished":
+            self._finished[gid] = None
+            if len(self._finished) > _FINISHED:
+                self._finished.popitem(last=False)
+        g = self._g.pop(gid, None)
+        if g is not None:
+            self._bytes -= g.nbytes
+            if gid >= 0:  # warm-up games (warmup.py) go uncounted
+                self.evictions[reason] += 1
+            if reason != "finished" and self.on_evict is not None:
+                self.on_evict(gid, reason)
+
+    def _evict(self, now: float):
+        """Drop least-recently-used games while any budget is exceeded."""
+        while len(self._g) > 1:
+            gid, g = next(iter(self._g.items()))
+            if len(self._g) > self.max_games: reason = "lru"
+            elif self._bytes > self.max_bytes: reason = "bytes"
+            elif now - g.seen > self.ttl: reason = "ttl"
+            else: break
+            self._drop(gid, reason)
+
+    def claim_turn(self, gid: int, turn: int, phase: int) -> bool:
+        if turn > MAX_TURN or gid in self._finished:  # no such turn, or the game is over
+            return False
+        g = self._get(gid)
+        bit = 1 << (max(0, turn) * INGEST_PHASES + phase)
+        if g.ingested & bit:
+            return False
+        g.ingested |= bit
+        return True
 
     def record_intel(self, gid: int, turn: int, my_id: int, prev_attacks: List[Dict]):
         g = self._get(gid)
+        before = g.nbytes
         for pa in prev_attacks:
             act = pa.get("action", {}) or {}
-            pid = int(pa["playerId"])
             target = act.get("targetId")
             troops = int(act.get("troopCount", 0) or 0)
 
             if troops > 0:
-                g["active_turns"][pid] = turn
+                pid = pa["playerId"]
+                i = g.index(pid)
+                g.active[i] = turn
                 if target == my_id:
-                    g["agg"][pid] += troops
-                    if (turn - 1) in g["ally_turns"].get(pid, set()):
-                        g["betrayals"][pid] += 1
-                        print(f"[INTEL] BETRAYAL detected! Player {pid} attacked us.")
+                    g.agg[i] += troops
+                    g.add_hit(pid, turn, troops)
+                    if g.allied_at(i, turn - 1):
+                        g.betrayals[i] += 1
+                        kwlog.info("INTEL", "BETRAYAL detected! Player %s attacked us.", pid,
+                                   gameId=gid, turn=turn)
+        self._bytes += g.nbytes - before
+        self._evict(g.seen)
 
     def record_diplomacy(self, gid: int, turn: int, diplomacy: List[Dict], my_id: int):
         g = self._get(gid)
+        before = g.nbytes
         for d in diplomacy:
             act = d.get("action", {}) or {}
             if act.get("allyId") == my_id:
-                g["ally_turns"][d["playerId"]].add(turn)
+                g.mark_allied(g.index(d["playerId"]), turn)
+        hist = g.history.nbytes
+        g.history.record_proposals(turn, diplomacy)
+        g.nbytes += g.history.nbytes - hist
+        self._bytes += g.nbytes - before
+
+    def record_turn(self, gid: int, turn: int, enemies: List[Dict], attacks: List[Dict]):
+        g = self._get(gid)
+        before = g.history.nbytes
+        g.history.record_attacks(turn, attacks)
+        g.history.record_levels(turn, enemies)
+        grown = g.history.nbytes - before
+        g.nbytes += grown
+        self._bytes += grown
+        if grown:
+            self._evict(g.seen)
+
+    def attacks_on(self, gid, target, since) -> Dict[int, int]:
+        return self._peek(gid).history.attacks_on(target, since)
+
+    def avg_troops(self, gid, since=0) -> Dict[int, float]:
+        return self._peek(gid).history.avg_troops(since)
+
+    def levels_gained(self, gid, pid, since) -> int:
+        return self._peek(gid).history.levels_gained(pid, since)
+
+    def proposals(self, gid, since) -> List[Tuple[int, int, int, int]]:
+        return self._peek(gid).history.proposals.rows(since)
 
     def is_active(self, gid, pid, turn) -> bool:
-        last = self._get(gid)["active_turns"].get(pid, 0)
-        return (turn - last) <= 3
+        g = self._peek(gid)
+        i = g.slot.get(pid)
+        return (turn - (g.active[i] if i is not None else 0)) <= 3
 
     def get_trust(self, gid, pid) -> float:
-        g = self._get(gid)
-        if g["betrayals"].get(pid, 0) > 0: return 0.0
-        if pid in g["ally_turns"]: return 0.8
+        g = self._peek(gid)
+        i = g.slot.get(pid)
+        if i is None: return 0.5
+        if g.betrayals[i] > 0: return 0.0
+        if g.ally_last[i] != _NEVER: return 0.8
         return 0.5
 
-    def set_our_allies(self, gid, ids): self._get(gid)["our_allies"] = set(ids)
-    def get_our_allies(self, gid): return self._get(gid)["our_allies"]
-    def cleanup(self):
-        if len(self._g) > 500:
-            for k in list(self._g.keys())[:-100]: del self._g[k]
+    def aggression(self, gid, pid) -> int:
+        g = self._peek(gid)
+        i = g.slot.get(pid)
+        return g.agg[i] if i is not None else 0
+
+    def enemy_intel(self, gid, turn, pids) -> Dict[int, Tuple[bool, int]]:
+        g = self._peek(gid)
+        out = {}
+        for pid in pids:
+            i = g.slot.get(pid)
+            if i is None:
+                out[pid] = (turn <= 3, 0)
+            else:
+                out[pid] = (turn - g.active[i] <= 3, g.agg[i])
+        return out
+
+    def threat(self, gid, turn, my_id, pids) -> float:
+        return self._peek(gid).threat(turn, pids)
+
+    def set_our_allies(self, gid, ids): self._get(gid).our_allies = set(ids)
+    def get_our_allies(self, gid): return self._peek(gid).our_allies
+    def finish_game(self, gid): self._drop(gid, "finished")
+    def cleanup(self): self._evict(time.monotonic())
+
+    def stats(self) -> Dict[str, int]:
+        return {"games": len(self._g), "bytes": self._bytes,
+                **{f"evicted_{k}": v for k, v in self.evictions.items()}}
+
+    # Snapshot support (see snapshot.py)
+    def games(self) -> List[Tuple[int, _GameState]]:
+        """Live games, least recently used first."""
+        return list(self._g.items())
+
+    def restore_game(self, gid: int, idle: float, pids, agg, betrayals, active,
+                     ally_last, ally_bits, our_allies, ingested: int = 0, history=None,
+                     hits=None, hit_base: int = 0):
+        """Re-create a snapshotted game that was last seen `idle` seconds ago."""
+        g = _GameState(time.monotonic() - idle)
+        g.slot = {int(pid): i for i, pid in enumerate(pids)}
+        g.agg, g.ally_bits = array("q", agg), array("Q", ally_bits)
+        g.betrayals, g.active, g.ally_last = array("l", betrayals), array("l", active), array("l", ally_last)
+        g.hits = array("d", hits) if hits is not None else array("d", bytes(8 * len(g.slot)))
+        g.hit_base = hit_base
+        g.top = heapq.nlargest(2, (pid for pid in g.slot if g.hits[g.slot[pid]] > 0),
+                               key=lambda p: g.hits[g.slot[p]])
+        g.our_allies = set(our_allies)
+        g.ingested = ingested
+        if history is not None:
+            g.history.load(*history)
+        g.nbytes = _GAME_BYTES + _INGEST_BYTES + _PLAYER_BYTES * len(g.slot) + g.history.nbytes
+        old = self._g.pop(gid, None)
+        self._g[gid] = g
+        self._bytes += g.nbytes - (old.nbytes if old is not None else 0)
+
+
+_NO_GAME = _GameState(0.0)  # what reads of an unknown game see (never stored)
+_NO_GAME.our_allies = frozenset()
+
+
+def create_memory() -> MemoryBackend:
+    """Pick the memory backend from KW_MEMORY_BACKEND (local | sqlite)."""
+    backend = os.getenv("KW_MEMORY_BACKEND", "local").lower()
+    if backend == "sqlite":
+        return SQLiteMemory(os.getenv("KW_MEMORY_PATH", "/tmp/kw_memory.db"),
+                            max_games=int(os.getenv("KW_MEMORY_MAX_GAMES", "500")),
+                            ttl=float(os.getenv("KW_MEMORY_TTL", "1800")), on_evict=_evicted)
+    return GameMemory(on_evict=_evicted)
+
+
+def _evicted(gid: int, reason: str):
+    """A game left memory before it finished: count it for its variant."""
+    if gid >= 0:
+        configs.evicted(gid)
+
+memory = create_memory()
+profiles = create_profiles()  # cross-game opponent profiles (None = off)
+configs = create_store()      # tunable parameters and A/B variants (hot-reloaded)
+decisions = create_decisions()  # decisions by canonical turn state (None = off)
+
+
+def _stash(pid: int, prior: float) -> float:
+    """Turns of income an enemy commits per attack.
+
+    The prior is a floor: armor bids are tuned around it, so profiles only
+    raise the estimate for players seen hoarding for big hits.
+    """
+    return max(prior, profiles.stash(pid)) if profiles is not None else prior
+
+
+def _reliable(e) -> bool:
+    return profiles is None or profiles.trust(e["playerId"]) >= MIN_TRUST
+
 
-memory = GameMemory()
+def _game_over(gid: int, outcome: str):
+    """Free a finished game; real games also count towards their variant.
+
+    Negative gameIds are synthetic warm-up games (warmup.py): they must not
+    leave outcomes in the A/B counters, as they stay out of profiles.
+    """
+    memory.finish_game(gid)
+    if gid >= 0:
+        configs.finish(gid, outcome)
 
 
 # ─── Strategy Engine ─────────────────────────────────────────────────
@@ -104,36 +396,50 @@ def negotiate(gid: int, turn: int, player: Dict, enemies: List[Dict],
     - Divide & Conquer if we are leading.
     - Double Alliance with strongest reliable partners.
     """
-    my_id = int(player["playerId"])
-    alive = [e for e in enemies if int(e.get("hp", 0)) > 0]
-    memory.record_intel(gid, turn, my_id, combat_actions)
+    started = perf_counter()
+    cfg = configs.for_game(gid)
+    my_id = player["playerId"]
+    alive = [e for e in enemies if e["hp"] > 0]
+    if not alive:
+        _game_over(gid, "won")
+        return []
+    tick = perf_counter()
+    if memory.claim_turn(gid, turn, INGEST_ATTACKS):  # combat may have recorded them already
+        memory.record_intel(gid, turn, my_id, combat_actions)
+        memory.record_turn(gid, turn, enemies, combat_actions)
+    tick = metrics.lap("phase:record_intel", tick)
     
     if len(alive) < 2: return []
 
-    def strength(e): return res_per_turn(int(e["level"])) + int(e["hp"])*0.5
-    sorted_enemies = sorted(alive, key=strength, reverse=True)
+    def strength(e): return res_per_turn(e["level"]) + e["hp"]*cfg.strength_hp
+    # Only the leader, two partners and the weakest matter: partial selection
+    # instead of a full sort (full order only if profiles may skip partners)
+    sorted_enemies = heapq.nlargest(3 if profiles is None else len(alive), alive, key=strength)
     leader = sorted_enemies[0]
-    weakest = sorted_enemies[-1]
+    weakest = min(reversed(alive), key=strength)  # last among equals, as a stable sort would
     
     # 1) BLUFFING/STALLING: If someone is way stronger than us, ally with them
     # to keep them from hitting us while we catch up.
     is_leader = strength(player) > strength(leader)
     
     proposals = []
-    if not is_leader and strength(leader) > strength(player) * 1.5:
+    if not is_leader and strength(leader) > strength(player) * cfg.bluff_ratio:
         # We are underdogs - ally with the leader as a "shield"
         proposals.append({"allyId": leader["playerId"], "attackTargetId": weakest["playerId"]})
-        print(f"[DIPLO] Bluffing alliance with leader {leader['playerId']}")
+        kwlog.info("DIPLO", "Bluffing alliance with leader %s", leader["playerId"],
+                   gameId=gid, turn=turn, decision="bluff")
 
     # 2) RALLY: If not lead, rally non-leading players against the leader
+    # (partners that broke alliances with us in earlier games are skipped)
     if not is_leader and not proposals:
-        for e in sorted_enemies[1:3]: # 2nd and 3rd strongest
+        for e in [e for e in sorted_enemies[1:] if _reliable(e)][:2]: # 2nd and 3rd strongest
             proposals.append({"allyId": e["playerId"], "attackTargetId": leader["playerId"]})
-            print(f"[DIPLO] Rallying {e['playerId']} against leader {leader['playerId']}")
+            kwlog.info("DIPLO", "Rallying %s against leader %s", e["playerId"], leader["playerId"],
+                       gameId=gid, turn=turn, decision="rally")
 
     # 3) DEFAULT: Double alliance against weakest
     if not proposals:
-        for e in sorted_enemies[:2]:
+        for e in [e for e in sorted_enemies if _reliable(e)][:2]:
             if e["playerId"] != weakest["playerId"]:
                 proposals.append({"allyId": e["playerId"], "attackTargetId": weakest["playerId"]})
 
@@ -141,6 +447,9 @@ def negotiate(gid: int, turn: int, player: Dict, enemies: List[Dict],
     dedup = {p["allyId"]: p for p in proposals}
     result = list(dedup.values())[:2]
     memory.set_our_allies(gid, [p["allyId"] for p in result])
+    tick = metrics.lap("phase:diplomacy", tick)
+    if configs.split:
+        metrics.observe(f"variant:{cfg.name}:negotiate", tick - started)
     return result
 
 
@@ -149,33 +458,132 @@ def combat(gid: int, turn: int, player: Dict, enemies: List[Dict],
     """
     Adaptive Predator Combat Engine.
     """
-    my_id = int(player["playerId"])
-    res = int(player["resources"])
-    hp = int(player["hp"])
-    arm = int(player["armor"])
-    lvl = int(player["level"])
-    alive = [e for e in enemies if int(e.get("hp", 0)) > 0]
-    alive_ids = {int(e["playerId"]) for e in alive}
+    started = perf_counter()
+    result, state = plan_combat(gid, turn, player, enemies, diplomacy, previous_attacks,
+                                with_state=SEARCH_MS > 0)
+
+    # 5. Anytime search: spend the leftover latency budget improving the plan
+    if state is not None:
+        tick = perf_counter()
+        result, info = refine(result, state, started + SEARCH_MS / 1000)
+        metrics.lap("phase:search", tick)
+        kwlog.debug("SEARCH", "%s candidates, gain %.1f", info["candidates"], info["gain"],
+                    gameId=gid, turn=turn)
+        if info["complete"]:
+            remember(state, result)
+    if configs.split:
+        metrics.observe(f"variant:{configs.for_game(gid).name}:combat", perf_counter() - started)
+    return result
+
+
+def refine(actions: List[Dict], state, deadline: float) -> Tuple[List[Dict], Dict[str, float]]:
+    """Improve a heuristic plan with the KW_PLANNER planner until `deadline` (perf_counter)."""
+    if PLANNER == "rollout":
+        import rollout  # numpy: imported on the first rollout refinement (warmup.py pays it)
+        planner = rollout.improve
+    else:
+        planner = search.improve
+    return planner(actions, state, deadline, {e.pid for e in state.enemies})
+
+
+def remember(state, actions: List[Dict]):
+    """Cache a refined plan under the key plan_combat put on its state.
 
-    if not alive or res <= 0: return []
+    Only for refinements that scored every candidate: a plan cut short by
+    the deadline (e.g. on a cold worker) would be replayed for every later
+    game reaching the same state.
+    """
+    if state.key is not None:
+        decisions.store(state.key, [e.pid for e in state.enemies], actions)
+
+
+def plan_combat(gid: int, turn: int, player: Dict, enemies: List[Dict], diplomacy: List[Dict],
+                previous_attacks: List[Dict], with_state: bool = False) -> Tuple[List[Dict], Any]:
+    """Heuristic combat plan, plus the search.TurnState to refine it from.
 
-    memory.record_intel(gid, turn, my_id, previous_attacks)
-    memory.record_diplomacy(gid, turn, diplomacy, my_id)
+    The state is only built when `with_state` is set and there is something
+    to plan (we are alive, enemies are left and we have resources). A
+    decision-cache hit returns the cached refined plan with no state.
+    """
+    cfg = configs.for_game(gid)
+    my_id = player["playerId"]
+    res = player["resources"]
+    hp = player["hp"]
+    arm = player["armor"]
+    lvl = player["level"]
+    alive = [e for e in enemies if e["hp"] > 0]
+    alive_ids = {e["playerId"] for e in alive}
+
+    if not alive or hp <= 0:
+        _game_over(gid, "lost" if hp <= 0 else "won")  # free its memory now
+        return [], None
+    if res <= 0: return [], None
+
+    # Each part of a turn is ingested once: negotiate already recorded these
+    # attacks, and a retried combat repeats everything
+    tick = perf_counter()
+    if memory.claim_turn(gid, turn, INGEST_ATTACKS):
+        memory.record_intel(gid, turn, my_id, previous_attacks)
+        memory.record_turn(gid, turn, enemies, previous_attacks)
+    tick = metrics.lap("phase:record_intel", tick)
+    if memory.claim_turn(gid, turn, INGEST_COMBAT):
+        memory.record_diplomacy(gid, turn, diplomacy, my_id)
+        tick = metrics.lap("phase:record_diplomacy", tick)
+        if profiles is not None and gid >= 0:  # warm-up games teach nothing
+            profiles.observe_turn(gid, turn, my_id, enemies, previous_attacks, diplomacy)
+            tick = metrics.lap("phase:profiles", tick)
+
+    # One memory read per enemy: pid -> (is_active, aggression)
+    intel = memory.enemy_intel(gid, turn, alive_ids)
+    # Running averages of what the two heaviest attackers send at us
+    observed = 0.0
+    if cfg.observed_threat:
+        observed = memory.threat(gid, turn, my_id, alive_ids) * cfg.observed_threat
+
+    # One pass over diplomacy: who declared war on us, who asked us to attack whom
+    hostile, coordinated = set(), set()
+    for d in diplomacy:
+        act = d.get("action", {})
+        if act.get("attackTargetId") == my_id:
+            hostile.add(d["playerId"])
+        if act.get("allyId") == my_id:
+            target = act.get("attackTargetId")
+            if target: coordinated.add(int(target))
+    our_allies = memory.get_our_allies(gid)
 
-    # 1. Threat Prediction (Top 2 Active)
-    threats = []
+    # Refined plans are cached by canonical turn state (cache.py); the
+    # heuristic alone costs about what building the key does
+    key = None
+    if with_state and decisions is not None:
+        pids = [e["playerId"] for e in alive]
+        key = (PLANNER, cfg, turn, hp, arm, res, lvl, observed, tuple(
+            (e["hp"], e["armor"], e["level"], *intel[pid], pid in hostile, pid in coordinated,
+             pid in our_allies, _stash(pid, cfg.stash) if profiles is not None else 0.0)
+            for e, pid in zip(alive, pids)))
+        result = decisions.lookup(key, pids)
+        if result is not None:
+            if turn >= MAX_TURN:
+                _game_over(gid, "max_turn")
+            metrics.lap("phase:cached", tick)
+            return result, None
+
+    # 1. Threat Prediction (Top 2 Active), top-2 kept while scanning
+    enemy_threat = {}
+    top1 = top2 = 0.0
     for e in alive:
-        pid = int(e["playerId"])
-        income = res_per_turn(int(e["level"]))
-        est_res = income * 2.0 # Heuristic human stash
-        t = est_res * 0.6 * (1.0 + int(e["level"])*0.1)
-        if not memory.is_active(gid, pid, turn): t *= 0.2
-        if any(d.get("action", {}).get("attackTargetId") == my_id for d in diplomacy if d["playerId"] == pid):
-            t *= 1.8 # Declared hostile
-        threats.append(t)
-    
-    threats.sort(reverse=True)
-    predicted_dmg = sum(threats[:2]) * 1.1
+        pid = e["playerId"]
+        income = res_per_turn(e["level"])
+        est_res = income * _stash(pid, cfg.stash) # Observed (or heuristic) stash
+        t = est_res * cfg.stash_share * (1.0 + e["level"]*cfg.level_bonus)
+        if not intel[pid][0]: t *= cfg.afk_threat
+        if pid in hostile:
+            t *= cfg.hostile_threat # Declared hostile
+        enemy_threat[pid] = t
+        if t > top1: top1, top2 = t, top1
+        elif t > top2: top2 = t
+
+    predicted_dmg = max(top1 + top2, observed) * cfg.threat_margin
+    tick = metrics.lap("phase:threat", tick)
 
     actions = []
     avail = res
@@ -186,80 +594,96 @@ def combat(gid: int, turn: int, player: Dict, enemies: List[Dict],
         can_afford = avail >= cost + 5
         
         # Priority 1: Early rush (Turns 1-6)
-        should_upg = (turn <= 5 and avail >= cost)
+        should_upg = (turn <= cfg.rush_turn and avail >= cost)
         
         # Priority 2: Mid-game ROI
-        if not should_upg and turn < 18:
-            gain = res_per_turn(lvl + 1) - res_per_turn(lvl)
-            payback = cost / gain
-            remaining = max(1, FATIGUE_TURN - turn + 5)
-            if payback < remaining * 0.7 and (hp + arm - predicted_dmg) > 25:
+        if not should_upg and turn < cfg.roi_last_turn:
+            payback = payback_turns(lvl)
+            remaining = max(1, cfg.roi_horizon - turn)
+            if payback < remaining * cfg.roi_factor and (hp + arm - predicted_dmg) > cfg.roi_hp_margin:
                 should_upg = True
         
         if should_upg and avail >= cost:
             actions.append({"type": "upgrade"})
             avail -= cost
-            print(f"[STRATEGY] Upgrading to L{lvl+1}. Turn {turn}")
+            kwlog.info("STRATEGY", "Upgrading to L%s", lvl + 1,
+                       gameId=gid, turn=turn, decision="upgrade")
+
+    tick = metrics.lap("phase:upgrade", tick)
 
     # 3. Defensive Armor
     fatigue = fatigue_damage(turn)
     total_threat = predicted_dmg + fatigue
     hp_after = hp + arm - total_threat
 
-    if hp_after < 40 and avail > 0:
-        deficit = 50 - hp_after
+    if hp_after < cfg.armor_floor and avail > 0:
+        deficit = cfg.armor_target - hp_after
         armor_bid = min(avail, max(0, int(deficit)))
         if armor_bid > 0:
             actions.append({"type": "armor", "amount": armor_bid})
             avail -= armor_bid
 
-    # 4. Attack (Focus Fire)
-    coordinated = set()
-    for d in diplomacy:
-        if d.get("action", {}).get("allyId") == my_id:
-            target = d["action"].get("attackTargetId")
-            if target: coordinated.add(int(target))
-
-    our_allies = memory.get_our_allies(gid)
+    tick = metrics.lap("phase:armor", tick)
 
-    def target_score(e):
-        pid = int(e["playerId"])
-        eff_hp = int(e["hp"]) + int(e["armor"])
-        s = 0.0
-        if eff_hp <= avail: s += 5000 # KILL SHOT
-        if pid in coordinated: s += 500
-        if pid in our_allies: s -= 1000 # Respect alliance
-        if not memory.is_active(gid, pid, turn): s -= 800 # AFK Trap
-        s += int(e["level"]) * 50
-        s += memory._get(gid)["agg"][pid] * 0.5
-        return s
-
-    targets = sorted(alive, key=target_score, reverse=True)
+    # 4. Attack (Focus Fire)
+    # Score every enemy once: the avail-independent part is kept so the kill
+    # bonus can be re-applied as troops run out
+    base, scores, ranked = {}, {}, []
+    for i, e in enumerate(alive):
+        pid = e["playerId"]
+        active, agg = intel[pid]
+        b = 0.0
+        if pid in coordinated: b += cfg.w_coordinated
+        if pid in our_allies: b += cfg.w_ally # Respect alliance
+        if not active: b += cfg.w_afk # AFK Trap
+        b += e["level"] * cfg.w_level + agg * cfg.w_aggression
+        base[pid] = b
+        scores[pid] = s = b + cfg.w_kill if e["hp"] + e["armor"] <= avail else b # KILL SHOT
+        ranked.append((-s, i))
+    # Lazy top-k: pops come out in (stable) descending score order and the
+    # loop below rarely needs more than a few of them
+    heapq.heapify(ranked)
     attacked = set()
-    for t in targets:
+    while ranked:
         if avail <= 0 or len(attacked) >= 2: break
-        tid = int(t["playerId"])
-        priority = target_score(t)
+        t = alive[heapq.heappop(ranked)[1]]
+        tid = t["playerId"]
+        priority = base[tid] + cfg.w_kill if t["hp"] + t["armor"] <= avail else base[tid]
         
         # REMOVED: restrictive skip.
         # Now we only skip if it's a very strong ally AND we have other targets.
-        if priority < -1500 and len(alive) > 1: continue
+        if priority < cfg.skip_below and len(alive) > 1: continue
 
-        eff_hp = int(t["hp"]) + int(t["armor"])
+        eff_hp = t["hp"] + t["armor"]
         if eff_hp <= avail:
             troops = eff_hp
-        elif priority > 1000:
-            troops = int(avail * 0.8)
+        elif priority > cfg.commit_priority:
+            troops = int(avail * cfg.commit_share)
         else:
             troops = avail if len(attacked) == 0 else avail
             
         troops = max(1, min(int(troops), avail))
-        print(f"[STRATEGY] Attacking {tid} with {troops} troops (Score: {priority})")
+        kwlog.info("STRATEGY", "Attacking %s with %s troops (Score: %s)", tid, troops, priority,
+                   gameId=gid, turn=turn, decision="attack")
         actions.append({"type": "attack", "targetId": tid, "troopCount": troops})
         avail -= troops
         attacked.add(tid)
 
-    return _validate(actions, res, lvl, alive_ids)
+    tick = metrics.lap("phase:targeting", tick)
+
+    if turn >= MAX_TURN:
+        _game_over(gid, "max_turn")
+    result = _validate(actions, res, lvl, alive_ids)
+    metrics.lap("phase:validate", tick)
+
+    if not with_state:
+        return result, None
+    return result, search.TurnState(
+        turn, hp, arm, res, lvl, predicted_dmg,
+        tuple(search.Enemy(e["playerId"], e["hp"] + e["armor"],
+                           enemy_threat[e["playerId"]], scores[e["playerId"]],
+                           e["level"], intel[e["playerId"]][1])
+              for e in alive), key)
 
 
 def _validate(actions: List[Dict], total_res: int, level: int, alive_ids: Set[int]) -> List[Dict]:
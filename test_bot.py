@@ -228,6 +228,1037 @@ def test_runaway_detection():
     print("✓ Runaway detection test passed")
 
 
+def test_sqlite_memory_shared():
+    """Test that two SQLite-backed memories (two workers) share intel."""
+    print("\n=== TEST: Shared SQLite Memory ===")
+
+    import os
+    import tempfile
+    from memory_store import SQLiteMemory
+
+    path = os.path.join(tempfile.mkdtemp(), "kw_memory.db")
+    worker_a = SQLiteMemory(path)
+    worker_b = SQLiteMemory(path)
+
+    # Player 2 allies with us on turn 3 (seen by worker A)...
+    worker_a.record_diplomacy(7, 3, [{"playerId": 2, "action": {"allyId": 1}}], my_id=1)
+    # ...and attacks us on turn 4 (seen by worker B)
+    worker_b.record_intel(7, 4, 1, [{"playerId": 2, "action": {"targetId": 1, "troopCount": 30}}])
+    worker_b.set_our_allies(7, [3])
+
+    assert worker_a.aggression(7, 2) == 30, "Aggression should be shared"
+    assert worker_a.get_trust(7, 2) == 0.0, "Betrayal should be shared"
+    assert worker_a.is_active(7, 2, 5), "Activity should be shared"
+    assert worker_a.get_our_allies(7) == {3}, "Our allies should be shared"
+    print("✓ Shared SQLite memory test passed")
+
+
+def test_affinity_router():
+    """Test that every turn of a game lands on the same strategy worker."""
+    print("\n=== TEST: Game-Affinity Router ===")
+
+    import asyncio
+    from router import AffinityRouter, game_slot
+
+    assert {game_slot(g, 4) for g in range(1000)} == {0, 1, 2, 3}, "All workers get games"
+    assert all(game_slot(g, 4) == game_slot(g, 4) for g in range(100)), "Routing is stable"
+
+    async def play():
+        router = AffinityRouter(2)
+        router.start()
+        try:
+            for gid in (101, 102):
+                await router.call(gid, "combat", gid=gid, turn=4,
+                                  player={"playerId": 1, "hp": 90, "armor": 0, "resources": 10, "level": 1},
+                                  enemies=[{"playerId": 2, "hp": 100, "armor": 0, "level": 1}],
+                                  diplomacy=[],
+                                  previous_attacks=[{"playerId": 2, "action": {"targetId": 1, "troopCount": 12}}])
+            return [await router.call(gid, "memory", "aggression", gid, 2) for gid in (101, 102)]
+        finally:
+            router.close()
+
+    assert asyncio.run(play()) == [12, 12], "Intel should stay with the game's worker"
+    print("✓ Affinity router test passed")
+
+
+def test_memory_eviction():
+    """Test request-time LRU/TTL/finished-game eviction."""
+    print("\n=== TEST: Memory Eviction ===")
+
+    mem = strategy.GameMemory(max_games=3, ttl=3600, max_bytes=1 << 30)
+    for gid in range(5):
+        mem.record_intel(gid, 1, 1, [{"playerId": 2, "action": {"targetId": 1, "troopCount": 5}}])
+    assert set(mem._g) == {2, 3, 4}, "Oldest games should be evicted first"
+
+    mem.aggression(2, 2)  # touch game 2 so game 3 is now least recently used
+    mem.record_intel(5, 1, 1, [])
+    assert set(mem._g) == {2, 4, 5}, "LRU order should follow access"
+
+    # Reads of an unknown game answer neutral defaults and create nothing
+    assert mem.aggression(999, 2) == 0 and mem.get_trust(999, 2) == 0.5 and mem.is_active(999, 2, 2)
+    assert mem.enemy_intel(999, 9, [2]) == {2: (False, 0)} and mem.attacks_on(999, 1, 0) == {}
+    assert mem.threat(999, 9, 1, {2}) == 0.0 and not mem.get_our_allies(999)
+    assert set(mem._g) == {2, 4, 5}, "Reads must not create (or evict) games"
+
+    mem.finish_game(4)
+    mem.ttl = -1
+    mem.cleanup()
+    stats = mem.stats()
+    print(f"Stats: {stats}")
+    assert stats["evicted_lru"] == 3 and stats["evicted_finished"] == 1
+    assert stats["evicted_ttl"] == 1 and stats["games"] == 1
+
+    # Combat with no enemies left frees the game eagerly
+    strategy.combat(gid=901, turn=3, player={"playerId": 1, "hp": 50, "armor": 0, "resources": 10, "level": 1},
+                    enemies=[{"playerId": 2, "hp": 0, "armor": 0, "level": 1}], diplomacy=[], previous_attacks=[])
+    assert 901 not in strategy.memory._g, "Finished game should be freed"
+
+    # A retry of the last turn after the game ended is not ingested again
+    me = {"playerId": 1, "hp": 50, "armor": 0, "resources": 10, "level": 1}
+    lobby = [{"playerId": 2, "hp": 40, "armor": 0, "level": 1}]
+    hit = [{"playerId": 2, "action": {"targetId": 1, "troopCount": 7}}]
+    first = strategy.combat(902, strategy.MAX_TURN, me, lobby, [], hit)
+    assert 902 not in strategy.memory._g
+    assert strategy.combat(902, strategy.MAX_TURN, me, lobby, [], hit) == first
+    strategy.negotiate(902, strategy.MAX_TURN, me, lobby, hit)
+    assert 902 not in strategy.memory._g and not strategy.memory.claim_turn(902, 1, 0)
+
+    import os
+    import tempfile
+    from memory_store import SQLiteMemory
+
+    with tempfile.TemporaryDirectory() as d:
+        db = SQLiteMemory(os.path.join(d, "kw.db"), max_games=3, ttl=3600)
+        for gid in range(5):
+            db.record_intel(gid, 1, 1, [{"playerId": 2, "action": {"targetId": 1, "troopCount": 5}}])
+        db.cleanup()
+        assert db.stats()["games"] == 3 and db.stats()["evicted_lru"] == 2, "SQLite evicts down to max_games"
+        db.claim_turn(9, 1, 0)  # a claim alone must not outlive the TTL
+        db.ttl = -1
+        db.cleanup()
+        orphans = [t for t in ("ingested", "intel", "attack_log")
+                   if db._db.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]]
+        assert db.stats()["games"] == 0 and not orphans, orphans
+    print("✓ SQLite cleanup evicts to max_games and sweeps claim-only games")
+    print("✓ Memory eviction test passed")
+
+
+def test_compact_game_state():
+    """Test the array-backed per-game record and its alliance window."""
+    print("\n=== TEST: Compact Game State ===")
+
+    mem = strategy.GameMemory()
+    ally = lambda pid: [{"playerId": pid, "action": {"allyId": 1}}]
+    hit = lambda pid, n: [{"playerId": pid, "action": {"targetId": 1, "troopCount": n}}]
+
+    mem.record_diplomacy(1, 3, ally(2), my_id=1)
+    mem.record_diplomacy(1, 5, ally(3), my_id=1)
+    mem.record_intel(1, 4, 1, hit(2, 10))   # allied on turn 3 -> betrayal
+    mem.record_intel(1, 9, 1, hit(3, 7))    # allied on turn 5, not turn 8 -> no betrayal
+
+    assert mem.get_trust(1, 2) == 0.0, "Betrayer trust should drop to 0"
+    assert mem.get_trust(1, 3) == 0.8, "Past ally keeps ally trust"
+    assert mem.get_trust(1, 4) == 0.5, "Unknown player is neutral"
+    assert mem.enemy_intel(1, 10, [2, 3, 4]) == {2: (False, 10), 3: (True, 7), 4: (False, 0)}
+
+    g = mem._get(1)
+    g.mark_allied(g.index(5), 200)
+    g.mark_allied(g.index(5), 100)      # too old for the window: ignored
+    assert g.allied_at(g.index(5), 200) and not g.allied_at(g.index(5), 100)
+    print("✓ Compact game state test passed")
+
+
+def test_latency_histograms():
+    """Test histogram quantiles, merging, and strategy phase timing."""
+    print("\n=== TEST: Latency Histograms ===")
+
+    import metrics
+
+    h = metrics.Histogram()
+    for ms in range(1, 101):
+        h.record(ms / 1000)
+    assert abs(h.quantile(0.50) - 0.050) / 0.050 < 0.1, "p50 within one bucket"
+    assert abs(h.quantile(0.99) - 0.099) / 0.099 < 0.1, "p99 within one bucket"
+
+    other = metrics.Histogram.from_state(h.to_state())
+    other.merge(h)
+    assert other.count == 200 and other.quantile(0.5) == h.quantile(0.5)
+
+    strategy.combat(gid=902, turn=3, player={"playerId": 1, "hp": 90, "armor": 0, "resources": 30, "level": 1},
+                    enemies=[{"playerId": 2, "hp": 100, "armor": 0, "level": 1}], diplomacy=[], previous_attacks=[])
+    report = metrics.report(metrics.merge([metrics.snapshot()]), ["/combat"])
+    for phase in ("record_intel", "record_diplomacy", "threat", "upgrade", "targeting", "validate"):
+        assert report["phases"][phase]["count"] > 0, f"{phase} should be timed"
+    print("✓ Latency histogram test passed")
+
+
+def test_buffered_logging():
+    """Test that logging never blocks when the writer falls behind."""
+    print("\n=== TEST: Buffered Logging ===")
+
+    import logging
+    import queue
+    import kwlog
+
+    h = kwlog._DroppingQueueHandler(queue.Queue(maxsize=2))
+    for i in range(5):
+        h.handle(logging.LogRecord("kw", logging.INFO, __file__, 0, "turn %s", (i,), None))
+    assert h.queue.qsize() == 2 and h.dropped == 3, "Full queue should drop, not block"
+
+    record = h.queue.get_nowait()
+    record.tag, record.fields = "STRATEGY", {"gameId": 9, "turn": 4, "decision": "attack"}
+    line = kwlog._Formatter().format(record)
+    assert line == "[STRATEGY] turn 0 gameId=9 turn=4 decision=attack", line
+    print("✓ Buffered logging test passed")
+
+
+def test_anytime_search():
+    """Test the anytime planner keeps valid plans and honours its deadline."""
+    print("\n=== TEST: Anytime Search ===")
+
+    import time
+    import search
+
+    state = search.TurnState(turn=10, hp=60, armor=0, res=100, level=3, incoming=30.0, enemies=(
+        search.Enemy(pid=2, eff_hp=25, threat=20.0, score=100.0),
+        search.Enemy(pid=3, eff_hp=120, threat=25.0, score=50.0),
+    ))
+    weak_plan = [{"type": "attack", "targetId": 3, "troopCount": 10}]
+
+    # Deadline already passed: heuristic plan comes back untouched
+    same, info = search.improve(weak_plan, state, time.perf_counter(), {2, 3})
+    assert same == weak_plan and info["candidates"] == 0
+
+    better, info = search.improve(weak_plan, state, time.perf_counter() + 0.15, {2, 3})
+    print(f"Improved plan: {better} ({info['candidates']} candidates)")
+    assert info["gain"] > 0, "Search should beat a weak plan"
+    assert any(a["type"] == "attack" and a["targetId"] == 2 and a["troopCount"] >= 25 for a in better), \
+        "Search should find the kill shot"
+    assert better == strategy._validate(better, 100, 3, {2, 3}), "Result must be valid"
+    print("✓ Anytime search test passed")
+
+
+def test_simulator():
+    """Test full simulated games and the batch harness."""
+    print("\n=== TEST: Game Simulator ===")
+
+    import metrics
+    import simulator
+
+    latency = metrics.Histogram()
+    result = simulator.play_game(gid=10_001, players=3, opponents=["passive"], seed=1, latency=latency)
+    assert result.won and not result.draw, "Should beat passive bots"
+    assert latency.count > 0, "Decisions should be timed"
+    assert 10_001 not in strategy.memory._g, "Finished game memory should be freed"
+
+    report = simulator.run_batch(games=20, players=4, opponents=["random", "aggressor"], procs=1, chunk=10)
+    print(f"Batch: {report['win_rate']:.0%} wins, survival turn {report['avg_survival_turn']:.1f}")
+    assert report["games"] == 20 and 0 <= report["win_rate"] <= 1
+    assert report["decision_latency"]["count"] > 0
+    print("✓ Simulator test passed")
+
+
+def test_batch_matches_scalar():
+    """Test that vectorized batch decisions equal strategy.combat."""
+    print("\n=== TEST: Batch Evaluation ===")
+
+    try:
+        import batch
+    except ImportError:
+        print("numpy not installed (requirements-dev.txt) - skipped")
+        return
+    import dataclasses
+    import random
+
+    def play(first_gid: int):
+        r = random.Random(7)
+        rows, expected = [], []
+        for n in range(300):
+            gid, turn, ids = first_gid + n, r.randint(1, 35), list(range(2, r.randint(2, 8) + 1))
+            me = {"playerId": 1, "hp": r.randint(1, 100), "armor": r.randint(0, 30),
+                  "resources": r.randint(0, 250), "level": r.randint(1, 5)}
+            enemies = [{"playerId": i, "hp": r.choice([0, r.randint(1, 100)]), "armor": r.randint(0, 30),
+                        "level": r.randint(1, 5)} for i in ids]
+            prev = [{"playerId": i, "action": {"targetId": r.choice([1] + ids), "troopCount": r.randint(0, 60)}}
+                    for i in ids if r.random() < 0.6]
+            diplo = [{"playerId": i, "action": {"allyId": r.choice([1] + ids), "attackTargetId": r.choice([1] + ids)}}
+                     for i in ids if r.random() < 0.6]
+            strategy.memory.set_our_allies(gid, [i for i in ids if r.random() < 0.3])
+            allies = set(strategy.memory.get_our_allies(gid))
+            expected.append(strategy.combat(gid, turn, me, enemies, diplo, prev))
+            alive = {e["playerId"] for e in enemies if e["hp"] > 0}
+            rows.append({"turn": turn, "player": me, "enemies": enemies, "diplomacy": diplo,
+                         "intel": strategy.memory.enemy_intel(gid, turn, ids), "our_allies": allies,
+                         "observed": strategy.memory.threat(gid, turn, 1, alive)})
+        return rows, expected
+
+    saved = strategy.configs._active
+    observing = dataclasses.replace(saved.default, observed_threat=1.5)
+    for cfg, first_gid in ((saved.default, 20_000), (observing, 21_000)):
+        strategy.configs._active = saved._replace(default=cfg)
+        try:
+            rows, expected = play(first_gid)
+        finally:
+            strategy.configs._active = saved
+        positions = batch.pack(rows)
+        decisions = batch.evaluate(positions, cfg)
+        for g, want in enumerate(expected):
+            assert batch.actions(positions, decisions, g) == want, f"Row {g} differs"
+        if cfg.observed_threat:  # the floor must actually bind somewhere
+            plain = batch.evaluate(positions, saved.default)
+            assert (decisions.predicted_dmg > plain.predicted_dmg).any()
+        print(f"✓ {len(rows)} positions match the scalar path (observed_threat={cfg.observed_threat})")
+
+    # Levels past the economy tables fall back to the formula, as res_per_turn does
+    me = {"playerId": 1, "hp": 60, "armor": 0, "resources": 400, "level": 9}
+    enemies = [{"playerId": 2, "hp": 80, "armor": 5, "level": 8}, {"playerId": 3, "hp": 50, "armor": 0, "level": 0}]
+    want = strategy.combat(22_000, 12, me, enemies, [], [])
+    row = {"turn": 12, "player": me, "enemies": enemies, "diplomacy": [], "our_allies": set(),
+           "intel": strategy.memory.enemy_intel(22_000, 12, [2, 3])}
+    positions = batch.pack([row])
+    assert batch.actions(positions, batch.evaluate(positions), 0) == want
+    print("✓ Out-of-range tower levels match the scalar path")
+    print("✓ Batch evaluation test passed")
+
+
+def test_economy_tables():
+    """Test that economy tables match the game formulas."""
+    print("\n=== TEST: Economy Tables ===")
+
+    import math
+    import economy
+
+    for level in range(1, economy.MAX_LEVEL + 2):
+        assert economy.res_per_turn(level) == int(round(20 * (1.5 ** (level - 1))))
+        assert economy.upg_cost(level) == math.ceil(50 * (1.75 ** (level - 1)))
+    for turn in range(0, 300):
+        assert economy.fatigue_damage(turn) == (0 if turn <= 25 else 5 * (turn - 25))
+    assert strategy.upg_cost is economy.upg_cost, "strategy should re-export the table lookups"
+    print(f"✓ Income {economy.RES_PER_TURN[1:]}, costs {economy.UPG_COST[1:]}")
+
+    assert economy.payback_turns(1) == 50 / 10
+    for level in range(1, economy.MAX_LEVEL + 1):
+        assert economy.payback_turns(level) == economy.upg_cost(level) / (
+            economy.res_per_turn(level + 1) - economy.res_per_turn(level))
+    assert economy.payback_turns(economy.MAX_LEVEL + 1) == math.inf
+    print("✓ Upgrade payback lookups match cost / income gain")
+    print("✓ Economy tables test passed")
+
+
+def test_record_replay():
+    """Test that recorded traffic replays to identical decisions."""
+    print("\n=== TEST: Record / Replay ===")
+
+    import tempfile
+    import recorder
+    import replay
+
+    saved = strategy.memory, strategy.profiles, strategy.decisions, strategy.configs
+    try:
+        with tempfile.TemporaryDirectory() as d:
+            rec = recorder.Recorder(d, segment_records=7)
+            rec.start()
+            strategy.memory = strategy.GameMemory()
+            me = {"playerId": 1, "hp": 100, "armor": 0, "resources": 60, "level": 1}
+            enemies = [{"playerId": i, "hp": 100 - 9 * i, "armor": 0, "level": 1} for i in (2, 3, 4)]
+            attacks = []
+            for turn in range(1, 11):
+                req = {"gameId": 77, "turn": turn, "playerTower": me, "enemyTowers": enemies,
+                       "combatActions": attacks}
+                out = strategy.negotiate(77, turn, me, enemies, attacks)
+                rec.record("/negotiate", req, out, 0.001, 0.0005)
+                attacks = [{"playerId": 2 + turn % 3, "action": {"targetId": 1, "troopCount": 10 + turn}}]
+                diplo = [{"playerId": 3, "action": {"allyId": 1, "attackTargetId": 2}}]
+                req = {"gameId": 77, "turn": turn, "playerTower": me, "enemyTowers": enemies,
+                       "diplomacy": diplo, "previousAttacks": attacks}
+                out = strategy.combat(77, turn, me, enemies, diplo, attacks)
+                rec.record("/combat", req, out, 0.002, 0.001)
+            rec.close()
+
+            assert rec.stats()["recorded"] == 20 and rec.stats()["segments"] == 3
+            records = list(recorder.read_segments(d))
+            assert [r["path"] for r in records[:2]] == ["/negotiate", "/combat"]
+            print(f"✓ {len(records)} exchanges in {rec.stats()['segments']} gzip segments")
+
+            result = replay.replay(records, strategy)
+            assert result["records"] == 20
+            assert result["diffs"] == [], result["diffs"][:1]
+            print("✓ Replay rebuilt memory and matched every decision")
+
+            records[-1]["response"] = []
+            assert len(replay.replay(records, strategy)["diffs"]) == 1
+            print("✓ Changed decision reported as a diff")
+
+            from profiles import ProfileStore
+            live = strategy.profiles = ProfileStore(capacity=64)
+            runs = [replay.replay(records, strategy)["diffs"] for _ in range(2)]
+            assert runs[0] == runs[1] and live.stats()["players"] == 0
+            assert strategy.profiles is not live and strategy.profiles.stats()["players"] == 3
+            print("✓ Replays with profiles on are repeatable and leave the live profiles alone")
+    finally:
+        strategy.memory, strategy.profiles, strategy.decisions, strategy.configs = saved
+    print("✓ Record/replay test passed")
+
+
+def test_opponent_profiles():
+    """Test cross-game opponent profiles and their use in strategy."""
+    print("\n=== TEST: Opponent Profiles ===")
+
+    import os
+    import tempfile
+    import profiles
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "profiles.bin")
+        p = profiles.ProfileStore(path, capacity=1024)
+        enemies = [{"playerId": 2, "hp": 100, "armor": 0, "level": 1},
+                   {"playerId": 3, "hp": 100, "armor": 0, "level": 1}]
+        allied = [{"playerId": 2, "action": {"allyId": 1, "attackTargetId": 3}},
+                  {"playerId": 3, "action": {"allyId": 1, "attackTargetId": 2}}]
+        for turn in range(1, 21):
+            # Player 2 hits us with 5 turns of income every turn while allied; 3 keeps the peace
+            attacks = [{"playerId": 2, "action": {"targetId": 1, "troopCount": 100}}] if turn > 1 else []
+            p.observe_turn(9, turn, 1, enemies, attacks, allied)
+        assert p.profile(2)["attacks"] == 19 and p.profile(2)["betrayals"] == 19
+        assert p.profile(3)["kept"] == 19 and p.profile(3)["turns"] == 20
+        assert p.stash(2) > profiles.DEFAULT_STASH and p.stash(99) == profiles.DEFAULT_STASH
+        assert p.trust(2) < profiles.MIN_TRUST < p.trust(3)
+        print(f"✓ stash(2)={p.stash(2):.2f}, trust(2)={p.trust(2):.2f}, trust(3)={p.trust(3):.2f}")
+        p.close()
+
+        p = profiles.ProfileStore(path)
+        assert p.capacity == 1024 and p.stats()["players"] == 2 and p.profile(2)["betrayals"] == 19
+        print("✓ Profiles persist in the mmap file across restarts")
+
+        saved = strategy.profiles
+        strategy.profiles = p
+        try:
+            me = {"playerId": 1, "hp": 100, "armor": 0, "resources": 0, "level": 3}
+            lobby = [{"playerId": 2, "hp": 100, "armor": 0, "level": 3},
+                     {"playerId": 3, "hp": 90, "armor": 0, "level": 3},
+                     {"playerId": 4, "hp": 10, "armor": 0, "level": 1}]
+            allies = {pr["allyId"] for pr in strategy.negotiate(31_000, 2, me, lobby, [])}
+            assert 2 not in allies and 3 in allies, allies
+            print("✓ Negotiate skips partners that betrayed us before")
+        finally:
+            strategy.profiles = saved
+            p.close()
+    print("✓ Opponent profiles test passed")
+
+
+def test_threat_hostility_index():
+    """Test that declared hostility raises the predicted damage."""
+    print("\n=== TEST: Threat Hostility Index ===")
+
+    me = {"playerId": 1, "hp": 100, "armor": 0, "resources": 100, "level": 5}
+    enemies = [{"playerId": i, "hp": 100, "armor": 50, "level": 1} for i in range(2, 42)]
+    peace = [{"playerId": i, "action": {"allyId": i + 1, "attackTargetId": i + 2}} for i in range(2, 42)]
+    war = peace + [{"playerId": 7, "action": {"allyId": 8, "attackTargetId": 1}},
+                   {"playerId": 9, "action": {"allyId": 1, "attackTargetId": 1}}]
+
+    def armor(diplomacy, gid):
+        actions = strategy.combat(gid, 2, me, enemies, diplomacy, [])
+        return sum(a["amount"] for a in actions if a["type"] == "armor")
+
+    calm, threatened = armor(peace, 32_000), armor(war, 32_001)
+    # Two of 40 equal enemies declared war: top-2 threat x1.8
+    assert threatened > calm, (calm, threatened)
+    print(f"✓ Armor {calm} -> {threatened} when two enemies declare war on us")
+    print("✓ Threat hostility index test passed")
+
+
+def test_large_lobby():
+    """Test negotiate/combat selection in a 300-tower lobby."""
+    print("\n=== TEST: Large Lobby ===")
+
+    me = {"playerId": 1, "hp": 100, "armor": 0, "resources": 400, "level": 5}
+    enemies = [{"playerId": i, "hp": 50 + i % 40, "armor": 10, "level": 1 + i % 3} for i in range(2, 302)]
+    enemies[100] = {"playerId": 102, "hp": 100, "armor": 0, "level": 5}   # leader, killable, top score
+    enemies[200] = {"playerId": 202, "hp": 5, "armor": 0, "level": 1}     # weakest
+
+    proposals = strategy.negotiate(33_000, 2, me, enemies, [])
+    assert proposals and all(p["attackTargetId"] in (102, 202) for p in proposals), proposals
+    print(f"✓ Negotiate found leader/weakest among 300: {proposals}")
+
+    actions = strategy.combat(33_000, 2, me, enemies, [], [])
+    attacks = [a for a in actions if a["type"] == "attack"]
+    assert len(attacks) == 2 and attacks[0] == {"type": "attack", "targetId": 102, "troopCount": 100}, attacks
+    print(f"✓ Combat picks the best kill shot among 300: {attacks[0]}")
+    print("✓ Large lobby test passed")
+
+
+def test_lean_serving():
+    """Test the orjson/raw-body serving path and the ASGI middleware."""
+    print("\n=== TEST: Lean Serving Path ===")
+
+    import asyncio
+    import json
+    import server
+    from warmup import request
+
+    body = json.dumps({"gameId": 34_000, "turn": 1,
+                       "playerTower": {"playerId": 1, "hp": 100, "armor": 0, "resources": 20, "level": 1},
+                       "enemyTowers": [{"playerId": 2, "hp": 10, "armor": 0, "level": 1}],
+                       "diplomacy": [], "previousAttacks": []}).encode()
+    before = server.metrics.counters.get("errors:/combat", 0)
+    status, raw = asyncio.run(request(server.app, "/combat", body))
+    assert status == 200 and json.loads(raw) == [{"type": "attack", "targetId": 2, "troopCount": 10}], raw
+    print(f"✓ /combat -> {raw.decode()}")
+
+    status, raw = asyncio.run(request(server.app, "/combat", b'{"gameId": 1, "turn": "x"}'))
+    detail = json.loads(raw)["detail"]
+    assert status == 422 and detail[0]["loc"] == ["body", "turn"], raw
+    assert server.metrics.counters["errors:/combat"] == before + 1
+    print("✓ Invalid body -> 422 in FastAPI's error format, counted as an error")
+    print("✓ Lean serving test passed")
+
+
+def test_strategy_config():
+    """Test hot-reloaded strategy parameters and A/B variant routing."""
+    print("\n=== TEST: Strategy Config ===")
+
+    import json
+    import os
+    import tempfile
+    import config
+    import metrics
+
+    def write(path, doc, stamp):
+        with open(path, "w") as f:
+            f.write(doc if isinstance(doc, str) else json.dumps(doc))
+        os.utime(path, ns=(stamp, stamp))  # distinct mtimes even within one tick
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "strategy.json")
+        write(path, {"variants": {"bold": {"armor_floor": -1000}}, "split": {"bold": 30}}, 10**9)
+        store = config.ConfigStore(path, check_every=0)
+        names = [store.for_game(gid).name for gid in range(2000)]
+        assert all(store.for_game(gid).name == n for gid, n in zip(range(2000), names))
+        share = names.count("bold") / len(names)
+        assert 0.25 < share < 0.35, share
+        print(f"✓ Stable split by gameId: {share:.1%} of games on 'bold'")
+
+        write(path, '{"default": {"no_such_knob": 1}}', 2 * 10**9)
+        assert not store.reload() and store.for_game(names.index("bold")).name == "bold"
+        print("✓ Invalid config is rejected, previous one stays active")
+
+        write(path, {"default": {"bluff_ratio": 9.0}}, 3 * 10**9)
+        assert store.for_game(0).bluff_ratio == 9.0 and not store.split
+        assert store.describe()["version"] == 2
+        print("✓ Config change picked up without restart")
+
+        write(path, {"variants": {"bold": {"armor_floor": -1000}}, "split": {"bold": 100}}, 4 * 10**9)
+        saved = strategy.configs
+        strategy.configs = store
+        try:
+            me = {"playerId": 1, "hp": 20, "armor": 0, "resources": 30, "level": 5}
+            lobby = [{"playerId": 2, "hp": 100, "armor": 0, "level": 3}]
+            actions = strategy.combat(32_000, 30, me, lobby, [], [])
+            assert not any(a["type"] == "armor" for a in actions), actions
+            strategy.configs = saved
+            actions = strategy.combat(32_001, 30, me, lobby, [], [])
+            assert any(a["type"] == "armor" for a in actions), actions
+            print("✓ Variant parameters drive the strategy")
+
+            strategy.configs = store
+            metrics.reset()
+            strategy.combat(32_000, 31, me, [], [], [])
+            strategy.negotiate(32_000, 31, me, [], [])  # same game seen ending twice
+            v = metrics.report(metrics.merge([metrics.snapshot()]), [])["variants"]["bold"]
+            assert v["games"] == 1 and v["won"] == 1 and v["win_rate"] == 1.0, v
+            print("✓ Per-variant outcomes counted once per game")
+
+            small = strategy.GameMemory(max_games=1, on_evict=strategy._evicted)
+            small.claim_turn(32_002, 1, 0)
+            small.claim_turn(32_003, 1, 0)  # LRU-evicts 32_002 before it finished
+            small.finish_game(32_003)
+            v = metrics.report(metrics.merge([metrics.snapshot()]), [])["variants"]["bold"]
+            assert v["evicted"] == 1 and v["evicted_rate"] == 0.5 and v["win_rate"] == 1.0, v
+            print("✓ Games evicted before finishing are reported per variant")
+        finally:
+            strategy.configs = saved
+    print("✓ Strategy config test passed")
+
+
+def test_offload_executor():
+    """Test offloaded plan refinement and the inline fallback on a missed deadline."""
+    print("\n=== TEST: Offload Executor ===")
+
+    import asyncio
+    import server
+    from router import AffinityRouter
+
+    turn = dict(turn=6, player={"playerId": 1, "hp": 35, "armor": 0, "resources": 60, "level": 2},
+                enemies=[{"playerId": 2, "hp": 40, "armor": 5, "level": 3},
+                         {"playerId": 3, "hp": 80, "armor": 0, "level": 2}],
+                diplomacy=[], previous_attacks=[{"playerId": 2, "action": {"targetId": 1, "troopCount": 20}}])
+    heuristic, _ = strategy.plan_combat(35_000, **turn)
+
+    saved = server.EXECUTOR, server.router, server.OFFLOAD_SLACK_MS, strategy.SEARCH_MS, strategy.decisions
+    server.EXECUTOR, server.router, strategy.SEARCH_MS = "offload", AffinityRouter(1), 100
+    strategy.decisions = None  # both turns have the same state: refine each of them
+    server.router.start()
+    try:
+        asyncio.run(server.router.call(0, "memory", "stats"))  # wait for the worker's imports
+        before = dict(server.metrics.counters)
+        refined = asyncio.run(server.run_strategy("combat", gid=35_001, **turn))
+        assert server.metrics.counters.get("offload:refined", 0) == before.get("offload:refined", 0) + 1
+        assert refined == strategy._validate(refined, 60, 2, {2, 3})
+        print(f"✓ Refined in the worker: {refined}")
+
+        server.OFFLOAD_SLACK_MS, strategy.SEARCH_MS = -1000, 1  # deadline already missed
+        fallback = asyncio.run(server.run_strategy("combat", gid=35_002, **turn))
+        assert fallback == heuristic, (fallback, heuristic)
+        assert server.metrics.counters["offload:timeout"] == before.get("offload:timeout", 0) + 1
+        print("✓ Missed deadline returns the inline heuristic plan")
+        assert strategy.memory.aggression(35_002, 2) == 20, "Intel stays in the front-end process"
+        print("✓ Game memory stays inline")
+    finally:
+        server.router.close()
+        server.EXECUTOR, server.router, server.OFFLOAD_SLACK_MS, strategy.SEARCH_MS, strategy.decisions = saved
+    print("✓ Offload executor test passed")
+
+
+def test_rollout_planner():
+    """Test the Monte Carlo rollout planner and its heuristic fallback."""
+    print("\n=== TEST: Rollout Planner ===")
+
+    from time import perf_counter
+    import rollout
+    import search
+
+    if rollout.np is None:
+        print("numpy not installed (requirements-dev.txt) - skipped")
+        return
+
+    # Enemy 2 has hit us hard every turn; the all-in attack leaves us dead
+    state = search.TurnState(turn=12, hp=20, armor=0, res=60, level=2, incoming=55.0, enemies=(
+        search.Enemy(2, 90, 50.0, 100.0, level=4, agg=500),
+        search.Enemy(3, 80, 5.0, 50.0, level=2, agg=0)))
+    all_in = [{"type": "attack", "targetId": 2, "troopCount": 60}]
+    plan, info = rollout.improve(all_in, state, perf_counter() + 1.0, {2, 3})
+    armor = sum(a["amount"] for a in plan if a["type"] == "armor")
+    assert armor >= 30 and info["gain"] > 0, (plan, info)
+    assert plan == strategy._validate(plan, 60, 2, {2, 3})
+    assert rollout.improve(all_in, state, perf_counter() + 1.0, {2, 3})[0] == plan, "Seeded by the state"
+    print(f"✓ {info['candidates']} candidates x {info['rollouts']} rollouts: {plan}")
+
+    # A kill shot that ends the game beats banking
+    last = state._replace(hp=100, enemies=(search.Enemy(3, 30, 5.0, 50.0, level=2),))
+    plan, _ = rollout.improve([], last, perf_counter() + 1.0, {3})
+    assert {"type": "attack", "targetId": 3, "troopCount": 30} in plan, plan
+    print("✓ Takes the winning kill shot")
+
+    plan, info = rollout.improve(all_in, state, perf_counter() - 1.0, {2, 3})
+    assert info["candidates"] == rollout.BATCH, "One batch even past the deadline"
+    few = last._replace(res=20)
+    info = rollout.improve([], few, perf_counter() - 1.0, {3})[1]
+    assert info["candidates"] < rollout.BATCH and info["complete"], info
+    print("✓ A batch holding every candidate is complete even past the deadline")
+
+    crowd = state._replace(enemies=tuple(search.Enemy(10 + i, 200, 1.0, 100.0 - i)
+                                         for i in range(rollout.MAX_ENEMIES + 1)))
+    model = rollout._Model(crowd, 16, 1)
+    outside = 10 + rollout.MAX_ENEMIES  # lowest score, not modelled one by one
+    idle, wasted = model.evaluate([(False, 0, ()), (False, 0, ((outside, 30),))], crowd)
+    assert wasted < idle, (idle, wasted)
+    print("✓ Troops sent at enemies beyond MAX_ENEMIES are charged to the plan")
+    saved = rollout.np
+    rollout.np = None
+    try:
+        assert rollout.improve(all_in, state, perf_counter() + 1.0, {2, 3})[0] == all_in
+        print("✓ Without numpy the heuristic plan is returned")
+    finally:
+        rollout.np = saved
+    print("✓ Rollout planner test passed")
+
+
+def test_memory_snapshot():
+    """Test game-memory snapshots: lossless round trip, TTL on restore, corrupt files."""
+    print("\n=== TEST: Memory Snapshot ===")
+
+    import os
+    import tempfile
+    import snapshot
+    from router import game_slot
+
+    live = strategy.GameMemory()
+    for gid in (41_000, 41_001, 41_002):
+        for turn in (1, 2, 3):
+            live.record_diplomacy(gid, turn, [{"playerId": 2, "action": {"allyId": 1}}], 1)
+        live.record_intel(gid, 4, 1, [{"playerId": 2, "action": {"targetId": 1, "troopCount": 30}},
+                                      {"playerId": 3, "action": {"targetId": 4, "troopCount": 5}}])
+        live.set_our_allies(gid, [3])
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "memory.snap")
+        snap = snapshot.Snapshotter(live, path)
+        assert snap.save(wait=True) and snap.stats()["bytes"] == os.path.getsize(path)
+
+        restored = strategy.GameMemory()
+        stats = snapshot.Snapshotter(restored, path).restore()
+        assert stats["games"] == 3 and restored.stats() == live.stats(), stats
+        for gid in (41_000, 41_001, 41_002):
+            assert restored.get_trust(gid, 2) == 0.0 and restored.aggression(gid, 2) == 30
+            assert restored.is_active(gid, 3, 5) and restored.get_our_allies(gid) == {3}
+        print(f"✓ 3 games restored with full intel in {stats['restore_ms']:.2f} ms")
+
+        short = strategy.GameMemory(ttl=0.0)
+        snapshot.Snapshotter(short, path).restore()
+        assert short.stats()["games"] <= 1  # _evict always keeps the newest game
+        print("✓ Games idle past the TTL are dropped on restore")
+
+        mine = strategy.GameMemory()
+        stats = snapshot.Snapshotter(mine, path).restore(keep=lambda gid: game_slot(gid, 2) == 0)
+        assert all(game_slot(gid, 2) == 0 for gid, _ in mine.games()) and stats["games"] == len(mine.games())
+        print("✓ Router workers keep only the games that route to them")
+
+        stale = strategy.GameMemory()  # an offload-era worker file nobody rewrites
+        stale.record_intel(41_000, 5, 1, [{"playerId": 2, "action": {"targetId": 1, "troopCount": 10}}])
+        snapshot.Snapshotter(stale, f"{path}.w1").save(wait=True)
+        assert live.claim_turn(41_000, 5, 0)
+        live.record_intel(41_000, 5, 1, [{"playerId": 2, "action": {"targetId": 1, "troopCount": 30}}])
+        snapshot.Snapshotter(live, path).save(wait=True)
+        merged = strategy.GameMemory()
+        snapshot.Snapshotter(merged, path).restore(f"{path}*")
+        assert merged.aggression(41_000, 2) == 60 and not merged.claim_turn(41_000, 5, 0)
+        print("✓ A game in several files is restored from the freshest one")
+
+        assert snapshot.worker_files(path).endswith(".w*")  # the stale single-process file is ignored
+        assert snapshot.remove_orphans(path, 1) == 2
+        assert not os.path.exists(f"{path}.w1") and not os.path.exists(path)
+        assert snapshot.worker_files(path) == path and snapshot.remove_orphans(path, 1) == 0
+        print("✓ Workers restore from worker files; files no worker rewrites are removed")
+        snapshot.Snapshotter(live, path).save(wait=True)
+
+        with open(path, "r+b") as f:
+            f.seek(40)
+            f.write(b"\xff")
+        empty = strategy.GameMemory()
+        stats = snapshot.Snapshotter(empty, path).restore()
+        assert stats["files"] == 0 and empty.stats()["games"] == 0
+        print("✓ Corrupt snapshot is skipped, bot starts cold")
+    print("✓ Memory snapshot test passed")
+
+
+def test_decision_cache():
+    """Test retried turns served from the retry cache and cached refined plans."""
+    print("\n=== TEST: Decision Cache ===")
+
+    import asyncio
+    import json
+    import server
+    from cache import DecisionCache, RetryCache
+    from warmup import request
+
+    async def post(path, body):
+        return (await request(server.app, path, body))[1]
+
+    def body(gid):
+        return json.dumps({"gameId": gid, "turn": 3,
+                           "playerTower": {"playerId": 1, "hp": 90, "armor": 0, "resources": 40, "level": 2},
+                           "enemyTowers": [{"playerId": 2, "hp": 70, "armor": 0, "level": 2}],
+                           "diplomacy": [], "previousAttacks": [
+                               {"playerId": 2, "action": {"targetId": 1, "troopCount": 7}}]}).encode()
+
+    hits = lambda: server.metrics.counters.get("cache:retry:hits", 0)
+    before = hits()
+    first = asyncio.run(post("/combat", body(36_000)))
+    again = asyncio.run(post("/combat", body(36_000)))
+    assert again == first and hits() == before + 1
+    assert strategy.memory.aggression(36_000, 2) == 7, "a retry must not re-record intel"
+    print(f"✓ Retried turn answered from cache, intel recorded once: {again.decode()}")
+
+    async def duplicate():
+        retries = RetryCache(4)
+        key = retries.key("/combat", body(36_001))
+        assert await retries.claim(key) is None  # first copy: served by the caller
+        waiting = asyncio.ensure_future(retries.claim(key))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        retries.put(key, b"[]")
+        return await waiting
+    assert asyncio.run(duplicate()) == b"[]"
+    print("✓ A duplicate arriving mid-turn waits for the first answer")
+
+    turn = dict(turn=6, player={"playerId": 1, "hp": 35, "armor": 0, "resources": 60, "level": 2},
+                diplomacy=[], previous_attacks=[])
+    saved = strategy.decisions, strategy.SEARCH_MS
+    strategy.decisions, strategy.SEARCH_MS = DecisionCache(16), 5
+    try:
+        refined = strategy.combat(36_100, enemies=[{"playerId": 2, "hp": 40, "armor": 5, "level": 3},
+                                                   {"playerId": 3, "hp": 80, "armor": 0, "level": 2}], **turn)
+        looked = server.metrics.counters.get("cache:decision:hits", 0)
+        other = strategy.combat(36_101, enemies=[{"playerId": 7, "hp": 40, "armor": 5, "level": 3},
+                                                 {"playerId": 9, "hp": 80, "armor": 0, "level": 2}], **turn)
+        assert server.metrics.counters["cache:decision:hits"] == looked + 1
+        relabel = {2: 7, 3: 9}
+        assert other == [{**a, "targetId": relabel[a["targetId"]]} if "targetId" in a else a for a in refined]
+        print(f"✓ Same state in another game reuses the refined plan: {other}")
+
+        strategy.memory.record_intel(36_101, 7, 1, [{"playerId": 7, "action": {"targetId": 1, "troopCount": 30}}])
+        strategy.combat(36_101, enemies=[{"playerId": 7, "hp": 40, "armor": 5, "level": 3},
+                                         {"playerId": 9, "hp": 80, "armor": 0, "level": 2}], **turn)
+        assert server.metrics.counters["cache:decision:hits"] == looked + 1
+        print("✓ New intel changes the key (no stale plan)")
+    finally:
+        strategy.decisions, strategy.SEARCH_MS = saved
+    report = server.metrics.report(server.metrics.merge([server.metrics.snapshot()]), [])["cache"]
+    assert report["retry"]["hits"] >= 2 and 0 < report["decision"]["hit_rate"] < 1, report
+    print(f"✓ Hit rates in /metrics: {report}")
+    print("✓ Decision cache test passed")
+
+
+def test_idempotent_ingestion():
+    """Test that each turn's intel is recorded once across negotiate, combat and retries."""
+    print("\n=== TEST: Idempotent Ingestion ===")
+
+    import os
+    import tempfile
+    import snapshot
+    from memory_store import INGEST_ATTACKS, INGEST_COMBAT, INGEST_PHASES, SQLiteMemory
+
+    me = {"playerId": 1, "hp": 80, "armor": 0, "resources": 30, "level": 2}
+    lobby = [{"playerId": 2, "hp": 90, "armor": 0, "level": 2}, {"playerId": 3, "hp": 90, "armor": 0, "level": 2}]
+    allied = [{"playerId": 2, "action": {"allyId": 1, "attackTargetId": 3}}]
+    hit = [{"playerId": 2, "action": {"targetId": 1, "troopCount": 12}}]
+
+    strategy.combat(37_000, 4, me, lobby, allied, [])
+    strategy.negotiate(37_000, 5, me, lobby, hit)     # last turn's attacks ...
+    strategy.combat(37_000, 5, me, lobby, allied, hit)  # ... arrive again with combat
+    strategy.combat(37_000, 5, me, lobby, allied, hit)  # and once more as a retry
+    assert strategy.memory.aggression(37_000, 2) == 12, strategy.memory.aggression(37_000, 2)
+    g = strategy.memory._g[37_000]
+    assert g.betrayals[g.slot[2]] == 1
+    print("✓ Attacks seen by negotiate, combat and a retry are counted once")
+
+    bytes_before = strategy.memory.stats()["bytes"]
+    assert not strategy.memory.claim_turn(37_000, 10**8, INGEST_ATTACKS)
+    assert g.ingested.bit_length() <= (strategy.MAX_TURN + 1) * INGEST_PHASES
+    assert strategy.memory.stats()["bytes"] == bytes_before and g.nbytes >= strategy._INGEST_BYTES
+    print("✓ Turns past MAX_TURN are not claimed, so the ingestion bitset stays bounded")
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "memory.snap")
+        snapshot.Snapshotter(strategy.memory, path).save(wait=True)
+        restored = strategy.GameMemory()
+        snapshot.Snapshotter(restored, path).restore()
+        assert not restored.claim_turn(37_000, 5, INGEST_ATTACKS) and restored.claim_turn(37_000, 6, INGEST_ATTACKS)
+        print("✓ Ingestion log survives a snapshot restore")
+
+        db = SQLiteMemory(os.path.join(d, "kw.db"))
+        assert db.claim_turn(37_000, 5, INGEST_COMBAT) and not db.claim_turn(37_000, 5, INGEST_COMBAT)
+        assert db.claim_turn(37_000, 5, INGEST_ATTACKS)
+        db.set_our_allies(37_000, [])
+        db.finish_game(37_000)
+        assert db.claim_turn(37_000, 5, INGEST_COMBAT), "a finished game's log is dropped"
+        print("✓ SQLite backend claims each (turn, phase) once across processes")
+    strategy.memory.finish_game(37_000)
+    print("✓ Idempotent ingestion test passed")
+
+
+def test_turn_history():
+    """Test the columnar turn history: bounded rings, windowed queries, backends, snapshots."""
+    print("\n=== TEST: Turn History ===")
+
+    import os
+    import tempfile
+    import snapshot
+    from history import ROWS, Ring
+    from memory_store import SQLiteMemory
+
+    ring = Ring(2, cap=4)
+    for turn in range(1, 8):
+        ring.extend([(turn, turn * 10)])
+    assert ring.rows() == [(4, 40), (5, 50), (6, 60), (7, 70)] and ring.nbytes == 2 * 8 * 4
+    assert ring.rows(6) == [(6, 60), (7, 70)]
+    ring.extend([(8, 80), (8, 81), (9, 90)])
+    assert ring.rows() == [(7, 70), (8, 80), (8, 81), (9, 90)] and ring.nbytes == 2 * 8 * 4
+    print("✓ Ring keeps the newest rows in bounded memory")
+
+    def attack(pid, target, troops):
+        return {"playerId": pid, "action": {"targetId": target, "troopCount": troops}}
+
+    def play(mem, gid):
+        for turn in range(1, 11):
+            towers = [{"playerId": 2, "level": 1 + turn // 4}, {"playerId": 3, "level": 1}]
+            attacks = [attack(2, 1, 10 * turn), attack(3, 2, 5)] if turn > 1 else []
+            mem.record_turn(gid, turn, towers, attacks)
+            mem.record_diplomacy(gid, turn, [{"playerId": 3, "action": {"allyId": 1, "attackTargetId": 2}},
+                                             {"playerId": 2, "action": {"allyId": 3}}], 1)
+
+    backends = [strategy.GameMemory()]
+    d = tempfile.mkdtemp()
+    backends.append(SQLiteMemory(os.path.join(d, "kw_memory.db")))
+    for mem in backends:
+        play(mem, 42_000)
+        assert mem.attacks_on(42_000, 1, 9) == {2: 190}  # turns 9 and 10
+        assert mem.attacks_on(42_000, 2, 0) == {3: 45}
+        assert mem.avg_troops(42_000, 9) == {2: 95.0, 3: 5.0}
+        assert mem.levels_gained(42_000, 2, 5) == 1 and mem.levels_gained(42_000, 2, 0) == 2
+        assert mem.levels_gained(42_000, 3, 0) == 0 and mem.levels_gained(42_000, 9, 0) == 0
+        assert list(map(tuple, mem.proposals(42_000, 10))) == [(10, 3, 1, 2), (10, 2, 3, -1)]
+        print(f"✓ {type(mem).__name__}: windowed attacks, averages, levels and proposals")
+
+    live = backends[0]
+    before = live.stats()["bytes"]
+    for turn in range(11, 400):
+        live.record_turn(42_000, turn, [], [attack(2, 1, 1)])
+    grown = live.stats()["bytes"] - before
+    play(live, 42_001)
+    assert grown <= 8 * 4 * ROWS
+    print(f"✓ A game's history stops growing at the ring size (+{grown} bytes over 389 turns)")
+
+    path = os.path.join(d, "memory.snap")
+    snapshot.Snapshotter(live, path).save(wait=True)
+    restored = strategy.GameMemory()
+    snapshot.Snapshotter(restored, path).restore()
+    assert restored.stats() == live.stats()
+    assert restored.attacks_on(42_001, 1, 9) == {2: 190} and restored.levels_gained(42_001, 2, 0) == 2
+    assert restored.attacks_on(42_000, 1, 390) == live.attacks_on(42_000, 1, 390) == {2: 10}
+    print("✓ History survives a snapshot round trip")
+
+    strategy.negotiate(42_002, 5, {"playerId": 1, "hp": 100, "armor": 0, "resources": 20, "level": 1},
+                       [{"playerId": 2, "hp": 90, "armor": 0, "level": 2},
+                        {"playerId": 3, "hp": 90, "armor": 0, "level": 1}],
+                       [attack(2, 1, 12)])
+    strategy.combat(42_002, 5, {"playerId": 1, "hp": 100, "armor": 0, "resources": 20, "level": 1},
+                    [{"playerId": 2, "hp": 90, "armor": 0, "level": 2},
+                     {"playerId": 3, "hp": 90, "armor": 0, "level": 1}], [], [attack(2, 1, 12)])
+    assert strategy.memory.attacks_on(42_002, 1, 0) == {2: 12}
+    print("✓ Negotiate and combat record each turn's attacks once")
+    print("✓ Turn history test passed")
+
+
+def test_startup_warmup():
+    """Test the startup warm-up: synthetic games run, nothing leaks, /healthz gates on it."""
+    print("\n=== TEST: Startup Warm-up ===")
+
+    import asyncio
+    import metrics
+    import server
+    import warmup
+    from router import game_slot
+
+    assert warmup.game_ids(0) == [warmup.GID]
+    gids = warmup.game_ids(3)
+    assert sorted(game_slot(gid, 3) for gid in gids) == [0, 1, 2] and all(gid < 0 for gid in gids)
+    print(f"✓ One synthetic game per strategy worker: {gids}")
+
+    class NoRecording:
+        def record(self, *args):
+            raise AssertionError("warm-up traffic was recorded")
+
+    saved = server.ready, server.recorder
+    server.ready, server.recorder = False, NoRecording()
+    try:
+        assert asyncio.run(server.healthz()).status_code == 503
+        asyncio.run(server.warm_up())
+        assert server.ready and asyncio.run(server.healthz()) == {"status": "OK"}
+        assert isinstance(server.recorder, NoRecording)
+    finally:
+        server.ready, server.recorder = saved
+    print("✓ /healthz answers 503 until the warm-up has run")
+
+    assert not any(k.startswith(("requests:", "endpoint:", "phase:")) for k in
+                   [*metrics.counters, *metrics.timings]), "warm-up metrics were reset"
+    assert all(gid >= 0 for gid, _ in strategy.memory.games()), "synthetic games were finished"
+    import contextlib
+    import io
+
+    finished = strategy.memory.evictions["finished"]
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        stats = asyncio.run(warmup.run(server.app, [warmup.GID - 50], rounds=2))
+    assert stats["requests"] == 6 and stats["errors"] == 0, stats
+    assert "[KW-BOT]" not in out.getvalue(), "warm-up requests are not the game system's"
+    assert not any(k.startswith(("requests:", "endpoint:")) for k in [*metrics.counters, *metrics.timings])
+    assert strategy.memory.evictions["finished"] == finished
+    print(f"✓ Synthetic games leave no metrics or game memory behind ({stats['ms']} ms for {stats['requests']} requests)")
+
+    import tempfile
+    from profiles import ProfileStore
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ProfileStore(f"{tmp}/profiles.bin", capacity=64)
+        counted = {k: v for k, v in metrics.counters.items() if k.startswith("variant:")}
+        saved_profiles, strategy.profiles = strategy.profiles, store
+        try:
+            asyncio.run(warmup.run(server.app, [warmup.GID - 100]))  # -1 is finished already
+        finally:
+            strategy.profiles = saved_profiles
+        assert store.stats()["players"] == 0 and all(store.profile(pid) is None for pid in range(2, 5))
+        assert {k: v for k, v in metrics.counters.items() if k.startswith("variant:")} == counted
+        store.close()
+    print("✓ Synthetic games leave opponent profiles and variant outcomes untouched")
+    print("✓ Startup warm-up test passed")
+
+
+def test_threat_tracker():
+    """Test the observed-threat EWMA: incremental top-2, deaths, snapshots, sqlite."""
+    print("\n=== TEST: Observed Threat Tracker ===")
+
+    import dataclasses
+    import os
+    import tempfile
+    import snapshot
+    from memory_store import THREAT_DECAY, SQLiteMemory
+
+    hits = {(t, pid): (pid * 7 + t * 3) % 40 for t in range(1, 81) for pid in range(2, 8) if (pid + t) % 3}
+
+    def expected(turn, alive):
+        avg = {pid: sum((1 - THREAT_DECAY) * THREAT_DECAY ** (turn - t) * x
+                        for (t, p), x in hits.items() if p == pid and t <= turn) for pid in alive}
+        return sum(sorted(avg.values(), reverse=True)[:2])
+
+    def attacks(turn):
+        return [{"playerId": pid, "action": {"targetId": 1, "troopCount": x}}
+                for (t, pid), x in hits.items() if t == turn]
+
+    with tempfile.TemporaryDirectory() as d:
+        mem, db = strategy.GameMemory(), SQLiteMemory(os.path.join(d, "kw.db"))
+        alive = set(range(2, 8))
+        for turn in range(1, 81):
+            if turn == 50:
+                alive -= {max(alive, key=lambda p: expected(49, [p]))}  # the heaviest attacker dies
+            for backend in (mem, db):
+                backend.record_intel(44_000, turn, 1, attacks(turn))
+                backend.record_turn(44_000, turn, [], attacks(turn))
+            want = expected(turn, alive)
+            assert abs(mem.threat(44_000, turn, 1, alive) - want) < 1e-6 * max(1.0, want), turn
+            assert abs(db.threat(44_000, turn, 1, alive) - want) < 1e-6 * max(1.0, want), turn
+        g = mem._g[44_000]
+        assert g.hit_base > 32 and len(g.top) == 2 and set(g.top) <= alive
+        print(f"✓ Incremental top-2 matches a full EWMA recompute over 80 turns (decay {THREAT_DECAY})")
+        print("✓ A dead attacker leaves the top two; sqlite computes the same estimate")
+
+        path = os.path.join(d, "memory.snap")
+        snapshot.Snapshotter(mem, path).save(wait=True)
+        restored = strategy.GameMemory()
+        snapshot.Snapshotter(restored, path).restore()
+        assert abs(restored.threat(44_000, 80, 1, alive) - expected(80, alive)) < 1e-6 * expected(80, alive)
+        print("✓ Threat estimates survive a snapshot restore")
+
+    me = {"playerId": 1, "hp": 60, "armor": 0, "resources": 200, "level": 2}
+    enemies = [{"playerId": i, "hp": 100, "armor": 0, "level": 1} for i in range(2, 5)]
+    heavy = [{"playerId": 2, "action": {"targetId": 1, "troopCount": 150}}]
+    saved = strategy.configs._active
+    try:
+        strategy.configs._active = saved._replace(default=dataclasses.replace(saved.default, observed_threat=1.0))
+        plan, state = strategy.plan_combat(44_001, 10, me, enemies, [], heavy, with_state=True)
+    finally:
+        strategy.configs._active = saved
+    base, base_state = strategy.plan_combat(44_002, 10, me, enemies, [], heavy, with_state=True)
+    assert state.incoming > base_state.incoming
+    assert sum(a.get("amount", 0) for a in plan if a["type"] == "armor") > \
+        sum(a.get("amount", 0) for a in base if a["type"] == "armor")
+    print(f"✓ With observed_threat on, a heavy attacker raises predicted damage "
+          f"({base_state.incoming:.0f} -> {state.incoming:.0f}); off by default")
+    for gid in (44_001, 44_002):
+        strategy.memory.finish_game(gid)
+    print("✓ Observed threat tracker test passed")
+
+
 def run_all_tests():
     """Run all test cases."""
     print("\n" + "="*60)
@@ -241,6 +1272,30 @@ def run_all_tests():
         test_diplomacy()
         test_fatigue_phase()
         test_runaway_detection()
+        test_sqlite_memory_shared()
+        test_affinity_router()
+        test_memory_eviction()
+        test_compact_game_state()
+        test_latency_histograms()
+        test_buffered_logging()
+        test_anytime_search()
+        test_simulator()
+        test_batch_matches_scalar()
+        test_economy_tables()
+        test_record_replay()
+        test_opponent_profiles()
+        test_threat_hostility_index()
+        test_large_lobby()
+        test_lean_serving()
+        test_strategy_config()
+        test_offload_executor()
+        test_rollout_planner()
+        test_memory_snapshot()
+        test_decision_cache()
+        test_idempotent_ingestion()
+        test_turn_history()
+        test_startup_warmup()
+        test_threat_tracker()
         
         print("\n" + "="*60)
         print("✓ ALL TESTS PASSED")
@@ -0,0 +1,105 @@
+"""
+Startup warm-up: play synthetic games through the app before traffic.
+
+A fresh process answers its first /negotiate and /combat several times
+slower than later ones: FastAPI inspects each endpoint on its first call,
+pydantic-core and the strategy run cold, the rollout planner imports numpy
+on first use, and router workers are still importing when the first game
+is routed to them. The startup hook calls `run` to pay for all of that
+before /healthz reports OK: ROUNDS negotiate + combat turns of a synthetic
+game per strategy worker, sent through the full ASGI stack in-process (no
+socket), then a final turn that ends the game so its memory is freed.
+
+Synthetic games use negative gameIds, which the game server never sends.
+The server sends them without the [KW-BOT] marker and keeps them out of
+/metrics and the traffic recorder; the strategy keeps them out of opponent
+profiles, variant outcomes and the memory's eviction counts.
+
+Env:
+    KW_WARMUP=1          warm up in the startup hook (0 = off)
+    KW_WARMUP_ROUNDS=3   turns played per synthetic game
+"""
+
+import json
+import os
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+ENABLED = os.getenv("KW_WARMUP", "1") != "0"
+ROUNDS = max(1, int(os.getenv("KW_WARMUP_ROUNDS", "3")))
+GID = -1  # first synthetic gameId; more count down from here
+
+
+def game_ids(workers: int = 0) -> List[int]:
+    """One synthetic gameId per strategy worker (just GID when inline)."""
+    if workers <= 1:
+        return [GID]
+    from router import game_slot
+
+    gids: Dict[int, int] = {}
+    gid = GID
+    while len(gids) < workers:
+        gids.setdefault(game_slot(gid, workers), gid)
+        gid -= 1
+    return sorted(gids.values(), reverse=True)
+
+
+def payloads(gid: int, turn: int, players: int = 4, over: bool = False) -> Tuple[bytes, bytes]:
+    """Negotiate and combat bodies of a synthetic turn (`over`: every enemy is dead)."""
+    ids = range(2, players + 1)
+    towers = [{"playerId": i, "hp": 0 if over else 100 - 7 * i, "armor": i,
+               "level": 1 + (turn + i) % 3} for i in ids]
+    me = {"playerId": 1, "hp": 90, "armor": 5, "resources": 40 + 10 * turn, "level": 2}
+    attacks = [{"playerId": i, "action": {"targetId": 1 if i % 2 else i - 1, "troopCount": 5 * i}}
+               for i in ids]
+    diplomacy = [{"playerId": i, "action": {"allyId": 1, "attackTargetId": players}} for i in ids]
+    negotiate = {"gameId": gid, "turn": turn, "playerTower": me, "enemyTowers": towers,
+                 "combatActions": attacks}
+    combat = {"gameId": gid, "turn": turn, "playerTower": me, "enemyTowers": towers,
+              "diplomacy": diplomacy, "previousAttacks": attacks}
+    return json.dumps(negotiate).encode(), json.dumps(combat).encode()
+
+
+async def request(app, path: str, body: bytes, synthetic: bool = False) -> Tuple[int, bytes]:
+    """POST `body` to `path` through the ASGI app in-process.
+
+    `synthetic` marks a warm-up request (scope["kw_synthetic"]): the
+    middleware skips the log marker and endpoint metrics for it.
+    """
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    out = {"status": 500, "body": b""}
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            out["status"] = message["status"]
+        else:
+            out["body"] += message.get("body", b"")
+
+    await app({"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+               "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(),
+               "query_string": b"", "root_path": "",
+               "headers": [(b"content-type", b"application/json")],
+               "client": ("warmup", 0), "server": ("warmup", 0), "kw_synthetic": synthetic},
+              receive, send)
+    return out["status"], out["body"]
+
+
+async def run(app, gids: List[int], rounds: int = ROUNDS) -> Dict[str, float]:
+    """Play `rounds` turns plus a game-ending turn of each synthetic game."""
+    t0 = perf_counter()
+    first = None
+    requests = errors = 0
+    for gid in gids:
+        for turn in range(1, rounds + 2):
+            for path, body in zip(("/negotiate", "/combat"), payloads(gid, turn, over=turn > rounds)):
+                start = perf_counter()
+                status, _ = await request(app, path, body, synthetic=True)
+                if first is None:
+                    first = perf_counter() - start
+                requests += 1
+                errors += status != 200
+    return {"games": len(gids), "requests": requests, "errors": errors,
+            "first_ms": round(first * 1e3, 2), "ms": round((perf_counter() - t0) * 1e3, 1)}